@@ -4,6 +4,7 @@ from fastapi.security import OAuth2PasswordBearer, HTTPBearer, HTTPAuthorization
 import jwt
 from app.core.config import settings
 from app.schemas.token import TokenData
+from app.core.revocation import revocations
 from app.crud import crud_user
 from app.models.model import User
 
@@ -11,16 +12,16 @@ oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/v1/login", auto_error=False)
 bearer_scheme = HTTPBearer(auto_error=False)
 
 
-# swagger auth
-def get_current_user(
-    token_from_oauth: Optional[str] = Depends(oauth2_scheme),
-    creds_from_bearer: Optional[HTTPAuthorizationCredentials] = Depends(bearer_scheme)
-) -> User:
+def get_user_from_token(token: Optional[str]) -> User:
     """
-    1. OAuth2 Password Flow (username/password)
-    2. jwt
-    
-    Raises HTTPException if the token is invalid or the user doesn't exist.
+    Resolves a JWT access token to its user.
+
+    Tokens carrying the user id and superuser claims are trusted without a
+    database lookup: the returned User is a principal built from the claims
+    (id, username, is_superuser only), checked against the revocation list.
+    Older tokens with only a username fall back to loading the user.
+
+    Raises HTTPException if the token is invalid, revoked or the user doesn't exist.
     """
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -28,12 +29,6 @@ def get_current_user(
         headers={"WWW-Authenticate": "Bearer"},
     )
 
-    token: Optional[str] = None
-    if token_from_oauth:
-        token = token_from_oauth
-    elif creds_from_bearer:
-        token = creds_from_bearer.credentials
-
     if token is None:
         raise credentials_exception
 
@@ -42,15 +37,44 @@ def get_current_user(
         username: str = payload.get("sub")
         if username is None:
             raise credentials_exception
-        token_data = TokenData(username=username)
-    except jwt.PyJWTError:
+        token_data = TokenData(
+            username=username,
+            user_id=payload.get("uid"),
+            is_superuser=payload.get("su", False),
+            issued_at=payload.get("iat"),
+        )
+    except (jwt.PyJWTError, ValueError):
         raise credentials_exception
-    
+
+    if token_data.user_id is not None:
+        if revocations.is_revoked(token_data.user_id, token_data.issued_at):
+            raise credentials_exception
+        return User(id=token_data.user_id, username=token_data.username, is_superuser=token_data.is_superuser)
+
     user = crud_user.get_user_by_username(username=token_data.username)
     if user is None:
         raise credentials_exception
     return user
 
+# swagger auth
+def get_current_user(
+    token_from_oauth: Optional[str] = Depends(oauth2_scheme),
+    creds_from_bearer: Optional[HTTPAuthorizationCredentials] = Depends(bearer_scheme)
+) -> User:
+    """
+    1. OAuth2 Password Flow (username/password)
+    2. jwt
+    
+    Raises HTTPException if the token is invalid or the user doesn't exist.
+    """
+    token: Optional[str] = None
+    if token_from_oauth:
+        token = token_from_oauth
+    elif creds_from_bearer:
+        token = creds_from_bearer.credentials
+
+    return get_user_from_token(token)
+
 def get_current_superuser(current_user: User = Depends(get_current_user)) -> User:
     if not current_user.is_superuser:
         raise HTTPException(
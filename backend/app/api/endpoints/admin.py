@@ -1,26 +1,37 @@
-from typing import List
+from datetime import datetime, timedelta
+from typing import List, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, status
 
-from app.crud import crud_user, crud_group, crud_poll
+from app.crud import crud_user, crud_group, crud_poll, crud_rating, catalog_import, poll_expiry, recommender
 from app import models, schemas
 from app.schemas.poll import Poll, PollCreate
 from app.schemas.group import GroupWithMembers
 from app.api import deps
+from app.core.cache import cache_stats
+from app.crud.tmdb_util import tmdb_client
+from app.db.database import pool_stats
+from app.db import migrations
 
 router = APIRouter()
 
-@router.get("/users/", response_model=List[schemas.User])
+@router.get("/users/", response_model=schemas.Page[schemas.User])
 def read_users(
-    skip: int = 0,
-    limit: int = 100,
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=500),
+    include_total: bool = False,
     current_user: models.User = Depends(deps.get_current_superuser)
 ):
     """
-    Retrieve all users.
+    Retrieve all users, one page at a time in id order.
+    Pass the returned next_cursor as `cursor` to fetch the next page.
+    include_total adds a cheap planner estimate of the total count.
     """
-    users = crud_user.get_users(skip=skip, limit=limit)
-    return users
+    try:
+        page = crud_user.get_users(cursor=cursor, limit=limit, estimate_total=include_total)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return page._asdict()
 
 @router.get("/users/{user_id}", response_model=schemas.User)
 def read_user(
@@ -52,17 +63,39 @@ def delete_user(
     deleted_user = crud_user.delete_user(user_id=user_id)
     return deleted_user
 
-@router.get("/groups/", response_model=List[schemas.Group])
+@router.put("/users/{user_id}/superuser", response_model=schemas.User)
+def update_user_superuser(
+    user_id: int,
+    is_superuser: bool,
+    current_user: models.User = Depends(deps.get_current_superuser)
+):
+    """
+    Grant or remove superuser privileges. The user's existing tokens are revoked.
+    """
+    if user_id == current_user.id:
+        raise HTTPException(status_code=400, detail="Admins cannot change their own privileges")
+    user = crud_user.set_superuser(user_id=user_id, is_superuser=is_superuser)
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    return user
+
+@router.get("/groups/", response_model=schemas.Page[schemas.Group])
 def read_groups(
-    skip: int = 0,
-    limit: int = 100,
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=500),
+    include_total: bool = False,
     current_user: models.User = Depends(deps.get_current_superuser)
 ):
     """
-    Retrieve all groups.
+    Retrieve all groups, one page at a time in id order.
+    Pass the returned next_cursor as `cursor` to fetch the next page.
+    include_total adds a cheap planner estimate of the total count.
     """
-    groups = crud_group.get_groups(skip=skip, limit=limit)
-    return groups
+    try:
+        page = crud_group.get_groups(cursor=cursor, limit=limit, estimate_total=include_total)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return page._asdict()
 
 @router.get("/groups/{group_id}", response_model=GroupWithMembers)
 def read_group(
@@ -97,17 +130,23 @@ def delete_group(
 
 # --- Poll Admin Endpoints ---
 
-@router.get("/polls/", response_model=List[Poll])
+@router.get("/polls/", response_model=schemas.Page[Poll])
 def read_polls(
-    skip: int = 0,
-    limit: int = 100,
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=500),
+    include_total: bool = False,
     current_user: models.User = Depends(deps.get_current_superuser)
 ):
     """
-    Retrieve all polls.
+    Retrieve all polls, one page at a time in id order.
+    Pass the returned next_cursor as `cursor` to fetch the next page.
+    include_total adds a cheap planner estimate of the total count.
     """
-    polls = crud_poll.get_polls(skip=skip, limit=limit)
-    return polls
+    try:
+        page = crud_poll.get_polls(cursor=cursor, limit=limit, estimate_total=include_total)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return page._asdict()
 
 @router.get("/polls/{poll_id}", response_model=Poll)
 def read_poll(
@@ -138,5 +177,171 @@ def create_poll(
         raise HTTPException(status_code=404, detail="Group not found")
     if not creator:
         raise HTTPException(status_code=404, detail="Creator not found")
-    poll = crud_poll.create_poll(poll_in=poll_in, group=group, creator=creator)
+    try:
+        poll = crud_poll.create_poll(poll_in=poll_in, group=group, creator=creator)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     return poll
+
+@router.get("/polls/vote-counters/check", response_model=List[dict])
+def check_vote_counters(
+    current_user: models.User = Depends(deps.get_current_superuser)
+):
+    """
+    List polls and poll options whose vote counters disagree with the vote table.
+    """
+    return crud_poll.verify_vote_counters()
+
+@router.post("/polls/vote-counters/rebuild", response_model=List[dict])
+def rebuild_vote_counters(
+    current_user: models.User = Depends(deps.get_current_superuser)
+):
+    """
+    Recompute all vote counters from the vote table. Returns the corrected entries.
+    """
+    return crud_poll.rebuild_vote_counters()
+
+@router.post("/polls/expired/resolve", response_model=List[dict])
+def resolve_expired_polls(
+    current_user: models.User = Depends(deps.get_current_superuser)
+):
+    """
+    Resolve every poll whose expiry has passed now, instead of waiting for the scheduler.
+    Returns the resolved polls with their winners.
+    """
+    return poll_expiry.resolve_due_polls()
+
+@router.post("/polls/snapshots/backfill", response_model=dict)
+def backfill_result_snapshots(
+    current_user: models.User = Depends(deps.get_current_superuser)
+):
+    """
+    Write the result snapshots missing from polls resolved before snapshots existed.
+    """
+    return {"written": poll_expiry.backfill_result_snapshots()}
+
+@router.post("/polls/votes/archive", response_model=dict)
+def archive_votes(
+    older_than_days: float = Query(30.0, ge=0),
+    current_user: models.User = Depends(deps.get_current_superuser)
+):
+    """
+    Move the votes of polls resolved more than older_than_days ago to the vote archive.
+    Their results stay available from the result snapshots.
+    """
+    cutoff = datetime.now() - timedelta(days=older_than_days)
+    return {"archived": poll_expiry.archive_votes(resolved_before=cutoff)}
+
+@router.get("/polls/expired/scheduler", response_model=dict)
+def read_expiry_scheduler(
+    current_user: models.User = Depends(deps.get_current_superuser)
+):
+    """
+    Number of expiries this worker's scheduler is waiting on, the next one, and polls resolved so far.
+    """
+    return poll_expiry.poll_expiry_scheduler.stats()
+
+@router.get("/ratings/aggregates/check", response_model=List[dict])
+def check_rating_aggregates(
+    current_user: models.User = Depends(deps.get_current_superuser)
+):
+    """
+    List watched movies and group members whose rating aggregates disagree with the rating table.
+    """
+    return crud_rating.verify_rating_aggregates()
+
+@router.post("/ratings/aggregates/rebuild", response_model=List[dict])
+def rebuild_rating_aggregates(
+    current_user: models.User = Depends(deps.get_current_superuser)
+):
+    """
+    Recompute all rating aggregates from the rating table. Returns the corrected entries.
+    """
+    return crud_rating.rebuild_rating_aggregates()
+
+@router.post("/recommender/train", response_model=dict)
+def train_recommender(
+    full: bool = False,
+    current_user: models.User = Depends(deps.get_current_superuser)
+):
+    """
+    Run a recommender training pass now, instead of waiting for the background job.
+    full retrains from scratch; otherwise only ratings since the last pass are folded in.
+    """
+    return recommender.train(full=full)
+
+# --- Movie Catalog Admin Endpoints ---
+
+@router.post("/catalog/import", response_model=dict, status_code=status.HTTP_202_ACCEPTED)
+def start_catalog_import(
+    import_in: schemas.CatalogImportRequest,
+    current_user: models.User = Depends(deps.get_current_superuser)
+):
+    """
+    Starts importing a TMDb export file (JSON lines, optionally gzipped) from the
+    server's import directory into the movie catalog, in the background.
+    """
+    try:
+        return catalog_import.start_import_job(import_in.path, batch_size=import_in.batch_size)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+@router.get("/catalog/import/{job_id}", response_model=dict)
+def read_catalog_import(
+    job_id: str,
+    current_user: models.User = Depends(deps.get_current_superuser)
+):
+    """
+    Progress of a catalog import: rows read, rows upserted and rows per second.
+    """
+    job = catalog_import.get_import_job(job_id)
+    if not job:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Import job not found")
+    return job
+
+# --- Database Admin Endpoints ---
+
+@router.get("/db/pool", response_model=dict)
+def read_pool_stats(
+    current_user: models.User = Depends(deps.get_current_superuser)
+):
+    """
+    Connection pool hit, miss and wait counters.
+    """
+    return pool_stats()
+
+@router.get("/db/migrations", response_model=List[dict])
+def read_migrations(
+    current_user: models.User = Depends(deps.get_current_superuser)
+):
+    """
+    Schema migrations in order, with the time each was applied or null while pending.
+    """
+    return migrations.migration_status()
+
+@router.get("/db/plans", response_model=List[dict])
+def check_query_plans(
+    current_user: models.User = Depends(deps.get_current_superuser)
+):
+    """
+    Indexes used by the main lookups, and any that fall back to a sequential scan.
+    """
+    return migrations.check_query_plans()
+
+@router.get("/caches", response_model=dict)
+def read_cache_stats(
+    current_user: models.User = Depends(deps.get_current_superuser)
+):
+    """
+    Size, hit and miss statistics of the in-process caches.
+    """
+    return cache_stats()
+
+@router.get("/tmdb/stats", response_model=dict)
+def read_tmdb_stats(
+    current_user: models.User = Depends(deps.get_current_superuser)
+):
+    """
+    TMDb client cache hit ratio, coalesced requests and upstream latency.
+    """
+    return tmdb_client.stats()
@@ -1,8 +1,10 @@
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException, status
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+import orjson
 from app import crud, models, schemas
-from app.crud import crud_group
+from app.crud import crud_group, crud_rating, group_stats
 from app.api import deps
+from app.api.etag import versioned_response
 
 router = APIRouter()
 
@@ -18,12 +20,16 @@ def create_new_group(
 
 @router.get("/", response_model=List[schemas.Group])
 def read_user_groups(
+    request: Request,
     current_user: models.User = Depends(deps.get_current_user)
 ):
     """
     List all groups the current user is a member of.
+    Supports If-None-Match; the ETag changes when the user joins or loses a group.
     """
-    return crud_group.get_groups_for_user(user=current_user)
+    version = crud_group.get_groups_version(user_id=current_user.id)
+    return versioned_response(request, ("user_groups", current_user.id), version,
+                              lambda: orjson.dumps(crud_group.get_groups_for_user(user=current_user)))
 
 @router.post("/{group_id}/join", response_model=schemas.Group)
 def join_group(
@@ -45,11 +51,13 @@ def join_group(
 
 @router.get("/{group_id}", response_model=schemas.Group)
 def read_group_details(
+    request: Request,
     group_id: int,
     current_user: models.User = Depends(deps.get_current_user)
 ):
     """
     Get details of a specific group, only if the user is a member.
+    Supports If-None-Match.
     """
     group = crud_group.get_group_by_id(group_id=group_id)
     if not group:
@@ -58,4 +66,111 @@ def read_group_details(
     if not crud_group.is_user_member_of_group(user=current_user, group=group):
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="User is not a member of this group")
 
-    return group 
\ No newline at end of file
+    return versioned_response(request, ("group", group.id), group.version,
+                              lambda: schemas.Group.model_validate(group).model_dump_json().encode())
+
+@router.get("/{group_id}/stats", response_model=schemas.GroupStats)
+def read_group_stats(
+    group_id: int,
+    current_user: models.User = Depends(deps.get_current_user)
+):
+    """
+    Get stats over the group's watched movies and ratings, only if the user is a member.
+    """
+    group = crud_group.get_group_by_id(group_id=group_id)
+    if not group:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Group not found")
+
+    if not crud_group.is_user_member_of_group(user=current_user, group=group):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="User is not a member of this group")
+
+    return group_stats.get_group_stats(group_id=group.id)
+
+@router.get("/{group_id}/similarity", response_model=schemas.MemberSimilarity)
+def read_member_similarity(
+    group_id: int,
+    current_user: models.User = Depends(deps.get_current_user)
+):
+    """
+    Get how similar the members' tastes are, from their ratings of the movies they both rated.
+    Only if the user is a member.
+    """
+    group = crud_group.get_group_by_id(group_id=group_id)
+    if not group:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Group not found")
+
+    if not crud_group.is_user_member_of_group(user=current_user, group=group):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="User is not a member of this group")
+
+    return group_stats.get_member_similarity(group=group)
+
+def _get_group_watched_movie(group_id: int, watched_movie_id: int, user: models.User) -> models.WatchedMovie:
+    group = crud_group.get_group_by_id(group_id=group_id)
+    if not group:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Group not found")
+
+    if not crud_group.is_user_member_of_group(user=user, group=group):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="User is not a member of this group")
+
+    watched = crud_rating.get_watched_movie_by_id(watched_movie_id=watched_movie_id)
+    if not watched or watched.group_id != group.id:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Watched movie not found in this group")
+    return watched
+
+@router.get("/{group_id}/watched", response_model=schemas.Page[schemas.WatchedMovie])
+def read_watch_history(
+    group_id: int,
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=500),
+    current_user: models.User = Depends(deps.get_current_user)
+):
+    """
+    List the group's watched movies with their mean rating and standard deviation, one page at a time.
+    User must be a member of the group.
+    """
+    group = crud_group.get_group_by_id(group_id=group_id)
+    if not group:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Group not found")
+
+    if not crud_group.is_user_member_of_group(user=current_user, group=group):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="User is not a member of this group")
+
+    try:
+        page = crud_rating.get_watched_movies_for_group(group=group, cursor=cursor, limit=limit)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    return page._asdict()
+
+@router.put("/{group_id}/watched/{watched_movie_id}/rating", response_model=schemas.MovieRating)
+def rate_watched_movie(
+    group_id: int,
+    watched_movie_id: int,
+    rating_in: schemas.MovieRatingCreate,
+    current_user: models.User = Depends(deps.get_current_user)
+):
+    """
+    Rate a movie the group has watched, or change the current user's rating of it.
+    """
+    watched = _get_group_watched_movie(group_id, watched_movie_id, current_user)
+    try:
+        return crud_rating.rate_watched_movie(watched=watched, rater=current_user, rating_value=rating_in.rating_value)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+
+@router.delete("/{group_id}/watched/{watched_movie_id}/rating", response_model=schemas.MovieRating)
+def delete_watched_movie_rating(
+    group_id: int,
+    watched_movie_id: int,
+    current_user: models.User = Depends(deps.get_current_user)
+):
+    """
+    Remove the current user's rating of a movie the group has watched.
+    """
+    watched = _get_group_watched_movie(group_id, watched_movie_id, current_user)
+    try:
+        rating = crud_rating.delete_rating(watched=watched, rater=current_user)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+    if not rating:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Rating not found")
+    return rating
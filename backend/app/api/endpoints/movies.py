@@ -1,49 +1,63 @@
-from typing import Any, List
-import httpx
-from fastapi import APIRouter, Depends, HTTPException, status
+from typing import Any, List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.concurrency import run_in_threadpool
 from app import crud, models, schemas
 from app.api import deps
-from app.crud import tmdb_util
+from app.crud import crud_movie, movie_search, tmdb_util
 
 
 
 router = APIRouter()
 
 
-# for now it takes a int 
-#  but in the futur will be a query string -> tmdb resutl
 @router.get("/tmdb/search", response_model=List[Any])
-async def search_tmdb_movies(query: int, current_user: models.User = Depends(deps.get_current_user)):
+async def search_tmdb_movies(
+    query: str,
+    page: int = Query(1, ge=1, le=500),
+    current_user: models.User = Depends(deps.get_current_user)
+):
     """
     Proxies a search request to the TMDb API.
+    Responses are cached and identical concurrent searches share one upstream request.
     """
-    if not query:
+    if not query.strip():
         return []
 
-    # for now bcause i cba setting up tmdb api
-    #  dummy data for movies
-    
-    
-    # ok this is hella chopped but whatever
-    if not tmdb_util.check_movie_exists(query):
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Movie not found")
-    
-    
-    return tmdb_util.dummy_movies[query]    
-    
-    # params = {
-    #     "api_key": settings.TMDB_API_KEY,
-    #     "query": query,
-    # }
-    # async with httpx.AsyncClient() as client:
-    #     try:
-    #         response = await client.get(f"{settings.TMDB_API_URL}/search/movie", params=params)
-    #         response.raise_for_status()
-    #         return response.json().get("results", [])
-    #     except httpx.HTTPStatusError as e:
-    #         raise HTTPException(status_code=e.response.status_code, detail="Error fetching from TMDb API")
-    #     except httpx.RequestError:
-    #         raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="TMDb API is unavailable")
+    try:
+        return await tmdb_util.tmdb_client.search_movies(query, page=page)
+    except tmdb_util.TMDbError as e:
+        raise HTTPException(status_code=e.status_code, detail="Error fetching from TMDb API")
+    except tmdb_util.TMDbUnavailable:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="TMDb API is unavailable")
+
+
+@router.get("/search", response_model=schemas.MovieSearchResults)
+async def search_movies(
+    query: str,
+    year: Optional[int] = None,
+    limit: int = Query(20, ge=1, le=100),
+    tmdb_fallback: bool = True,
+    current_user: models.User = Depends(deps.get_current_user)
+):
+    """
+    Searches the internal catalog by title prefix, optionally for one release year.
+    Only when nothing in the catalog matches is the search forwarded to TMDb.
+    """
+    movies = await run_in_threadpool(movie_search.search_movies, query, year=year, limit=limit)
+    if movies or not tmdb_fallback or not movie_search.search_terms(query):
+        return {"source": "catalog", "results": movies}
+
+    try:
+        results = await tmdb_util.tmdb_client.search_movies(query)
+    except tmdb_util.TMDbError as e:
+        raise HTTPException(status_code=e.status_code, detail="Error fetching from TMDb API")
+    except tmdb_util.TMDbUnavailable:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="TMDb API is unavailable")
+
+    hits = [tmdb_util.tmdb_to_movie(result) for result in results]
+    if year is not None:
+        hits = [hit for hit in hits if hit["release_year"] == year]
+    return {"source": "tmdb", "results": hits[:limit]}
 
 
 @router.post("/catalog", response_model=schemas.Movie, status_code=status.HTTP_201_CREATED)
@@ -52,12 +66,14 @@ def add_movie_to_catalog(movie_in: schemas.MovieCreate,current_user: models.User
     Adds a movie to the internal catalog if it doesn't already exist.
     Returns the internal movie record.
     """
-    # Check if movie with the same tmdb_id already exists
-    db_movie = crud.crud_movie.get_movie_by_tmdb_id(tmdb_id=movie_in.tmdb_id)
-    if db_movie:
-        # If it exists, we can just return it.
-        # Or, you could raise an error if you want to be strict.
-        return db_movie
-    
-    # If not, create it
-    return crud.crud_movie.create_movie(movie_in=movie_in) 
\ No newline at end of file
+    # Returns the existing record if the tmdb_id is already in the catalog.
+    return crud.crud_movie.create_movie(movie_in=movie_in)
+
+
+@router.post("/catalog/batch", response_model=List[schemas.Movie], status_code=status.HTTP_201_CREATED)
+def add_movies_to_catalog(batch_in: schemas.MovieBatchCreate, current_user: models.User = Depends(deps.get_current_user)):
+    """
+    Adds several movies to the internal catalog in one statement, e.g. a whole page of search results.
+    Returns the internal movie record for each input, in order, whether it was new or already present.
+    """
+    return crud.crud_movie.create_movies(movies_in=batch_in.movies)
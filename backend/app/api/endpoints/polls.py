@@ -1,7 +1,16 @@
-from typing import List, Any
-from fastapi import APIRouter, Depends, HTTPException, status
+import asyncio
+import json
+from datetime import datetime
+from typing import List, Optional, Tuple
+import orjson
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, WebSocket, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from app import crud, models, schemas
 from app.api import deps
+from app.api.etag import versioned_response
+from app.core.live import poll_results_hub
+from app.db.database import connection_scope, release_connection
 
 router = APIRouter()
 
@@ -22,21 +31,49 @@ def create_poll_in_group(
     if not crud.crud_group.is_user_member_of_group(user=current_user, group=group):
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="User is not a member of this group")
 
-    # Verify all movie_ids exist in our catalog
-    for movie_id in poll_in.movie_ids:
-        if not crud.crud_movie.Movie.get_or_none(id=movie_id):
-            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Movie with id {movie_id} not found in catalog.")
+    try:
+        return crud.crud_poll.create_poll(poll_in=poll_in, group=group, creator=current_user)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+
+@router.post("/groups/{group_id}/polls/batch", response_model=List[schemas.Poll], status_code=status.HTTP_201_CREATED)
+def create_polls_in_group(
+    group_id: int,
+    batch_in: schemas.PollBatchCreate,
+    current_user: models.User = Depends(deps.get_current_user)
+):
+    """
+    Create several polls within a group in one transaction.
+    Either all polls are created or, if any movie is missing from the catalog, none are.
+    User must be a member of the group.
+    """
+    group = crud.crud_group.get_group_by_id(group_id=group_id)
+    if not group:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Group not found")
 
-    return crud.crud_poll.create_poll(poll_in=poll_in, group=group, creator=current_user)
+    if not crud.crud_group.is_user_member_of_group(user=current_user, group=group):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="User is not a member of this group")
+
+    try:
+        return crud.crud_poll.create_polls(polls_in=batch_in.polls, group=group, creator=current_user)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
 
 
-@router.get("/groups/{group_id}/polls", response_model=List[schemas.Poll])
+@router.get("/groups/{group_id}/polls", response_model=schemas.Page[schemas.PollWithCounts])
 def list_active_polls_in_group(
+    request: Request,
     group_id: int,
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=500),
+    include_total: bool = False,
     current_user: models.User = Depends(deps.get_current_user)
 ):
     """
-    List active polls for a group.
+    List active polls for a group, including current vote counts, one page at a time.
+    Pass the returned next_cursor as `cursor` to fetch the next page.
+    Supports If-None-Match; the ETag changes with any poll or vote in the group.
     User must be a member of the group.
     """
     group = crud.crud_group.get_group_by_id(group_id=group_id)
@@ -45,30 +82,46 @@ def list_active_polls_in_group(
 
     if not crud.crud_group.is_user_member_of_group(user=current_user, group=group):
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="User is not a member of this group")
-        
-    return crud.crud_poll.get_active_polls_for_group(group=group)
+
+    def render() -> bytes:
+        page = crud.crud_poll.get_active_polls_for_group(
+            group=group, cursor=cursor, limit=limit, estimate_total=include_total
+        )
+        return orjson.dumps(page._asdict())
+
+    try:
+        return versioned_response(request, ("group_polls", group.id, cursor, limit, include_total), group.version, render)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
 
 
-@router.get("/{poll_id}", response_model=Any) # Using Any for custom dict response
+@router.get("/{poll_id}", response_model=schemas.PollDetails)
 def get_poll_details(
+    request: Request,
     poll_id: int,
     current_user: models.User = Depends(deps.get_current_user)
 ):
     """
-    Get details of a specific poll, including options and current vote counts.
+    Get details of a specific poll, including options with movie titles and current vote counts.
+    Supports If-None-Match; the ETag changes with every vote. Resolved polls are
+    served from their frozen result snapshot, which clients may cache indefinitely.
     User must be a member of the poll's group.
     """
     poll = crud.crud_poll.get_poll_by_id(poll_id=poll_id)
     if not poll:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Poll not found")
 
-    if not crud.crud_group.is_user_member_of_group(user=current_user, group=poll.group):
+    if not crud.crud_group.is_user_member_of_group(user=current_user, group=poll.group_id):
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="User is not a member of this poll's group")
-    
-    poll_data = schemas.Poll.model_validate(poll).dict()
-    poll_data['vote_counts'] = crud.crud_poll.get_vote_counts_for_poll(poll=poll)
-    
-    return poll_data
+
+    if poll.result_snapshot is not None:
+        # Final results never change; private since access depends on membership.
+        return versioned_response(request, ("poll", poll.id), poll.version, poll.result_snapshot.encode,
+                                  cache_control="private, max-age=31536000, immutable")
+
+    # Serialized straight from tuples; see schemas.PollDetails for the shape.
+    return versioned_response(request, ("poll", poll.id), poll.version,
+                              lambda: orjson.dumps(crud.crud_poll.get_poll_details([poll])[poll.id]))
 
 
 @router.post("/{poll_id}/vote", response_model=schemas.Vote)
@@ -85,14 +138,139 @@ def vote_on_poll(
     if not poll:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Poll not found")
         
-    if not poll.is_active:
+    if not poll.is_active or (poll.expires_at is not None and poll.expires_at <= datetime.now()):
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="This poll is no longer active.")
 
-    if not crud.crud_group.is_user_member_of_group(user=current_user, group=poll.group):
+    if not crud.crud_group.is_user_member_of_group(user=current_user, group=poll.group_id):
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="User is not a member of this poll's group")
 
     try:
         vote = crud.crud_poll.cast_vote(vote_in=vote_in, poll=poll, voter=current_user)
-        return vote
     except ValueError as e:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e)) 
\ No newline at end of file
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    _publish_results(poll)
+    return vote
+
+
+@router.put("/{poll_id}/vote", response_model=schemas.Vote)
+def change_vote_on_poll(
+    poll_id: int,
+    vote_in: schemas.VoteCreate,
+    current_user: models.User = Depends(deps.get_current_user)
+):
+    """
+    Cast a vote, or move the current user's existing vote to another option.
+    User must be a member of the poll's group.
+    """
+    poll = crud.crud_poll.get_poll_by_id(poll_id=poll_id)
+    if not poll:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Poll not found")
+
+    if not poll.is_active or (poll.expires_at is not None and poll.expires_at <= datetime.now()):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="This poll is no longer active.")
+
+    if not crud.crud_group.is_user_member_of_group(user=current_user, group=poll.group_id):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="User is not a member of this poll's group")
+
+    try:
+        vote = crud.crud_poll.cast_vote(vote_in=vote_in, poll=poll, voter=current_user, change_vote=True)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    _publish_results(poll)
+    return vote
+
+
+def _publish_results(poll: models.Poll):
+    """
+    Pushes the poll's tallies to live subscribers, if there are any.
+    """
+    if poll_results_hub.has_subscribers(poll.id):
+        version, vote_counts = crud.crud_poll.get_versioned_vote_counts(poll.id)
+        poll_results_hub.publish(poll.id, version, vote_counts)
+
+
+def _live_results_snapshot(
+    poll_id: int, token: Optional[str] = None, user: Optional[models.User] = None
+) -> Tuple[int, dict]:
+    """
+    Authorizes a live results subscriber and returns the poll's version and its
+    current tallies. Runs in its own short connection scope so streams don't
+    hold a connection.
+    """
+    with connection_scope():
+        if user is None:
+            user = deps.get_user_from_token(token)
+        poll = crud.crud_poll.get_poll_by_id(poll_id=poll_id)
+        if not poll:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Poll not found")
+        if not crud.crud_group.is_user_member_of_group(user=user, group=poll.group_id):
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="User is not a member of this poll's group")
+        version, vote_counts = crud.crud_poll.get_versioned_vote_counts(poll_id)
+    return version, {"poll_id": poll_id, "vote_counts": vote_counts, "total_votes": sum(vote_counts.values())}
+
+
+@router.get("/{poll_id}/live")
+async def stream_poll_results(
+    poll_id: int,
+    current_user: models.User = Depends(deps.get_current_user)
+):
+    """
+    Server-sent events stream of a poll's results.
+    The first event is the full tally; later events carry only changed options.
+    User must be a member of the poll's group.
+    """
+    await run_in_threadpool(release_connection)
+    subscription = poll_results_hub.subscribe(poll_id)
+    try:
+        version, snapshot = await run_in_threadpool(_live_results_snapshot, poll_id, user=current_user)
+    except BaseException:
+        subscription.close()
+        raise
+    poll_results_hub.prime(poll_id, version, snapshot["vote_counts"])
+
+    async def events():
+        try:
+            message = snapshot
+            while True:
+                yield f"data: {json.dumps(message)}\n\n"
+                message = await subscription.get()
+        finally:
+            subscription.close()
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
+@router.websocket("/{poll_id}/live")
+async def poll_results_socket(websocket: WebSocket, poll_id: int, token: Optional[str] = None):
+    """
+    WebSocket stream of a poll's results, authenticated with a `token` query parameter.
+    The first message is the full tally; later messages carry only changed options.
+    """
+    subscription = poll_results_hub.subscribe(poll_id)
+    try:
+        try:
+            version, snapshot = await run_in_threadpool(_live_results_snapshot, poll_id, token)
+        except HTTPException as e:
+            await websocket.close(code=1008, reason=e.detail)
+            return
+        poll_results_hub.prime(poll_id, version, snapshot["vote_counts"])
+
+        await websocket.accept()
+        await websocket.send_json(snapshot)
+        receiver = asyncio.ensure_future(websocket.receive())
+        try:
+            while True:
+                getter = asyncio.ensure_future(subscription.get())
+                done, _ = await asyncio.wait({receiver, getter}, return_when=asyncio.FIRST_COMPLETED)
+                if getter in done:
+                    await websocket.send_json(getter.result())
+                else:
+                    getter.cancel()
+                if receiver in done:
+                    if receiver.result()["type"] == "websocket.disconnect":
+                        return
+                    receiver = asyncio.ensure_future(websocket.receive())
+        finally:
+            receiver.cancel()
+    finally:
+        subscription.close()
@@ -2,7 +2,7 @@ from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
 from app import schemas, crud, models
 from app.api import deps
-from app.core.security import create_access_token
+from app.core.security import create_access_token_for_user
 from app.api.deps import bearer_scheme
 
 router = APIRouter()
@@ -25,7 +25,7 @@ def register_user(user_in: schemas.UserCreate):
             detail="Email already registered",
         )
     user = crud.crud_user.create_user(user_in=user_in)
-    access_token = create_access_token(data={"sub": user.username})
+    access_token = create_access_token_for_user(user)
     return {"access_token": access_token, "token_type": "bearer"}
 
 
@@ -44,7 +44,7 @@ def login_with_username_or_email(username_or_email: str, password: str ):
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    access_token = create_access_token(data={"sub": user.username})
+    access_token = create_access_token_for_user(user)
     return {"access_token": access_token, "token_type": "bearer"}
 
 # OAuth2 Password Flow
@@ -62,7 +62,7 @@ def login_for_access_tokenOAuth(form_data: OAuth2PasswordRequestForm = Depends()
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    access_token = create_access_token(data={"sub": user.username})
+    access_token = create_access_token_for_user(user)
     return {"access_token": access_token, "token_type": "bearer"}
 
 @router.get("/users/me", response_model=schemas.User)
@@ -70,7 +70,10 @@ def read_users_me(current_user: models.User = Depends(deps.get_current_user)):
     """
     Get the current logged-in user's details.
     """
-    return current_user 
+    user = crud.crud_user.get_user(user_id=current_user.id)
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    return user
 
 @router.get("/users/{user_id}", response_model=schemas.User)
 def read_user_by_id(user_id: int, current_user: models.User = Depends(deps.get_current_user)):
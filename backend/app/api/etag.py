@@ -0,0 +1,72 @@
+import hashlib
+from typing import Callable, Hashable, Optional, Tuple
+
+from fastapi import Request, Response, status
+
+from app.core.cache import MISSING, SingleFlight, TTLCache
+from app.core.config import settings
+
+# (resource key, format revision, version stamp) -> serialized JSON body
+_response_cache = TTLCache(
+    "responses",
+    ttl=settings.RESPONSE_CACHE_TTL,
+    maxsize=settings.RESPONSE_CACHE_SIZE,
+)
+_renders = SingleFlight()
+
+# Revision of the body format of each kind of resource, keyed by the first
+# element of the resource key. Bump an entry whenever that body's shape or
+# encoding changes, so clients holding an ETag for the old format get the new
+# body instead of a 304.
+FORMAT_REVISIONS = {
+    "poll": 2,         # title and total_voters added to poll details
+    "group_polls": 2,  # serialized with orjson
+    "user_groups": 2,  # serialized with orjson
+    "group": 1,
+}
+
+
+def make_etag(key: Tuple[Hashable, ...], version: int) -> str:
+    """
+    Strong ETag of a resource at a version stamp. Derived from the key, the
+    format revision of its kind and the stamp alone, so it can be checked
+    before the body is built.
+    """
+    revision = FORMAT_REVISIONS[key[0]]
+    return '"%s"' % hashlib.sha1(repr((key, revision, version)).encode()).hexdigest()[:24]
+
+
+def _not_modified(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    # If-None-Match uses the weak comparison, so a W/ prefix is ignored.
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or any(tag.removeprefix("W/") == etag for tag in tags)
+
+
+def _render_once(cache_key: tuple, render: Callable[[], bytes]) -> bytes:
+    body = render()
+    _response_cache.set(cache_key, body)
+    return body
+
+
+def versioned_response(request: Request, key: Tuple[Hashable, ...], version: int, render: Callable[[], bytes],
+                       cache_control: str = "private, no-cache") -> Response:
+    """
+    Serves a JSON resource whose content only changes when its version stamp
+    is bumped. A matching If-None-Match is answered with 304 without calling
+    render; otherwise the body comes from the response cache, and concurrent
+    misses of one (key, version) share a single render call.
+    Exceptions raised by render propagate to the caller.
+    """
+    etag = make_etag(key, version)
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if _not_modified(request.headers.get("if-none-match"), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    cache_key = (key, FORMAT_REVISIONS[key[0]], version)
+    body = _response_cache.get(cache_key)
+    if body is MISSING:
+        body = _renders.do(cache_key, lambda: _render_once(cache_key, render))
+    return Response(content=body, media_type="application/json", headers=headers)
+
@@ -1,3 +1,5 @@
+from typing import Literal
+
 from pydantic import computed_field
 from pydantic_settings import BaseSettings
 
@@ -14,14 +16,74 @@ class Settings(BaseSettings):
     DB_USER: str
     DB_PASSWORD: str
 
+    # Connection pool
+    DB_POOL_ENABLED: bool = True
+    DB_POOL_MAX_CONNECTIONS: int = 20
+    DB_POOL_STALE_TIMEOUT: int = 300
+    DB_POOL_WAIT_TIMEOUT: float = 10.0
+    # Workers only check that the schema is current; migrations and the admin
+    # user are set up once with python -m app.db.bootstrap before they start.
+    # Enable to bootstrap from the worker instead, for single-process setups.
+    DB_BOOTSTRAP_ON_STARTUP: bool = False
+
     # Security
     SECRET_KEY: str
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
+    REVOCATION_REFRESH_SECONDS: float = 30.0
+
+    # Password hashing
+    BCRYPT_ROUNDS: int = 12
+    HASH_WORKERS: int = 2
+    HASH_QUEUE_SIZE: int = 8
+
+    # Caches
+    MEMBERSHIP_CACHE_TTL: float = 60.0
+    MEMBERSHIP_CACHE_SIZE: int = 10000
+    SIMILARITY_CACHE_TTL: float = 3600.0
+    SIMILARITY_CACHE_SIZE: int = 1000
+    SIMILARITY_MIN_OVERLAP: int = 2
+    RESPONSE_CACHE_TTL: float = 300.0
+    RESPONSE_CACHE_SIZE: int = 5000
+
+    # Movie catalog
+    MOVIE_SEARCH_INDEX_REFRESH: float = 300.0
+    CATALOG_IMPORT_BATCH_SIZE: int = 5000
+    # Admin-started imports only read export files inside this directory.
+    CATALOG_IMPORT_DIR: str = "imports"
+    # A running import whose progress has not been saved for this many seconds
+    # is reported as failed: the worker running it has most likely died.
+    CATALOG_IMPORT_HEARTBEAT_TIMEOUT: float = 300.0
+
+    # Recommender
+    RECOMMENDER_ENABLED: bool = True
+    RECOMMENDER_INTERVAL: float = 300.0
+    RECOMMENDER_FULL_RETRAIN_HOURS: float = 24.0
+    RECOMMENDER_FACTORS: int = 16
+    RECOMMENDER_REGULARIZATION: float = 1.0
+    RECOMMENDER_ITERATIONS: int = 10
+    # Incremental passes re-read this many seconds of ratings behind the last
+    # watermark, for ratings that committed after a pass with an earlier rated_at.
+    RECOMMENDER_WATERMARK_OVERLAP: float = 120.0
+
+    # Poll expiry
+    POLL_EXPIRY_ENABLED: bool = True
+    POLL_EXPIRY_RELOAD_INTERVAL: float = 300.0
+    POLL_EXPIRY_BATCH_SIZE: int = 500
+    POLL_TIE_BREAK: Literal["first", "predicted", "random", "none"] = "predicted"
+    POLL_CREATE_WATCHED_MOVIE: bool = False
+
+    # Live poll results
+    LIVE_RESULTS_INTERVAL: float = 0.5
 
     # TMDB API
     TMDB_API_KEY: str
     TMDB_API_URL: str = "https://api.themoviedb.org/3"
+    TMDB_IMAGE_URL: str = "https://image.tmdb.org/t/p/w500"
+    TMDB_USE_STUB: bool = False
+    TMDB_CACHE_TTL: float = 600.0
+    TMDB_CACHE_SIZE: int = 2048
+    TMDB_MAX_CONNECTIONS: int = 20
 
     # BACKEND API
     API_URL: str
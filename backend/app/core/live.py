@@ -0,0 +1,156 @@
+import asyncio
+from collections import defaultdict
+from typing import Dict, Optional, Set, Tuple
+
+from app.core.config import settings
+
+
+class Subscription:
+    """
+    One subscriber's mailbox for a poll. It holds at most one pending message:
+    if the consumer falls behind, newer deltas are merged into the pending one,
+    so intermediate states are dropped instead of queued.
+    """
+
+    def __init__(self, hub: "PollResultsHub", poll_id: int):
+        self.poll_id = poll_id
+        self.dropped = 0
+        self._hub = hub
+        self._pending: Optional[dict] = None
+        self._ready = asyncio.Event()
+
+    def _offer(self, message: dict):
+        if self._pending is None:
+            self._pending = {**message, "vote_counts": dict(message["vote_counts"])}
+        else:
+            self._pending["vote_counts"].update(message["vote_counts"])
+            self._pending["total_votes"] = message["total_votes"]
+            self.dropped += 1
+        self._ready.set()
+
+    async def get(self) -> dict:
+        """
+        Waits for the next (possibly merged) results delta.
+        """
+        await self._ready.wait()
+        self._ready.clear()
+        message, self._pending = self._pending, None
+        return message
+
+    def close(self):
+        self._hub._unsubscribe(self)
+
+
+class PollResultsHub:
+    """
+    In-process pub/sub for live poll results.
+
+    Votes publish the poll's full tallies from any thread; the hub coalesces
+    bursts into at most one delta per poll per interval and fans it out to
+    every subscriber of that poll on the event loop. Tallies carry the poll's
+    version, since publishes from different threads can arrive out of order:
+    one older than what is already staged or sent is dropped.
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._subscribers: Dict[int, Set[Subscription]] = defaultdict(set)
+        self._last_sent: Dict[int, Dict[int, int]] = {}
+        self._sent_versions: Dict[int, int] = {}
+        self._staged: Dict[int, Tuple[int, Dict[int, int]]] = {}
+        self._flush_handles: Dict[int, asyncio.TimerHandle] = {}
+        self._last_flush: Dict[int, float] = {}
+
+    def has_subscribers(self, poll_id: int) -> bool:
+        return bool(self._subscribers.get(poll_id))
+
+    def subscribe(self, poll_id: int) -> Subscription:
+        """
+        Registers a subscriber for a poll. Must be called on the event loop.
+        """
+        self._loop = asyncio.get_running_loop()
+        subscription = Subscription(self, poll_id)
+        self._subscribers[poll_id].add(subscription)
+        return subscription
+
+    def prime(self, poll_id: int, version: int, vote_counts: Dict[int, int]):
+        """
+        Records the tallies subscribers already hold, so the first delta only
+        carries options that changed since. Must be called on the event loop.
+        """
+        self._last_sent.setdefault(poll_id, dict(vote_counts))
+        self._sent_versions.setdefault(poll_id, version)
+
+    def publish(self, poll_id: int, version: int, vote_counts: Dict[int, int]):
+        """
+        Publishes the {poll_option_id: vote_count} tallies of a poll as of the
+        given poll version. Safe to call from worker threads; a no-op when
+        nobody is listening.
+        """
+        loop = self._loop
+        if loop is None or not self.has_subscribers(poll_id):
+            return
+        loop.call_soon_threadsafe(self._stage, poll_id, version, dict(vote_counts))
+
+    def _stage(self, poll_id: int, version: int, vote_counts: Dict[int, int]):
+        if not self.has_subscribers(poll_id):
+            return
+        staged_version = self._staged[poll_id][0] if poll_id in self._staged else -1
+        if version < max(staged_version, self._sent_versions.get(poll_id, -1)):
+            return
+        self._staged[poll_id] = (version, vote_counts)
+        if poll_id in self._flush_handles:
+            return
+        now = self._loop.time()
+        delay = max(0.0, self._last_flush.get(poll_id, 0.0) + self.interval - now)
+        self._flush_handles[poll_id] = self._loop.call_later(delay, self._flush, poll_id)
+
+    def _flush(self, poll_id: int):
+        self._flush_handles.pop(poll_id, None)
+        staged = self._staged.pop(poll_id, None)
+        if staged is None:
+            return
+        version, vote_counts = staged
+        # A subscriber may have been primed with newer tallies since staging.
+        if version < self._sent_versions.get(poll_id, -1):
+            return
+        self._last_flush[poll_id] = self._loop.time()
+
+        previous = self._last_sent.get(poll_id, {})
+        changed = {
+            option_id: count
+            for option_id, count in vote_counts.items()
+            if previous.get(option_id) != count
+        }
+        self._last_sent[poll_id] = vote_counts
+        self._sent_versions[poll_id] = version
+        if not changed:
+            return
+
+        message = {
+            "poll_id": poll_id,
+            "vote_counts": changed,
+            "total_votes": sum(vote_counts.values()),
+        }
+        for subscription in self._subscribers.get(poll_id, ()):
+            subscription._offer(message)
+
+    def _unsubscribe(self, subscription: Subscription):
+        poll_id = subscription.poll_id
+        subscribers = self._subscribers.get(poll_id)
+        if subscribers is None:
+            return
+        subscribers.discard(subscription)
+        if not subscribers:
+            del self._subscribers[poll_id]
+            self._last_sent.pop(poll_id, None)
+            self._sent_versions.pop(poll_id, None)
+            self._staged.pop(poll_id, None)
+            self._last_flush.pop(poll_id, None)
+            handle = self._flush_handles.pop(poll_id, None)
+            if handle is not None:
+                handle.cancel()
+
+
+poll_results_hub = PollResultsHub(interval=settings.LIVE_RESULTS_INTERVAL)
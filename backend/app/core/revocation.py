@@ -0,0 +1,84 @@
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+from peewee import fn
+from app.core.config import settings
+from app.models.model import TokenRevocation
+
+
+class RevocationList:
+    """
+    Per-process copy of the recent rows of the tokenrevocation table, as
+    {user_id: latest revoked_at epoch seconds}.
+
+    Only revocations younger than the access token lifetime are kept, since any
+    token they could reject has expired otherwise, so the map stays small. It
+    is reloaded from the database at most once per refresh interval, and local
+    revocations are applied immediately.
+    """
+
+    def __init__(self, refresh_interval: float, max_age: timedelta):
+        self.refresh_interval = refresh_interval
+        self.max_age = max_age
+        self._revoked: Dict[int, float] = {}
+        self._refreshed_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def revoke(self, user_id: int, revoked_at: datetime):
+        """
+        Records a revocation made by this process.
+        """
+        timestamp = revoked_at.timestamp()
+        with self._lock:
+            if timestamp > self._revoked.get(user_id, 0.0):
+                self._revoked[user_id] = timestamp
+
+    def is_revoked(self, user_id: int, issued_at: Optional[float]) -> bool:
+        """
+        Checks whether a token issued to user_id at issued_at (epoch seconds,
+        with fraction) has been revoked. Tokens without an issue time are treated as revoked
+        whenever the user has a revocation on record.
+        """
+        self._refresh_if_stale()
+        revoked_at = self._revoked.get(user_id)
+        if revoked_at is None:
+            return False
+        return issued_at is None or issued_at < revoked_at
+
+    def _refresh_if_stale(self):
+        refreshed_at = self._refreshed_at
+        if refreshed_at is not None and time.monotonic() - refreshed_at < self.refresh_interval:
+            return
+        # Only one thread refreshes; the others keep using the current map.
+        if not self._lock.acquire(blocking=False):
+            return
+        try:
+            self._refreshed_at = time.monotonic()
+            self._revoked = self._load()
+        finally:
+            self._lock.release()
+
+    def _load(self) -> Dict[int, float]:
+        cutoff = datetime.now() - self.max_age
+        query = (TokenRevocation
+                 .select(TokenRevocation.user_id, fn.MAX(TokenRevocation.revoked_at))
+                 .where(TokenRevocation.revoked_at > cutoff)
+                 .group_by(TokenRevocation.user_id)
+                 .tuples())
+        return {user_id: revoked_at.timestamp() for user_id, revoked_at in query}
+
+    def clear(self):
+        """
+        Forgets all revocations and forces a reload on the next check.
+        """
+        with self._lock:
+            self._revoked = {}
+            self._refreshed_at = None
+
+
+revocations = RevocationList(
+    refresh_interval=settings.REVOCATION_REFRESH_SECONDS,
+    max_age=timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES),
+)
@@ -1,18 +1,86 @@
+import multiprocessing
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor
 from datetime import datetime, timedelta, timezone
-from typing import Optional
+from typing import Callable, Optional, Tuple
 import jwt
 from passlib.context import CryptContext
 from app.core.config import settings
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Hashes with a different cost factor are reported by needs_update and rehashed on login.
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=settings.BCRYPT_ROUNDS)
+
+
+class HashingBusy(Exception):
+    """Raised when the password hashing queue is full."""
+
+
+# bcrypt runs in a dedicated process pool so login storms don't pin the
+# threadpool that every sync endpoint shares. At most HASH_QUEUE_SIZE requests
+# may be waiting on or running a hash; further callers fail fast.
+_hash_slots = threading.BoundedSemaphore(settings.HASH_QUEUE_SIZE)
+_executor: Optional[Executor] = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> Optional[Executor]:
+    global _executor
+    if settings.HASH_WORKERS <= 0:
+        return None
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=settings.HASH_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _executor
+
+
+def _run_hashing(fn: Callable, *args):
+    if not _hash_slots.acquire(blocking=False):
+        raise HashingBusy("Password hashing queue is full")
+    try:
+        executor = _get_executor()
+        if executor is None:
+            return fn(*args)
+        return executor.submit(fn, *args).result()
+    finally:
+        _hash_slots.release()
+
+
+def shutdown_hashing():
+    """Stops the password hashing worker processes."""
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(cancel_futures=True)
+            _executor = None
+
+
+def _hash(password: str) -> str:
+    return pwd_context.hash(password)
+
+def _verify(plain_password: str, hashed_password: str) -> bool:
+    return pwd_context.verify(plain_password, hashed_password)
+
+def _verify_and_update(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    return pwd_context.verify_and_update(plain_password, hashed_password)
+
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verifies a plain-text password against a hashed one."""
-    return pwd_context.verify(plain_password, hashed_password)
+    return _run_hashing(_verify, plain_password, hashed_password)
+
+def verify_and_update_password(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """
+    Verifies a password and, if the stored hash uses outdated settings,
+    also returns a fresh hash to store. Returns (verified, new_hash_or_None).
+    """
+    return _run_hashing(_verify_and_update, plain_password, hashed_password)
 
 def get_password_hash(password: str) -> str:
     """Hashes a plain-text password."""
-    return pwd_context.hash(password)
+    return _run_hashing(_hash, password)
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     """
@@ -23,6 +91,17 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
         expire = datetime.now(timezone.utc) + expires_delta
     else:
         expire = datetime.now(timezone.utc) + timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
-    to_encode.update({"exp": expire, "iat": datetime.now(timezone.utc)})
+    # iat keeps its fraction of a second, the resolution revoked_at is compared at.
+    to_encode.update({"exp": expire, "iat": datetime.now(timezone.utc).timestamp()})
     encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
-    return encoded_jwt 
\ No newline at end of file
+    return encoded_jwt
+
+def create_access_token_for_user(user, expires_delta: Optional[timedelta] = None) -> str:
+    """
+    Creates an access token carrying the user's id and superuser flag, so
+    requests can be authorized without loading the user from the database.
+    """
+    return create_access_token(
+        data={"sub": user.username, "uid": user.id, "su": user.is_superuser},
+        expires_delta=expires_delta,
+    )
@@ -0,0 +1,303 @@
+import argparse
+import gzip
+import io
+import itertools
+import json
+import os
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, TextIO
+
+from peewee import EXCLUDED, PostgresqlDatabase, fn
+from app.core.config import settings
+from app.db.database import connection_scope, db
+from app.models.model import CatalogImportJob, Movie
+
+
+class ImportStats:
+    """
+    Running totals of a catalog import.
+    """
+
+    def __init__(self):
+        self.lines_read = 0
+        self.invalid_lines = 0
+        self.duplicates = 0
+        self.rows_upserted = 0
+        self.batches = 0
+        self.started_at = time.perf_counter()
+        self.finished_at: Optional[float] = None
+
+    @property
+    def elapsed(self) -> float:
+        return (self.finished_at or time.perf_counter()) - self.started_at
+
+    def as_dict(self) -> dict:
+        elapsed = self.elapsed
+        return {
+            "lines_read": self.lines_read,
+            "invalid_lines": self.invalid_lines,
+            "duplicates": self.duplicates,
+            "rows_upserted": self.rows_upserted,
+            "batches": self.batches,
+            "elapsed_seconds": round(elapsed, 3),
+            "rows_per_second": round(self.rows_upserted / elapsed, 1) if elapsed else 0.0,
+        }
+
+
+def read_lines(path: str) -> Iterator[str]:
+    """
+    Streams the lines of a TMDb export file, gunzipping it if it ends in .gz.
+    """
+    opener: Callable[..., TextIO] = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as f:
+        yield from f
+
+
+def parse_movies(lines: Iterable[str], stats: ImportStats) -> Iterator[dict]:
+    """
+    Turns export lines into Movie rows, skipping blank, malformed and adult entries.
+    Daily exports only carry id and original_title; full API records also work.
+    """
+    for line in lines:
+        stats.lines_read += 1
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+            tmdb_id = str(int(record["id"]))
+        except (ValueError, KeyError, TypeError):
+            stats.invalid_lines += 1
+            continue
+        title = (record.get("title") or record.get("original_title") or "").strip()
+        if not title or record.get("adult"):
+            stats.invalid_lines += 1
+            continue
+        release_date = record.get("release_date") or ""
+        poster_path = record.get("poster_path")
+        yield {
+            "tmdb_id": tmdb_id,
+            "title": title[:255],
+            "release_year": int(release_date[:4]) if release_date[:4].isdigit() else None,
+            "poster_url": f"{settings.TMDB_IMAGE_URL}{poster_path}" if poster_path else None,
+        }
+
+
+def batched(rows: Iterable[dict], size: int, stats: ImportStats) -> Iterator[List[dict]]:
+    """
+    Groups rows into batches of up to size, keeping the last row per tmdb_id.
+    An upsert cannot touch the same row twice, so each batch must be unique;
+    duplicates across batches are resolved by the upsert itself.
+    """
+    rows = iter(rows)
+    while True:
+        batch: Dict[str, dict] = {}
+        for row in itertools.islice(rows, size):
+            if row["tmdb_id"] in batch:
+                stats.duplicates += 1
+            batch[row["tmdb_id"]] = row
+        if not batch:
+            return
+        yield list(batch.values())
+
+
+_COLUMNS = ("tmdb_id", "title", "release_year", "poster_url")
+
+# Rows are COPYed into a per-transaction staging table and merged from there,
+# which avoids building and parsing one huge INSERT statement per batch.
+_CREATE_STAGING_SQL = """
+CREATE TEMP TABLE IF NOT EXISTS movie_import (
+    tmdb_id VARCHAR(20), title VARCHAR(255), release_year INTEGER, poster_url TEXT
+) ON COMMIT DROP
+"""
+_COPY_SQL = "COPY movie_import (tmdb_id, title, release_year, poster_url) FROM STDIN"
+_MERGE_SQL = """
+INSERT INTO movie (tmdb_id, title, release_year, poster_url)
+SELECT tmdb_id, title, release_year, poster_url FROM movie_import
+ON CONFLICT (tmdb_id) DO UPDATE SET
+    title = EXCLUDED.title,
+    release_year = COALESCE(EXCLUDED.release_year, movie.release_year),
+    poster_url = COALESCE(EXCLUDED.poster_url, movie.poster_url)
+"""
+
+
+def _copy_value(value) -> str:
+    if value is None:
+        return "\\N"
+    return str(value).replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+
+
+def _copy_upsert(rows: List[dict]):
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write("\t".join(_copy_value(row[column]) for column in _COLUMNS))
+        buffer.write("\n")
+    buffer.seek(0)
+    cursor = db.cursor()
+    cursor.execute(_CREATE_STAGING_SQL)
+    # Still present when the caller's transaction spans several batches.
+    cursor.execute("TRUNCATE movie_import")
+    cursor.copy_expert(_COPY_SQL, buffer)
+    cursor.execute(_MERGE_SQL)
+
+
+def _insert_upsert(rows: List[dict]):
+    (Movie
+     .insert_many(rows, fields=[Movie.tmdb_id, Movie.title, Movie.release_year, Movie.poster_url])
+     .on_conflict(
+         conflict_target=[Movie.tmdb_id],
+         update={
+             Movie.title: EXCLUDED.title,
+             Movie.release_year: fn.COALESCE(EXCLUDED.release_year, Movie.release_year),
+             Movie.poster_url: fn.COALESCE(EXCLUDED.poster_url, Movie.poster_url),
+         })
+     .execute())
+
+
+def upsert_movies(rows: List[dict]) -> int:
+    """
+    Inserts or updates a batch of unique Movie rows in one transaction, keyed
+    on tmdb_id. Fields missing from a new row keep their catalog value.
+    """
+    with db.atomic():
+        if isinstance(db, PostgresqlDatabase):
+            _copy_upsert(rows)
+        else:
+            _insert_upsert(rows)
+    return len(rows)
+
+
+def import_catalog(lines: Iterable[str], batch_size: int = settings.CATALOG_IMPORT_BATCH_SIZE,
+                   stats: Optional[ImportStats] = None,
+                   on_batch: Optional[Callable[[ImportStats], None]] = None) -> ImportStats:
+    """
+    Loads TMDb export lines into the catalog in batches. Only one batch is held
+    in memory at a time, so memory use does not depend on the input size.
+    Each batch commits on its own, so an interrupted import can simply be rerun.
+    """
+    stats = stats or ImportStats()
+    for batch in batched(parse_movies(lines, stats), batch_size, stats):
+        stats.rows_upserted += upsert_movies(batch)
+        stats.batches += 1
+        if on_batch is not None:
+            on_batch(stats)
+    stats.finished_at = time.perf_counter()
+    return stats
+
+
+def import_catalog_file(path: str, batch_size: int = settings.CATALOG_IMPORT_BATCH_SIZE,
+                        stats: Optional[ImportStats] = None,
+                        on_batch: Optional[Callable[[ImportStats], None]] = None) -> ImportStats:
+    return import_catalog(read_lines(path), batch_size=batch_size, stats=stats, on_batch=on_batch)
+
+
+# Finished jobs are kept this long for GET /admin/catalog/import/{job_id}.
+_JOB_RETENTION = timedelta(days=7)
+
+_PROGRESS_FIELDS = ("lines_read", "invalid_lines", "duplicates", "rows_upserted", "batches")
+
+
+def _save_progress(job_id: str, stats: ImportStats, **fields):
+    progress = {getattr(CatalogImportJob, name): getattr(stats, name) for name in _PROGRESS_FIELDS}
+    progress[CatalogImportJob.heartbeat_at] = datetime.now()
+    progress.update({getattr(CatalogImportJob, name): value for name, value in fields.items()})
+    CatalogImportJob.update(progress).where(CatalogImportJob.id == job_id).execute()
+
+
+def _run_job(job_id: str, path: str, batch_size: int):
+    stats = ImportStats()
+    with connection_scope():
+        _save_progress(job_id, stats, status="running")
+        try:
+            import_catalog_file(path, batch_size=batch_size, stats=stats,
+                                on_batch=lambda stats: _save_progress(job_id, stats))
+        except Exception as e:
+            _save_progress(job_id, stats, status="failed", error=str(e), finished_at=datetime.now())
+        else:
+            _save_progress(job_id, stats, status="finished", finished_at=datetime.now())
+
+
+def _job_dict(job: CatalogImportJob) -> dict:
+    elapsed = ((job.finished_at or datetime.now()) - job.started_at).total_seconds()
+    return {
+        "id": job.id,
+        "path": job.path,
+        "status": job.status,
+        "error": job.error,
+        **{name: getattr(job, name) for name in _PROGRESS_FIELDS},
+        "elapsed_seconds": round(elapsed, 3),
+        "rows_per_second": round(job.rows_upserted / elapsed, 1) if elapsed > 0 else 0.0,
+    }
+
+
+def _fail_stale_jobs():
+    # Jobs whose worker died mid-run stop saving progress; they end at their last heartbeat.
+    cutoff = datetime.now() - timedelta(seconds=settings.CATALOG_IMPORT_HEARTBEAT_TIMEOUT)
+    (CatalogImportJob
+     .update(status="failed", error="Import stopped reporting progress", finished_at=CatalogImportJob.heartbeat_at)
+     .where(CatalogImportJob.status.in_(["pending", "running"]) & (CatalogImportJob.heartbeat_at < cutoff))
+     .execute())
+
+
+def resolve_import_path(path: str) -> str:
+    """
+    Resolves an export file name against CATALOG_IMPORT_DIR.
+    Raises ValueError if it points outside that directory or is not a file.
+    """
+    import_dir = os.path.realpath(settings.CATALOG_IMPORT_DIR)
+    resolved = os.path.realpath(os.path.join(import_dir, path))
+    if os.path.commonpath([import_dir, resolved]) != import_dir:
+        raise ValueError("Import file must be inside the import directory")
+    if not os.path.isfile(resolved):
+        raise ValueError("Import file not found")
+    return resolved
+
+
+def start_import_job(path: str, batch_size: int = settings.CATALOG_IMPORT_BATCH_SIZE) -> dict:
+    """
+    Starts importing an export file from CATALOG_IMPORT_DIR on a background
+    thread of this worker. The job's state lives in the catalogimportjob table,
+    so any worker can report its progress; jobs finished more than a week ago
+    are pruned.
+    Raises ValueError if the file is outside the import directory or missing.
+    """
+    path = resolve_import_path(path)
+    _fail_stale_jobs()
+    CatalogImportJob.delete().where(CatalogImportJob.finished_at < datetime.now() - _JOB_RETENTION).execute()
+    job = CatalogImportJob.create(id=uuid.uuid4().hex, path=path, batch_size=batch_size)
+    threading.Thread(target=_run_job, args=(job.id, path, batch_size), name=f"catalog-import-{job.id}",
+                     daemon=True).start()
+    return _job_dict(job)
+
+
+def get_import_job(job_id: str) -> Optional[dict]:
+    """
+    State and progress of a catalog import, or None for an unknown or pruned job.
+    A job that stopped saving progress while running is reported as failed.
+    """
+    _fail_stale_jobs()
+    job = CatalogImportJob.get_or_none(CatalogImportJob.id == job_id)
+    return _job_dict(job) if job else None
+
+
+def main(argv: Optional[List[str]] = None):
+    """
+    Command line entry point: python -m app.crud.catalog_import <path>
+    """
+    parser = argparse.ArgumentParser(description="Import a TMDb movie export (JSON lines, optionally gzipped) into the catalog.")
+    parser.add_argument("path", help="e.g. movie_ids_05_15_2024.json.gz")
+    parser.add_argument("--batch-size", type=int, default=settings.CATALOG_IMPORT_BATCH_SIZE)
+    args = parser.parse_args(argv)
+
+    def report(stats: ImportStats):
+        print(f"{stats.rows_upserted} rows, {stats.rows_upserted / stats.elapsed:.0f} rows/s", flush=True)
+
+    with connection_scope():
+        stats = import_catalog_file(args.path, batch_size=args.batch_size, on_batch=report)
+    print(json.dumps(stats.as_dict()))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,27 @@
-from typing import List, Optional
+from typing import FrozenSet, List, Optional, Union
+from app.core.cache import MISSING, TTLCache
+from app.core.config import settings
+from app.crud.pagination import PageResult, paginate
+from app.db.database import db
 from app.models.model import Group, User, UserGroupLink
 from app.schemas.group import GroupCreate
 
+# user id -> frozenset of the ids of the groups the user belongs to
+_membership_cache = TTLCache(
+    "group_membership",
+    ttl=settings.MEMBERSHIP_CACHE_TTL,
+    maxsize=settings.MEMBERSHIP_CACHE_SIZE,
+)
+
 def create_group(group_in: GroupCreate, creator: User) -> Group:
     """
     Creates a new group and adds the creator as the first member.
     """
-    group = Group.create(name=group_in.name, description=group_in.description)
-    UserGroupLink.create(user=creator, group=group)
+    with db.atomic():
+        group = Group.create(name=group_in.name, description=group_in.description)
+        UserGroupLink.create(user=creator, group=group)
+        _bump_groups_version([creator.id])
+    invalidate_membership(user_id=creator.id)
     return group
 
 def get_all_members(group: Group) -> List[User]:
@@ -24,33 +38,87 @@ def get_group_by_id(group_id: int) -> Group:
     """
     return Group.get_or_none(Group.id == group_id)
 
-def get_groups_for_user(user: User) -> List[Group]:
+# The columns of schemas.Group, for list reads that skip model instances
+_GROUP_COLUMNS = (Group.id, Group.name, Group.description, Group.created_at)
+
+def get_groups_for_user(user: User) -> List[dict]:
+    """
+    Retrieves all groups a user is a member of, in id order, as dicts of the
+    schemas.Group columns.
+    """
+    return list(Group
+                .select(*_GROUP_COLUMNS)
+                .join(UserGroupLink)
+                .where(UserGroupLink.user == user)
+                .order_by(Group.id)
+                .dicts())
+
+def get_group_ids_for_user(user_id: int) -> FrozenSet[int]:
+    """
+    Retrieves the ids of all groups a user is a member of, through the membership cache.
+    """
+    group_ids = _membership_cache.get(user_id)
+    if group_ids is MISSING:
+        group_ids = _load_group_ids(user_id)
+    return group_ids
+
+def _load_group_ids(user_id: int) -> FrozenSet[int]:
+    group_ids = frozenset(
+        group_id for (group_id,) in
+        UserGroupLink.select(UserGroupLink.group).where(UserGroupLink.user == user_id).tuples()
+    )
+    _membership_cache.set(user_id, group_ids)
+    return group_ids
+
+def get_groups_version(user_id: int) -> int:
     """
-    Retrieves all groups a user is a member of.
+    Retrieves the version stamp of a user's group list, bumped whenever the
+    user joins a group or one of their groups is deleted.
     """
-    return (Group
-            .select()
-            .join(UserGroupLink)
-            .where(UserGroupLink.user == user))
+    version = User.select(User.groups_version).where(User.id == user_id).scalar()
+    return version or 0
 
-def is_user_member_of_group(user: User, group: Group) -> bool:
+def _bump_groups_version(user_ids: List[int]):
+    if user_ids:
+        User.update(groups_version=User.groups_version + 1).where(User.id.in_(user_ids)).execute()
+
+def invalidate_membership(user_id: int):
+    """
+    Drops a user's cached group memberships.
+    """
+    _membership_cache.invalidate(user_id)
+
+def is_user_member_of_group(user: User, group: Union[Group, int]) -> bool:
     """
     Checks if a user is a member of a specific group.
+    Accepts a Group or a group id, so callers holding a poll can pass poll.group_id
+    without loading the group.
     """
-    return UserGroupLink.get_or_none((UserGroupLink.user == user) & (UserGroupLink.group == group)) is not None
+    group_id = group if isinstance(group, int) else group.id
+    group_ids = _membership_cache.get(user.id)
+    if group_ids is not MISSING and group_id in group_ids:
+        return True
+    # Negative answers are always re-checked against the database, so a join
+    # handled by another worker is never hidden by a stale cache entry.
+    return group_id in _load_group_ids(user.id)
 
 def add_user_to_group(user: User, group: Group):
     """
     Adds a user to a group.
     """
     if not is_user_member_of_group(user, group):
-        UserGroupLink.create(user=user, group=group)
+        with db.atomic():
+            UserGroupLink.create(user=user, group=group)
+            Group.update(version=Group.version + 1).where(Group.id == group.id).execute()
+            _bump_groups_version([user.id])
+        invalidate_membership(user_id=user.id)
 
-def get_groups(skip: int = 0, limit: int = 100) -> List[Group]:
-    """ 
-    Retrieves a list of groups with pagination.
+def get_groups(cursor: Optional[str] = None, limit: int = 100, estimate_total: bool = False) -> PageResult:
+    """
+    Retrieves a page of groups ordered by id, starting after the cursor,
+    as dicts of the schemas.Group columns.
     """
-    return list(Group.select().offset(skip).limit(limit))
+    return paginate(Group.select(*_GROUP_COLUMNS).dicts(), Group.id, cursor=cursor, limit=limit, estimate_total=estimate_total)
 
 def delete_group(group_id: int) -> Optional[Group]:
     """
@@ -58,5 +126,11 @@ def delete_group(group_id: int) -> Optional[Group]:
     """
     group = get_group_by_id(group_id=group_id)
     if group:
-        group.delete_instance(recursive=True)
+        member_ids = [user_id for (user_id,) in
+                      UserGroupLink.select(UserGroupLink.user).where(UserGroupLink.group == group).tuples()]
+        with db.atomic():
+            group.delete_instance(recursive=True)
+            _bump_groups_version(member_ids)
+        for user_id in member_ids:
+            invalidate_membership(user_id=user_id)
     return group
\ No newline at end of file
@@ -0,0 +1,62 @@
+from typing import Dict, List, Optional
+from peewee import EXCLUDED, fn
+from app.crud import movie_search
+from app.models.model import Movie
+from app.schemas.movie import MovieCreate
+
+
+def get_movie_by_id(movie_id: int) -> Optional[Movie]:
+    """
+    Retrieves a catalog movie by its ID.
+    """
+    return Movie.get_or_none(Movie.id == movie_id)
+
+def get_movie_by_tmdb_id(tmdb_id: str) -> Optional[Movie]:
+    """
+    Retrieves a catalog movie by its TMDb ID.
+    """
+    return Movie.get_or_none(Movie.tmdb_id == tmdb_id)
+
+def _upsert(movies_in: List[MovieCreate]) -> List[Movie]:
+    # DO UPDATE (rather than DO NOTHING) makes RETURNING yield the existing
+    # row too, and waits for a concurrent insert of the same tmdb_id instead
+    # of failing on the unique constraint. The existing row wins; new values
+    # only fill in details it is missing. The update still writes a new
+    # version of every existing row and locks it until commit, and those
+    # locks are taken in input order, so rows go in sorted by tmdb_id: two
+    # overlapping batches then lock their shared movies in the same order
+    # and cannot deadlock.
+    rows = [movie_in.model_dump() for movie_in in sorted(movies_in, key=lambda movie_in: movie_in.tmdb_id)]
+    query = (Movie
+             .insert_many(rows,
+                          fields=[Movie.tmdb_id, Movie.title, Movie.release_year, Movie.poster_url])
+             .on_conflict(
+                 conflict_target=[Movie.tmdb_id],
+                 update={
+                     Movie.release_year: fn.COALESCE(Movie.release_year, EXCLUDED.release_year),
+                     Movie.poster_url: fn.COALESCE(Movie.poster_url, EXCLUDED.poster_url),
+                 })
+             .returning(Movie))
+    movies = list(query.execute())
+    for movie in movies:
+        movie_search.index_movie(movie)
+    return movies
+
+def create_movie(movie_in: MovieCreate) -> Movie:
+    """
+    Adds a movie to the catalog, or returns the existing entry with the same
+    tmdb_id. A single statement, so concurrent adds of one movie cannot collide.
+    """
+    return _upsert([movie_in])[0]
+
+def create_movies(movies_in: List[MovieCreate]) -> List[Movie]:
+    """
+    Adds many movies to the catalog in one statement, returning the catalog
+    entry for each input in order, whether it was new or already present.
+    Repeated tmdb_ids in the input resolve to the same entry.
+    """
+    unique: Dict[str, MovieCreate] = {}
+    for movie_in in movies_in:
+        unique.setdefault(movie_in.tmdb_id, movie_in)
+    by_tmdb_id = {movie.tmdb_id: movie for movie in _upsert(list(unique.values()))}
+    return [by_tmdb_id[movie_in.tmdb_id] for movie_in in movies_in]
@@ -1,4 +1,9 @@
-from typing import List, Optional
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+from peewee import JOIN, fn, prefetch
+from app.crud import poll_expiry, recommender
+from app.crud.pagination import PageResult, paginate
+from app.db.database import db
 from app.models.model import Poll, PollOption, Vote, Group, User, Movie
 from app.schemas.poll import PollCreate
 from app.schemas.vote import VoteCreate
@@ -6,25 +11,76 @@ from app.schemas.vote import VoteCreate
 def create_poll(poll_in: PollCreate, group: Group, creator: User) -> Poll:
     """
     Creates a new poll and its associated options in the database.
+    Raises ValueError if a movie is not in the catalog.
     """
-    poll = Poll.create(
-        group=group,
-        creator=creator,
-        title=poll_in.title,
-        description=poll_in.description,
-        expires_at=poll_in.expires_at
-    )
-    
-    for movie_id in poll_in.movie_ids:
-        movie = Movie.get_or_none(Movie.id == movie_id)
-        if movie:
-            PollOption.create(
-                poll=poll,
-                movie_details=movie,
-                suggested_by=creator
-            )
-
-    return poll
+    return create_polls(polls_in=[poll_in], group=group, creator=creator)[0]
+
+_RESERVE_POLL_IDS_SQL = "SELECT nextval(pg_get_serial_sequence('poll', 'id')) FROM generate_series(1, %s)"
+
+def create_polls(polls_in: List[PollCreate], group: Group, creator: User) -> List[Poll]:
+    """
+    Creates several polls and all their options in one transaction, using one
+    query to validate the movies, one to reserve the poll ids, one multi-row
+    insert for the polls and one for the options. Each option carries the
+    recommender's predicted group score, and polls with an expiry are handed to
+    the expiry scheduler. Returns the polls, in input order, with their options
+    prefetched.
+    Raises ValueError if a movie is not in the catalog; nothing is created then.
+    """
+    movie_ids = {movie_id for poll_in in polls_in for movie_id in poll_in.movie_ids}
+    created_at = datetime.now()
+    with db.atomic():
+        # FOR SHARE keeps the movies from being deleted until the options referencing them are in.
+        found = set()
+        if movie_ids:
+            found = set(Movie
+                        .select(Movie.id)
+                        .where(Movie.id.in_(list(movie_ids)))
+                        .for_update("FOR SHARE")
+                        .scalars())
+        for poll_in in polls_in:
+            for movie_id in poll_in.movie_ids:
+                if movie_id not in found:
+                    raise ValueError(f"Movie with id {movie_id} not found in catalog.")
+        scores = recommender.score_movies_for_group(group.id, movie_ids)
+
+        # Ids are reserved up front: RETURNING does not promise rows in VALUES
+        # order, so it cannot tell which id went to which poll.
+        poll_ids = sorted(poll_id for (poll_id,) in db.execute_sql(_RESERVE_POLL_IDS_SQL, (len(polls_in),)))
+        poll_rows = [
+            {
+                Poll.id: poll_id,
+                Poll.group: group,
+                Poll.creator: creator,
+                Poll.title: poll_in.title,
+                Poll.description: poll_in.description,
+                Poll.expires_at: poll_in.expires_at,
+                Poll.created_at: created_at,
+            }
+            for poll_id, poll_in in zip(poll_ids, polls_in)
+        ]
+        Poll.insert_many(poll_rows).execute()
+
+        option_rows = [
+            {
+                PollOption.poll: poll_id,
+                PollOption.movie_details: movie_id,
+                PollOption.suggested_by: creator,
+                PollOption.suggested_at: created_at,
+                PollOption.predicted_score: scores.get(movie_id),
+            }
+            for poll_id, poll_in in zip(poll_ids, polls_in)
+            for movie_id in dict.fromkeys(poll_in.movie_ids)
+        ]
+        if option_rows:
+            PollOption.insert_many(option_rows).execute()
+        Group.update(version=Group.version + 1).where(Group.id == group.id).execute()
+
+    for poll_id, poll_in in zip(poll_ids, polls_in):
+        poll_expiry.poll_expiry_scheduler.schedule(poll_id, poll_in.expires_at)
+
+    polls = prefetch(Poll.select().where(Poll.id.in_(poll_ids)).order_by(Poll.id), PollOption)
+    return list(polls)
 
 def get_poll_by_id(poll_id: int) -> Optional[Poll]:
     """
@@ -32,39 +88,185 @@ def get_poll_by_id(poll_id: int) -> Optional[Poll]:
     """
     return Poll.get_or_none(Poll.id == poll_id)
 
-def get_polls(skip: int = 0, limit: int = 100) -> List[Poll]:
+# The columns of schemas.Poll, for list reads that skip model instances
+_POLL_COLUMNS = (
+    Poll.title, Poll.description, Poll.expires_at, Poll.id, Poll.group.alias("group_id"),
+    Poll.creator.alias("creator_id"), Poll.is_active, Poll.resolved_at,
+    Poll.winning_poll_option.alias("winning_poll_option_id"), Poll.total_votes,
+)
+
+def _attach_options(polls: Dict[int, dict], with_titles: bool = False):
+    # One tuple query for the options of every poll; vote counts come from the option counters.
+    columns = [PollOption.poll, PollOption.movie_details, PollOption.id, PollOption.suggested_by,
+               PollOption.vote_count, PollOption.predicted_score]
+    for poll in polls.values():
+        poll["options"], poll["vote_counts"] = [], {}
+    if not polls:
+        return
+    query = PollOption.select(*columns).where(PollOption.poll.in_(list(polls))).order_by(PollOption.id)
+    if with_titles:
+        query = query.select_extend(Movie.title).join(Movie)
+    for poll_id, movie_id, option_id, suggested_by_id, vote_count, predicted_score, *title in query.tuples():
+        option = {
+            "movie_details_id": movie_id,
+            "id": option_id,
+            "suggested_by_id": suggested_by_id,
+            "vote_count": vote_count,
+            "predicted_score": predicted_score,
+        }
+        if with_titles:
+            option["title"] = title[0]
+        polls[poll_id]["options"].append(option)
+        polls[poll_id]["vote_counts"][str(option_id)] = vote_count
+
+def get_poll_details(polls: Iterable[Poll]) -> Dict[int, dict]:
     """
-    Retrieves all polls with pagination.
+    Builds the schemas.PollDetails payload of polls, reading all their options
+    and movie titles in one tuple query. Returns {poll_id: payload}, ready for
+    direct JSON serialization.
     """
-    return list(Poll.select().offset(skip).limit(limit))
+    details = {
+        poll.id: {
+            "title": poll.title,
+            "description": poll.description,
+            "expires_at": poll.expires_at,
+            "id": poll.id,
+            "group_id": poll.group_id,
+            "creator_id": poll.creator_id,
+            "is_active": poll.is_active,
+            "resolved_at": poll.resolved_at,
+            "winning_poll_option_id": poll.winning_poll_option_id,
+            "total_votes": poll.total_votes,
+            "total_voters": poll.total_votes,
+        }
+        for poll in polls
+    }
+    _attach_options(details, with_titles=True)
+    return details
 
-def get_active_polls_for_group(group: Group) -> List[Poll]:
+def _paginate_polls(query, cursor: Optional[str], limit: int, estimate_total: bool) -> PageResult:
+    page = paginate(query.dicts(), Poll.id, cursor=cursor, limit=limit, estimate_total=estimate_total)
+    _attach_options({poll["id"]: poll for poll in page.items})
+    return page
+
+def get_polls(cursor: Optional[str] = None, limit: int = 100, estimate_total: bool = False) -> PageResult:
+    """
+    Retrieves a page of polls ordered by id, starting after the cursor, as
+    dicts of the schemas.PollWithCounts fields. Costs two queries: the polls,
+    and the options of all of them.
     """
-    Retrieves all active polls for a specific group.
+    return _paginate_polls(Poll.select(*_POLL_COLUMNS), cursor, limit, estimate_total)
+
+def get_active_polls_for_group(group: Group, cursor: Optional[str] = None, limit: int = 100,
+                               estimate_total: bool = False) -> PageResult:
     """
-    return (Poll
-            .select()
-            .where((Poll.group == group) & (Poll.is_active == True)))
+    Retrieves a page of the active polls of a specific group, ordered by id, as
+    dicts of the schemas.PollWithCounts fields. Costs two queries: the polls,
+    and the options of all of them.
+    """
+    query = (Poll
+             .select(*_POLL_COLUMNS)
+             .where((Poll.group == group) & (Poll.is_active == True)))
+    return _paginate_polls(query, cursor, limit, estimate_total)
+
+# Validates the option, upserts the vote and maintains the vote counters and
+# the poll's and group's versions in one statement. "previous" reads the
+# statement's snapshot, which cast_vote only takes once it holds the poll's row
+# lock (_LOCK_POLL_SQL), so every earlier vote in the poll is committed and
+# visible, and a poll resolved meanwhile is seen closed by "open_poll". The
+# poll row is updated by a single CTE, since two updates of one row in the same
+# statement would not both apply.
+_CAST_VOTE_SQL = """
+WITH open_poll AS (
+    SELECT id FROM poll
+    WHERE id = %(poll_id)s AND is_active
+      AND (expires_at IS NULL OR expires_at > %(voted_at)s)
+), chosen AS (
+    SELECT polloption.id FROM polloption JOIN open_poll ON open_poll.id = polloption.poll_id
+    WHERE polloption.id = %(option_id)s
+), previous AS (
+    SELECT poll_option_id, voted_at FROM vote
+    WHERE poll_context_id = %(poll_id)s AND voter_id = %(voter_id)s
+), upsert AS (
+    INSERT INTO vote (poll_option_id, voter_id, poll_context_id, voted_at)
+    SELECT id, %(voter_id)s, %(poll_id)s, %(voted_at)s FROM chosen
+    ON CONFLICT (poll_context_id, voter_id) {on_conflict}
+    RETURNING poll_option_id
+), decrement AS (
+    UPDATE polloption SET vote_count = vote_count - 1
+    WHERE id IN (SELECT poll_option_id FROM previous)
+      AND EXISTS (SELECT 1 FROM upsert)
+), increment AS (
+    UPDATE polloption SET vote_count = vote_count + 1
+    WHERE id IN (SELECT poll_option_id FROM upsert)
+), touched_poll AS (
+    UPDATE poll
+    SET total_votes = total_votes + CASE WHEN EXISTS (SELECT 1 FROM previous) THEN 0 ELSE 1 END,
+        version = version + 1
+    WHERE id = %(poll_id)s
+      AND EXISTS (SELECT 1 FROM upsert)
+    RETURNING group_id
+), touched_group AS (
+    UPDATE "group" SET version = version + 1
+    WHERE id IN (SELECT group_id FROM touched_poll)
+)
+SELECT
+    EXISTS (SELECT 1 FROM open_poll),
+    EXISTS (SELECT 1 FROM chosen),
+    (SELECT poll_option_id FROM previous),
+    (SELECT voted_at FROM previous),
+    (SELECT poll_option_id FROM upsert)
+"""
 
-def cast_vote(vote_in: VoteCreate, poll: Poll, voter: User) -> Vote:
+# The same lock the poll's counter update takes, acquired up front instead.
+_LOCK_POLL_SQL = "SELECT 1 FROM poll WHERE id = %s FOR NO KEY UPDATE"
+
+_INSERT_ONLY = "DO NOTHING"
+_CHANGE_VOTE = """DO UPDATE
+        SET poll_option_id = EXCLUDED.poll_option_id, voted_at = EXCLUDED.voted_at
+        WHERE vote.poll_option_id <> EXCLUDED.poll_option_id"""
+
+def cast_vote(vote_in: VoteCreate, poll: Poll, voter: User, change_vote: bool = False) -> Vote:
     """
     Casts a vote for a poll option.
-    Handles the "one vote per user per poll" logic.
+    Handles the "one vote per user per poll" logic: a second vote raises
+    ValueError, unless change_vote is set, in which case the existing vote is
+    moved to the new option in place. Votes on a closed or expired poll raise
+    ValueError too.
     """
-    existing_vote = Vote.get_or_none((Vote.poll_context == poll) & (Vote.voter == voter))
-    if existing_vote:
-        raise ValueError("User has already voted in this poll.")
+    sql = _CAST_VOTE_SQL.format(on_conflict=_CHANGE_VOTE if change_vote else _INSERT_ONLY)
+    params = {
+        "option_id": vote_in.poll_option_id,
+        "poll_id": poll.id,
+        "voter_id": voter.id,
+        "voted_at": datetime.now(),
+    }
+    with db.atomic():
+        db.execute_sql(_LOCK_POLL_SQL, (poll.id,))
+        poll_open, option_found, previous_option_id, previous_voted_at, voted_option_id = (
+            db.execute_sql(sql, params).fetchone())
 
-    poll_option = PollOption.get_or_none((PollOption.id == vote_in.poll_option_id) & (PollOption.poll == poll))
-    if not poll_option:
-        raise ValueError("Poll option not found in this poll.")
+    if voted_option_id is None:
+        if not poll_open:
+            raise ValueError("This poll is no longer active.")
+        if previous_option_id is not None and not change_vote:
+            raise ValueError("User has already voted in this poll.")
+        if not option_found:
+            raise ValueError("Poll option not found in this poll.")
+        # Re-voting for the option the user already picked leaves the stored vote as is.
+        return Vote(
+            poll_option=previous_option_id,
+            voter=voter,
+            poll_context=poll,
+            voted_at=previous_voted_at,
+        )
 
-    vote = Vote.create(
-        poll_option=poll_option,
+    return Vote(
+        poll_option=voted_option_id,
         voter=voter,
-        poll_context=poll
+        poll_context=poll,
+        voted_at=params["voted_at"],
     )
-    return vote
 
 def get_poll_option_by_id(poll_option_id: int) -> Optional[PollOption]:
     """
@@ -72,12 +274,145 @@ def get_poll_option_by_id(poll_option_id: int) -> Optional[PollOption]:
     """
     return PollOption.get_or_none(PollOption.id == poll_option_id)
 
-def get_vote_counts_for_poll(poll: Poll) -> dict:
+def get_vote_counts_for_poll(poll: Poll) -> Dict[int, int]:
     """
     Calculates the vote counts for each option in a poll.
     Returns a dictionary of {poll_option_id: vote_count}.
     """
-    counts = {}
-    for option in poll.options:
-        counts[option.id] = option.votes.count()
-    return counts 
\ No newline at end of file
+    return get_vote_counts_for_polls([poll.id]).get(poll.id, {})
+
+def get_versioned_vote_counts(poll_id: int) -> Tuple[int, Dict[int, int]]:
+    """
+    Reads a poll's version together with its option counters, in one query so
+    both come from the same snapshot. Every vote bumps the version, so of two
+    reads the one with the higher version holds the newer tallies.
+    Returns (version, {poll_option_id: vote_count}).
+    """
+    query = (PollOption
+             .select(Poll.version, PollOption.id, PollOption.vote_count)
+             .join(Poll)
+             .where(PollOption.poll == poll_id)
+             .tuples())
+    version = 0
+    counts: Dict[int, int] = {}
+    for version, option_id, vote_count in query:
+        counts[option_id] = vote_count
+    return version, counts
+
+def get_vote_counts_for_polls(poll_ids: Iterable[int]) -> Dict[int, Dict[int, int]]:
+    """
+    Reads the vote counters for every option of many polls in one query.
+    Returns a dictionary of {poll_id: {poll_option_id: vote_count}}.
+    """
+    poll_ids = list(poll_ids)
+    counts: Dict[int, Dict[int, int]] = {poll_id: {} for poll_id in poll_ids}
+    if not poll_ids:
+        return counts
+
+    query = (PollOption
+             .select(PollOption.poll, PollOption.id, PollOption.vote_count)
+             .where(PollOption.poll.in_(poll_ids))
+             .tuples())
+    for poll_id, option_id, vote_count in query:
+        counts[poll_id][option_id] = vote_count
+    return counts
+
+def count_votes_for_polls(poll_ids: Iterable[int]) -> Dict[int, Dict[int, int]]:
+    """
+    Counts the raw vote rows for every option of many polls in one grouped query.
+    Options without votes are included with a count of 0.
+    Returns a dictionary of {poll_id: {poll_option_id: vote_count}}.
+    """
+    poll_ids = list(poll_ids)
+    counts: Dict[int, Dict[int, int]] = {poll_id: {} for poll_id in poll_ids}
+    if not poll_ids:
+        return counts
+
+    query = (PollOption
+             .select(PollOption.poll, PollOption.id, fn.COUNT(Vote.voter))
+             .join(Vote, JOIN.LEFT_OUTER, on=(Vote.poll_option == PollOption.id))
+             .where(PollOption.poll.in_(poll_ids))
+             .group_by(PollOption.id)
+             .tuples())
+    for poll_id, option_id, vote_count in query:
+        counts[poll_id][option_id] = vote_count
+    return counts
+
+def _live_vote_polls():
+    # Polls whose votes were archived keep their final counters.
+    return Poll.select(Poll.id).where(Poll.votes_archived_at.is_null())
+
+def verify_vote_counters() -> List[dict]:
+    """
+    Compares the stored vote counters against the vote table.
+    Returns one entry per poll or poll option whose counter is out of sync.
+    Polls whose votes were archived are skipped.
+    """
+    option_votes = (Vote
+                    .select(Vote.poll_option, fn.COUNT(Vote.voter).alias('actual'))
+                    .group_by(Vote.poll_option)
+                    .alias('option_votes'))
+    actual = fn.COALESCE(option_votes.c.actual, 0)
+    option_query = (PollOption
+                    .select(PollOption.id, PollOption.vote_count, actual)
+                    .join(option_votes, JOIN.LEFT_OUTER,
+                          on=(option_votes.c.poll_option_id == PollOption.id))
+                    .where((PollOption.vote_count != actual) & PollOption.poll.in_(_live_vote_polls()))
+                    .tuples())
+
+    poll_votes = (Vote
+                  .select(Vote.poll_context, fn.COUNT(Vote.voter).alias('actual'))
+                  .group_by(Vote.poll_context)
+                  .alias('poll_votes'))
+    actual = fn.COALESCE(poll_votes.c.actual, 0)
+    poll_query = (Poll
+                  .select(Poll.id, Poll.total_votes, actual)
+                  .join(poll_votes, JOIN.LEFT_OUTER,
+                        on=(poll_votes.c.poll_context_id == Poll.id))
+                  .where((Poll.total_votes != actual) & Poll.votes_archived_at.is_null())
+                  .tuples())
+
+    mismatches = []
+    for poll_id, stored, counted in poll_query:
+        mismatches.append({"poll_id": poll_id, "poll_option_id": None, "stored": stored, "actual": counted})
+    for option_id, stored, counted in option_query:
+        mismatches.append({"poll_id": None, "poll_option_id": option_id, "stored": stored, "actual": counted})
+    return mismatches
+
+def bump_poll_versions(poll_ids: List[int]):
+    """
+    Bumps the version stamps of polls and of their groups, which invalidates
+    the ETags and cached bodies of both.
+    """
+    if not poll_ids:
+        return
+    Poll.update(version=Poll.version + 1).where(Poll.id.in_(poll_ids)).execute()
+    groups = Poll.select(Poll.group).where(Poll.id.in_(poll_ids))
+    Group.update(version=Group.version + 1).where(Group.id.in_(groups)).execute()
+
+def rebuild_vote_counters() -> List[dict]:
+    """
+    Recomputes every vote counter from the vote table in one transaction,
+    except those of polls whose votes were archived, and bumps the versions of
+    the polls that were corrected. Returns the mismatches that were corrected.
+    """
+    with db.atomic():
+        mismatches = verify_vote_counters()
+        option_votes = (Vote
+                        .select(fn.COUNT(Vote.voter))
+                        .where(Vote.poll_option == PollOption.id))
+        PollOption.update(vote_count=option_votes).where(PollOption.poll.in_(_live_vote_polls())).execute()
+        poll_votes = (Vote
+                      .select(fn.COUNT(Vote.voter))
+                      .where(Vote.poll_context == Poll.id))
+        Poll.update(total_votes=poll_votes).where(Poll.votes_archived_at.is_null()).execute()
+
+        option_ids = [entry["poll_option_id"] for entry in mismatches if entry["poll_id"] is None]
+        poll_ids = {entry["poll_id"] for entry in mismatches if entry["poll_id"] is not None}
+        if option_ids:
+            poll_ids.update(PollOption
+                            .select(PollOption.poll)
+                            .where(PollOption.id.in_(option_ids))
+                            .scalars())
+        bump_poll_versions(list(poll_ids))
+    return mismatches
@@ -0,0 +1,187 @@
+import argparse
+import json
+from datetime import datetime
+from typing import List, Optional
+from peewee import JOIN, fn
+from app.crud.pagination import PageResult, paginate
+from app.db.database import connection_scope, db
+from app.models.model import Group, Movie, MovieRating, User, UserGroupLink, WatchedMovie
+
+
+def get_watched_movie_by_id(watched_movie_id: int) -> Optional[WatchedMovie]:
+    """
+    Retrieves a watched movie entry by its ID.
+    """
+    return WatchedMovie.get_or_none(WatchedMovie.id == watched_movie_id)
+
+def get_watched_movies_for_group(group: Group, cursor: Optional[str] = None, limit: int = 100) -> PageResult:
+    """
+    Retrieves a page of a group's watch history with the movie details.
+    Rating summaries come from the stored aggregates, so no rating rows are read.
+    Raises ValueError for a malformed cursor.
+    """
+    query = (WatchedMovie
+             .select(WatchedMovie, Movie)
+             .join(Movie)
+             .where(WatchedMovie.group == group))
+    return paginate(query, WatchedMovie.id, cursor=cursor, limit=limit)
+
+def _apply_delta(watched: WatchedMovie, rater_id: int, count: int, total: int, sumsq: int):
+    WatchedMovie.update(
+        rating_count=WatchedMovie.rating_count + count,
+        rating_sum=WatchedMovie.rating_sum + total,
+        rating_sumsq=WatchedMovie.rating_sumsq + sumsq,
+    ).where(WatchedMovie.id == watched.id).execute()
+    UserGroupLink.update(
+        rating_count=UserGroupLink.rating_count + count,
+        rating_sum=UserGroupLink.rating_sum + total,
+        rating_sumsq=UserGroupLink.rating_sumsq + sumsq,
+    ).where((UserGroupLink.user == rater_id) & (UserGroupLink.group == watched.group_id)).execute()
+    Group.update(ratings_version=Group.ratings_version + 1).where(Group.id == watched.group_id).execute()
+
+def _lock_entry(watched: WatchedMovie) -> WatchedMovie:
+    # Serializes rating writes per entry, so the read of the previous rating
+    # and the aggregate update cannot interleave with another write.
+    entry = WatchedMovie.select().where(WatchedMovie.id == watched.id).for_update().get_or_none()
+    if entry is None:
+        raise ValueError("Watched movie not found.")
+    return entry
+
+def rate_watched_movie(watched: WatchedMovie, rater: User, rating_value: int) -> MovieRating:
+    """
+    Creates or updates a user's rating of a watched movie entry, and updates the
+    entry's and the member's rating aggregates in the same transaction.
+    """
+    with db.atomic():
+        entry = _lock_entry(watched)
+        rating = MovieRating.get_or_none(
+            (MovieRating.watched_movie_entry == entry.id) & (MovieRating.rater == rater.id))
+        if rating is None:
+            rating = MovieRating.create(watched_movie_entry=entry, rater=rater, rating_value=rating_value)
+            _apply_delta(entry, rater.id, 1, rating_value, rating_value * rating_value)
+        else:
+            previous = rating.rating_value
+            rated_at = datetime.now()
+            MovieRating.update(rating_value=rating_value, rated_at=rated_at).where(
+                (MovieRating.watched_movie_entry == entry.id) & (MovieRating.rater == rater.id)).execute()
+            _apply_delta(entry, rater.id, 0, rating_value - previous,
+                         rating_value * rating_value - previous * previous)
+            rating.rating_value = rating_value
+            rating.rated_at = rated_at
+    return rating
+
+def delete_rating(watched: WatchedMovie, rater: User) -> Optional[MovieRating]:
+    """
+    Deletes a user's rating of a watched movie entry, if any, and removes it
+    from the rating aggregates in the same transaction.
+    """
+    with db.atomic():
+        entry = _lock_entry(watched)
+        rating = MovieRating.get_or_none(
+            (MovieRating.watched_movie_entry == entry.id) & (MovieRating.rater == rater.id))
+        if rating is None:
+            return None
+        MovieRating.delete().where(
+            (MovieRating.watched_movie_entry == entry.id) & (MovieRating.rater == rater.id)).execute()
+        value = rating.rating_value
+        _apply_delta(entry, rater.id, -1, -value, -value * value)
+    return rating
+
+def _aggregates(*group_by):
+    value = MovieRating.rating_value
+    return (MovieRating
+            .select(*group_by,
+                    fn.COUNT(value).alias('actual_count'),
+                    fn.SUM(value).alias('actual_sum'),
+                    fn.SUM(value * value).alias('actual_sumsq'))
+            .join(WatchedMovie)
+            .group_by(*group_by))
+
+def verify_rating_aggregates() -> List[dict]:
+    """
+    Compares the stored rating aggregates against the movierating table.
+    Returns one entry per watched movie or group member that is out of sync.
+    """
+    entry_ratings = _aggregates(MovieRating.watched_movie_entry).alias('entry_ratings')
+    actual = [fn.COALESCE(entry_ratings.c.actual_count, 0),
+              fn.COALESCE(entry_ratings.c.actual_sum, 0),
+              fn.COALESCE(entry_ratings.c.actual_sumsq, 0)]
+    entry_query = (WatchedMovie
+                   .select(WatchedMovie.id, WatchedMovie.rating_count, WatchedMovie.rating_sum,
+                           WatchedMovie.rating_sumsq, *actual)
+                   .join(entry_ratings, JOIN.LEFT_OUTER,
+                         on=(entry_ratings.c.watched_movie_entry_id == WatchedMovie.id))
+                   .where((WatchedMovie.rating_count != actual[0]) |
+                          (WatchedMovie.rating_sum != actual[1]) |
+                          (WatchedMovie.rating_sumsq != actual[2]))
+                   .tuples())
+
+    member_ratings = _aggregates(MovieRating.rater, WatchedMovie.group).alias('member_ratings')
+    actual = [fn.COALESCE(member_ratings.c.actual_count, 0),
+              fn.COALESCE(member_ratings.c.actual_sum, 0),
+              fn.COALESCE(member_ratings.c.actual_sumsq, 0)]
+    member_query = (UserGroupLink
+                    .select(UserGroupLink.group, UserGroupLink.user, UserGroupLink.rating_count,
+                            UserGroupLink.rating_sum, UserGroupLink.rating_sumsq, *actual)
+                    .join(member_ratings, JOIN.LEFT_OUTER,
+                          on=((member_ratings.c.rater_id == UserGroupLink.user) &
+                              (member_ratings.c.group_id == UserGroupLink.group)))
+                    .where((UserGroupLink.rating_count != actual[0]) |
+                           (UserGroupLink.rating_sum != actual[1]) |
+                           (UserGroupLink.rating_sumsq != actual[2]))
+                    .tuples())
+
+    mismatches = []
+    for watched_id, *values in entry_query:
+        mismatches.append({"watched_movie_id": watched_id, "group_id": None, "user_id": None,
+                           "stored": values[:3], "actual": [int(v) for v in values[3:]]})
+    for group_id, user_id, *values in member_query:
+        mismatches.append({"watched_movie_id": None, "group_id": group_id, "user_id": user_id,
+                           "stored": values[:3], "actual": [int(v) for v in values[3:]]})
+    return mismatches
+
+def rebuild_rating_aggregates() -> List[dict]:
+    """
+    Recomputes every rating aggregate from the movierating table in one transaction.
+    Returns the mismatches that were corrected.
+    """
+    value = MovieRating.rating_value
+    with db.atomic():
+        mismatches = verify_rating_aggregates()
+        entry_ratings = MovieRating.select().where(MovieRating.watched_movie_entry == WatchedMovie.id)
+        WatchedMovie.update(
+            rating_count=entry_ratings.select(fn.COUNT(value)),
+            rating_sum=entry_ratings.select(fn.COALESCE(fn.SUM(value), 0)),
+            rating_sumsq=entry_ratings.select(fn.COALESCE(fn.SUM(value * value), 0)),
+        ).execute()
+        member_ratings = (MovieRating
+                          .select()
+                          .join(WatchedMovie)
+                          .where((MovieRating.rater == UserGroupLink.user) &
+                                 (WatchedMovie.group == UserGroupLink.group)))
+        UserGroupLink.update(
+            rating_count=member_ratings.select(fn.COUNT(value)),
+            rating_sum=member_ratings.select(fn.COALESCE(fn.SUM(value), 0)),
+            rating_sumsq=member_ratings.select(fn.COALESCE(fn.SUM(value * value), 0)),
+        ).execute()
+    return mismatches
+
+def main(argv: Optional[List[str]] = None):
+    """
+    Command line entry point: python -m app.crud.crud_rating {verify,rebuild}
+    """
+    parser = argparse.ArgumentParser(description="Check or rebuild the stored rating aggregates.")
+    parser.add_argument("action", choices=["verify", "rebuild"])
+    args = parser.parse_args(argv)
+
+    with connection_scope():
+        if args.action == "verify":
+            mismatches = verify_rating_aggregates()
+        else:
+            mismatches = rebuild_rating_aggregates()
+    for mismatch in mismatches:
+        print(json.dumps(mismatch))
+    print(f"{len(mismatches)} {'mismatches' if args.action == 'verify' else 'corrected'}")
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,12 @@
 import re
 from typing import Optional
-from app.models.model import User
+from app.db.database import db
+from app.models.model import User, TokenRevocation
+from app.core.revocation import revocations
+from app.crud.crud_group import invalidate_membership
+from app.crud.pagination import PageResult, paginate
 from app.schemas.user import UserCreate
-from app.core.security import get_password_hash, verify_password
+from app.core.security import get_password_hash, verify_and_update_password
 from typing import List
 
 def get_user_by_username(username: str) -> Optional[User]:
@@ -42,9 +46,14 @@ def authenticate_user(username_or_email: str, password: str) -> Optional[User]:
     
     if not user:
         return None
-    if not verify_password(password, user.hashed_password):
+    verified, new_hash = verify_and_update_password(password, user.hashed_password)
+    if not verified:
         return None
-    return user 
+    if new_hash:
+        # The stored hash uses an outdated cost factor; upgrade it now that we know the password.
+        User.update(hashed_password=new_hash).where(User.id == user.id).execute()
+        user.hashed_password = new_hash
+    return user
 
 
 def get_user(user_id: int) -> Optional[User]:
@@ -53,17 +62,47 @@ def get_user(user_id: int) -> Optional[User]:
     """
     return User.get_or_none(User.id == user_id)
 
-def get_users(skip: int = 0, limit: int = 100) -> List[User]:
+def get_users(cursor: Optional[str] = None, limit: int = 100, estimate_total: bool = False) -> PageResult:
+    """
+    Retrieves a page of users ordered by id, starting after the cursor,
+    as dicts of the schemas.User columns.
+    """
+    query = User.select(User.id, User.username, User.email, User.is_superuser).dicts()
+    return paginate(query, User.id, cursor=cursor, limit=limit, estimate_total=estimate_total)
+
+def revoke_user_tokens(user_id: int) -> TokenRevocation:
+    """
+    Invalidates every access token issued to a user so far.
     """
-    Retrieves a list of users with pagination.
+    revocation = TokenRevocation.create(user_id=user_id)
+    if not db.in_transaction():
+        revocations.revoke(user_id, revocation.revoked_at)
+    return revocation
+
+def set_superuser(user_id: int, is_superuser: bool) -> Optional[User]:
     """
-    return list(User.select().offset(skip).limit(limit))
+    Grants or removes superuser privileges and revokes the user's existing tokens,
+    whose claims still carry the old flag.
+    """
+    user = get_user(user_id=user_id)
+    if not user:
+        return None
+    with db.atomic():
+        user.is_superuser = is_superuser
+        user.save(only=[User.is_superuser])
+        revocation = revoke_user_tokens(user_id=user.id)
+    revocations.revoke(user.id, revocation.revoked_at)
+    return user
 
 def delete_user(user_id: int) -> Optional[User]:
     """
-    Deletes a user from the database.
+    Deletes a user from the database and revokes their access tokens.
     """
     user = get_user(user_id=user_id)
     if user:
-        user.delete_instance()
+        with db.atomic():
+            user.delete_instance()
+            revocation = revoke_user_tokens(user_id=user.id)
+        revocations.revoke(user.id, revocation.revoked_at)
+        invalidate_membership(user_id=user.id)
     return user
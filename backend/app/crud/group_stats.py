@@ -0,0 +1,237 @@
+from typing import List, NamedTuple, Optional, Tuple
+
+import numpy as np
+from peewee import JOIN
+
+from app.core.cache import MISSING, TTLCache
+from app.core.config import settings
+from app.db.database import db
+from app.models.model import Group, Movie, MovieRating, User, WatchedMovie
+
+# (group id, group ratings_version) -> similarity matrix; a rating write bumps
+# the version, so stale entries are never read and simply age out.
+_similarity_cache = TTLCache(
+    "group_similarity",
+    ttl=settings.SIMILARITY_CACHE_TTL,
+    maxsize=settings.SIMILARITY_CACHE_SIZE,
+)
+
+
+class GroupRatings(NamedTuple):
+    """
+    A group's watch history as compact arrays.
+
+    Watched movie entries and raters are numbered 0..n-1 in id order; each
+    rating is a (movie_idx, rater_idx, value) triple across the rating arrays.
+    """
+    watched_ids: np.ndarray      # entry index -> WatchedMovie id
+    movie_ids: np.ndarray        # entry index -> Movie id
+    titles: List[str]            # entry index -> title
+    release_years: np.ndarray    # entry index -> release year, 0 when unknown
+    rater_ids: np.ndarray        # rater index -> User id
+    usernames: List[str]         # rater index -> username
+    movie_idx: np.ndarray        # per rating
+    rater_idx: np.ndarray        # per rating
+    values: np.ndarray           # per rating
+
+
+def load_group_ratings(group_id: int) -> GroupRatings:
+    """
+    Loads every watched movie of a group with its ratings in one query.
+    """
+    query = (WatchedMovie
+             .select(WatchedMovie.id, Movie.id, Movie.title, Movie.release_year,
+                     MovieRating.rater, User.username, MovieRating.rating_value)
+             .join(Movie, on=(WatchedMovie.movie_details == Movie.id))
+             .switch(WatchedMovie)
+             .join(MovieRating, join_type=JOIN.LEFT_OUTER, on=(MovieRating.watched_movie_entry == WatchedMovie.id))
+             .join(User, join_type=JOIN.LEFT_OUTER, on=(MovieRating.rater == User.id))
+             .where(WatchedMovie.group == group_id)
+             .order_by(WatchedMovie.id))
+    # Raw cursor rows: peewee's per-column value conversion would cost more
+    # than the query itself on large histories.
+    rows = db.execute_sql(*query.sql()).fetchall()
+
+    watched_ids, first_row, row_movie_idx = np.unique(
+        np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows)),
+        return_index=True, return_inverse=True)
+    movie_ids = np.array([rows[i][1] for i in first_row], dtype=np.int64)
+    titles = [rows[i][2] for i in first_row]
+    release_years = np.array([rows[i][3] or 0 for i in first_row], dtype=np.int32)
+
+    rated = np.fromiter((row[4] is not None for row in rows), dtype=bool, count=len(rows))
+    rated_rows = [row for row in rows if row[4] is not None]
+    rater_ids, first_rating, rater_idx = np.unique(
+        np.fromiter((row[4] for row in rated_rows), dtype=np.int64, count=len(rated_rows)),
+        return_index=True, return_inverse=True)
+    usernames = [rated_rows[i][5] for i in first_rating]
+    values = np.fromiter((row[6] for row in rated_rows), dtype=np.float64, count=len(rated_rows))
+
+    return GroupRatings(
+        watched_ids=watched_ids,
+        movie_ids=movie_ids,
+        titles=titles,
+        release_years=release_years,
+        rater_ids=rater_ids,
+        usernames=usernames,
+        movie_idx=row_movie_idx[rated],
+        rater_idx=rater_idx,
+        values=values,
+    )
+
+
+def _optional(value: float) -> Optional[float]:
+    return None if np.isnan(value) else float(value)
+
+
+def compute_group_stats(group_id: int, ratings: GroupRatings) -> dict:
+    """
+    Computes the group stats from loaded ratings with vectorized operations.
+    """
+    n_movies, n_raters = len(ratings.watched_ids), len(ratings.rater_ids)
+    movie_idx, rater_idx, values = ratings.movie_idx, ratings.rater_idx, ratings.values
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        # Per watched movie: count, mean and population variance of its ratings.
+        movie_counts = np.bincount(movie_idx, minlength=n_movies)
+        movie_sums = np.bincount(movie_idx, weights=values, minlength=n_movies)
+        movie_sumsq = np.bincount(movie_idx, weights=values * values, minlength=n_movies)
+        movie_means = movie_sums / movie_counts
+        movie_vars = np.maximum(movie_sumsq / movie_counts - movie_means * movie_means, 0.0)
+
+        # Per member: average rating, and how far they sit from the group's mean on each movie.
+        rater_counts = np.bincount(rater_idx, minlength=n_raters)
+        rater_means = np.bincount(rater_idx, weights=values, minlength=n_raters) / rater_counts
+        deviations = values - movie_means[movie_idx]
+        rater_deviation = np.bincount(rater_idx, weights=deviations, minlength=n_raters) / rater_counts
+
+        # Release decades of watched movies, with the mean rating of each decade.
+        known = ratings.release_years > 0
+        decades, decade_of_movie = np.unique(ratings.release_years[known] // 10 * 10, return_inverse=True)
+        movie_decade = np.full(n_movies, -1, dtype=np.int64)
+        movie_decade[known] = decade_of_movie
+        decade_watched = np.bincount(decade_of_movie, minlength=len(decades))
+        rating_decade = movie_decade[movie_idx]
+        dated = rating_decade >= 0
+        decade_ratings = np.bincount(rating_decade[dated], minlength=len(decades))
+        decade_means = np.bincount(rating_decade[dated], weights=values[dated], minlength=len(decades)) / decade_ratings
+
+    movies = [
+        {
+            "watched_movie_id": int(ratings.watched_ids[i]),
+            "movie_id": int(ratings.movie_ids[i]),
+            "title": ratings.titles[i],
+            "ratings_count": int(movie_counts[i]),
+            "mean_rating": _optional(movie_means[i]),
+            "rating_variance": _optional(movie_vars[i]) if movie_counts[i] else None,
+        }
+        for i in range(n_movies)
+    ]
+    members = [
+        {
+            "user_id": int(ratings.rater_ids[i]),
+            "username": ratings.usernames[i],
+            "ratings_count": int(rater_counts[i]),
+            "average_rating": float(rater_means[i]),
+            "average_deviation": float(rater_deviation[i]),
+        }
+        for i in range(n_raters)
+    ]
+
+    # Divisive needs at least two opinions; ties go to the earliest entry.
+    contested = np.where(movie_counts >= 2, movie_vars, -1.0)
+    most_divisive = movies[int(np.argmax(contested))] if n_movies and contested.max() > 0 else None
+
+    return {
+        "group_id": group_id,
+        "watched_count": n_movies,
+        "ratings_count": len(values),
+        "average_rating": float(values.mean()) if len(values) else None,
+        "members": members,
+        "movies": movies,
+        "most_divisive_movie": most_divisive,
+        "harshest_critic": members[int(np.argmin(rater_deviation))] if n_raters else None,
+        "kindest_critic": members[int(np.argmax(rater_deviation))] if n_raters else None,
+        "decades": [
+            {
+                "decade": int(decades[i]),
+                "watched_count": int(decade_watched[i]),
+                "average_rating": _optional(decade_means[i]),
+            }
+            for i in range(len(decades))
+        ],
+    }
+
+
+def get_group_stats(group_id: int) -> dict:
+    """
+    Stats over a group's watch history: per-member averages, per-movie mean and
+    variance, the most divisive movie, the harshest and kindest critics, and a
+    histogram of watched movies by release decade.
+    """
+    return compute_group_stats(group_id, load_group_ratings(group_id))
+
+
+def member_similarity(rater_idx: np.ndarray, movie_idx: np.ndarray, values: np.ndarray,
+                      n_raters: int, n_movies: int, min_overlap: int = 2) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Pairwise Pearson correlation between raters over the movies both rated.
+
+    Every pairwise sum is one matrix product over the dense raters x movies
+    rating matrix X and its mask M: n = M M^T, Sx = X M^T, Sxx = X^2 M^T and
+    Sxy = X X^T. Returns (similarity, co_rated), where similarity is NaN for
+    pairs with fewer than min_overlap co-rated movies or a constant rater.
+    """
+    X = np.zeros((n_raters, n_movies))
+    M = np.zeros((n_raters, n_movies))
+    X[rater_idx, movie_idx] = values
+    M[rater_idx, movie_idx] = 1.0
+
+    n = M @ M.T
+    sx = X @ M.T
+    sy = sx.T
+    sxx = (X * X) @ M.T
+    syy = sxx.T
+    sxy = X @ X.T
+    with np.errstate(invalid="ignore", divide="ignore"):
+        cov = sxy - sx * sy / n
+        var_x = sxx - sx * sx / n
+        var_y = syy - sy * sy / n
+        similarity = cov / np.sqrt(var_x * var_y)
+    similarity[(n < min_overlap) | (var_x <= 1e-9) | (var_y <= 1e-9)] = np.nan
+    return np.clip(similarity, -1.0, 1.0), n.astype(np.int64)
+
+
+def get_member_similarity(group: Group) -> dict:
+    """
+    The group's member taste-similarity matrix, cached until the next rating
+    write in the group. Rows and columns follow the order of members.
+    """
+    key = (group.id, group.ratings_version)
+    result = _similarity_cache.get(key)
+    if result is not MISSING:
+        return result
+
+    # Only the rating triples are needed here, which is far cheaper to fetch
+    # than the full history load_group_ratings reads.
+    query = (MovieRating
+             .select(MovieRating.rater, MovieRating.watched_movie_entry, MovieRating.rating_value)
+             .join(WatchedMovie)
+             .where(WatchedMovie.group == group.id))
+    triples = np.array(db.execute_sql(*query.sql()).fetchall(), dtype=np.int64).reshape(-1, 3)
+    rater_ids, rater_idx = np.unique(triples[:, 0], return_inverse=True)
+    watched_ids, movie_idx = np.unique(triples[:, 1], return_inverse=True)
+    usernames = dict(User.select(User.id, User.username).where(User.id.in_(rater_ids.tolist())).tuples())
+
+    similarity, co_rated = member_similarity(
+        rater_idx, movie_idx, triples[:, 2].astype(np.float64), len(rater_ids), len(watched_ids),
+        min_overlap=settings.SIMILARITY_MIN_OVERLAP)
+    result = {
+        "group_id": group.id,
+        "version": group.ratings_version,
+        "members": [{"user_id": int(user_id), "username": usernames.get(int(user_id), "")} for user_id in rater_ids],
+        "similarity": [[None if np.isnan(value) else round(float(value), 4) for value in row] for row in similarity],
+        "co_rated": co_rated.tolist(),
+    }
+    _similarity_cache.set(key, result)
+    return result
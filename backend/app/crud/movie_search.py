@@ -0,0 +1,150 @@
+import bisect
+import re
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from peewee import SQL, Case, Expression, PostgresqlDatabase, fn
+from app.core.config import settings
+from app.db.database import db
+from app.models.model import Movie
+
+# Text search configuration of the movie_title_search index. 'simple' only
+# lowercases, so titles are matched as written, without stemming or stop words.
+SEARCH_CONFIG = SQL("'simple'")
+
+_TOKEN_RE = re.compile(r"\w+")
+
+
+def search_terms(query: str) -> List[str]:
+    """
+    Splits a search query into lowercase word tokens, dropping punctuation.
+    """
+    return _TOKEN_RE.findall(query.lower())
+
+
+def _search_fulltext(terms: List[str], year: Optional[int], limit: int) -> List[Movie]:
+    # Every term is matched as a prefix, so partially typed words still hit.
+    tsquery = fn.to_tsquery(SEARCH_CONFIG, " & ".join(f"{term}:*" for term in terms))
+    document = fn.to_tsvector(SEARCH_CONFIG, Movie.title)
+    phrase = " ".join(terms)
+
+    query = Movie.select().where(Expression(document, "@@", tsquery))
+    if year is not None:
+        query = query.where(Movie.release_year == year)
+    return list(query.order_by(
+        Case(None, ((fn.lower(Movie.title) == phrase, 0), (Movie.title.startswith(phrase), 1)), 2),
+        fn.ts_rank(document, tsquery).desc(),
+        fn.length(Movie.title),
+        Movie.id,
+    ).limit(limit))
+
+
+class MovieTitleIndex:
+    """
+    In-memory prefix index over catalog titles, for databases without
+    full-text search. Maps each title word to the movies containing it and
+    keeps the words sorted, so a prefix lookup is a bisect plus a range scan.
+    """
+
+    def __init__(self, refresh_interval: float):
+        self.refresh_interval = refresh_interval
+        self._titles: Dict[int, Tuple[str, Optional[int]]] = {}
+        self._postings: Dict[str, Set[int]] = defaultdict(set)
+        self._words: List[str] = []
+        self._loaded_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def load(self, rows: Iterable[Tuple[int, str, Optional[int]]]):
+        """
+        Replaces the index contents with (movie_id, title, release_year) rows.
+        """
+        titles: Dict[int, Tuple[str, Optional[int]]] = {}
+        postings: Dict[str, Set[int]] = defaultdict(set)
+        for movie_id, title, release_year in rows:
+            titles[movie_id] = (title.lower(), release_year)
+            for term in search_terms(title):
+                postings[term].add(movie_id)
+        with self._lock:
+            self._titles, self._postings = titles, postings
+            self._words = sorted(postings)
+            self._loaded_at = time.monotonic()
+
+    def add(self, movie_id: int, title: str, release_year: Optional[int] = None):
+        with self._lock:
+            self._titles[movie_id] = (title.lower(), release_year)
+            for term in search_terms(title):
+                if term not in self._postings:
+                    bisect.insort(self._words, term)
+                self._postings[term].add(movie_id)
+
+    def is_stale(self) -> bool:
+        return self._loaded_at is None or time.monotonic() - self._loaded_at >= self.refresh_interval
+
+    def _matching(self, prefix: str) -> Set[int]:
+        matches: Set[int] = set()
+        start = bisect.bisect_left(self._words, prefix)
+        for word in self._words[start:]:
+            if not word.startswith(prefix):
+                break
+            matches |= self._postings[word]
+        return matches
+
+    def search(self, terms: List[str], year: Optional[int] = None, limit: int = 20) -> List[int]:
+        """
+        Returns the ids of movies whose titles contain a word starting with
+        every term, exact and prefix title matches first, then shorter titles.
+        """
+        if not terms:
+            return []
+        with self._lock:
+            candidates = self._matching(terms[0])
+            for term in terms[1:]:
+                if not candidates:
+                    break
+                candidates &= self._matching(term)
+            phrase = " ".join(terms)
+            ranked = []
+            for movie_id in candidates:
+                title, release_year = self._titles[movie_id]
+                if year is not None and release_year != year:
+                    continue
+                tier = 0 if title == phrase else 1 if title.startswith(phrase) else 2
+                ranked.append((tier, len(title), movie_id))
+        ranked.sort()
+        return [movie_id for _, _, movie_id in ranked[:limit]]
+
+
+_title_index = MovieTitleIndex(refresh_interval=settings.MOVIE_SEARCH_INDEX_REFRESH)
+
+
+def _search_in_memory(terms: List[str], year: Optional[int], limit: int) -> List[Movie]:
+    if _title_index.is_stale():
+        _title_index.load(Movie.select(Movie.id, Movie.title, Movie.release_year).tuples().iterator())
+    movie_ids = _title_index.search(terms, year=year, limit=limit)
+    movies = {movie.id: movie for movie in Movie.select().where(Movie.id.in_(movie_ids))}
+    return [movies[movie_id] for movie_id in movie_ids if movie_id in movies]
+
+
+def search_movies(query: str, year: Optional[int] = None, limit: int = 20) -> List[Movie]:
+    """
+    Searches the local catalog by title. Every word of the query is matched as
+    a word prefix, so it works for typeahead. Exact and prefix title matches
+    rank first. Uses the movie_title_search index on Postgres.
+    """
+    terms = search_terms(query)
+    if not terms:
+        return []
+    if isinstance(db, PostgresqlDatabase):
+        return _search_fulltext(terms, year, limit)
+    return _search_in_memory(terms, year, limit)
+
+
+def index_movie(movie: Movie):
+    """
+    Makes a newly added catalog movie searchable by the in-memory index
+    without waiting for its next refresh.
+    """
+    if _title_index._loaded_at is not None:
+        _title_index.add(movie.id, movie.title, movie.release_year)
@@ -0,0 +1,66 @@
+import base64
+import json
+from typing import List, NamedTuple, Optional
+from peewee import Field, ModelSelect
+from app.db.database import db
+
+
+class PageResult(NamedTuple):
+    items: List
+    next_cursor: Optional[str]
+    estimated_total: Optional[int]
+
+
+def encode_cursor(last_key: int) -> str:
+    """
+    Encodes the key of the last row of a page as an opaque cursor.
+    """
+    payload = json.dumps({"after": last_key}, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> int:
+    """
+    Decodes a cursor produced by encode_cursor. Raises ValueError if it is malformed.
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        after = json.loads(base64.urlsafe_b64decode(padded))["after"]
+    except (ValueError, KeyError, TypeError):
+        raise ValueError("Invalid cursor.")
+    if not isinstance(after, int):
+        raise ValueError("Invalid cursor.")
+    return after
+
+
+def estimate_count(query: ModelSelect) -> int:
+    """
+    Returns the planner's row estimate for a query. This costs a plan, not a
+    scan, so it stays cheap on large tables, but is only approximate.
+    """
+    sql, params = query.sql()
+    plan = db.execute_sql("EXPLAIN (FORMAT JSON) " + sql, params).fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+def paginate(query: ModelSelect, key: Field, cursor: Optional[str] = None,
+             limit: int = 100, estimate_total: bool = False) -> PageResult:
+    """
+    Keyset pagination: returns the rows following the cursor in key order.
+    Each page is an index range scan on key, so it costs the same at any depth.
+    Works with model, .dicts() and .namedtuples() queries.
+    Raises ValueError for a malformed cursor.
+    """
+    estimated_total = estimate_count(query) if estimate_total else None
+    if cursor is not None:
+        query = query.where(key > decode_cursor(cursor))
+    rows = list(query.order_by(key).limit(limit + 1))
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(last[key.name] if isinstance(last, dict) else getattr(last, key.name))
+    return PageResult(rows, next_cursor, estimated_total)
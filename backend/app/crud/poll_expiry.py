@@ -0,0 +1,349 @@
+import argparse
+import asyncio
+import heapq
+import json
+import logging
+import random
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import orjson
+from peewee import Case
+
+from app.core.config import settings
+from app.crud import crud_poll
+from app.db.database import connection_scope, db
+from app.models.model import Group, Poll, PollOption, WatchedMovie
+
+logger = logging.getLogger(__name__)
+
+# How ties between the most-voted options are broken:
+#   first     - the earliest suggested option wins
+#   predicted - the option with the highest recommender score wins, then the earliest
+#   random    - a pick seeded by the poll id, so every worker picks the same option
+#   none      - a tied poll closes without a winner
+TIE_BREAKS = ("first", "predicted", "random", "none")
+
+
+def pick_winner(poll_id: int, tallies: Sequence[Tuple[int, int, Optional[float]]], tie_break: str) -> Optional[int]:
+    """
+    Picks the winning option of a poll from its (option_id, vote_count,
+    predicted_score) tallies, in option id order. A poll without votes has no winner.
+    """
+    top = max((votes for _, votes, _ in tallies), default=0)
+    if top == 0:
+        return None
+    leaders = [tally for tally in tallies if tally[1] == top]
+    if len(leaders) == 1 or tie_break == "first":
+        return leaders[0][0]
+    if tie_break == "predicted":
+        return max(leaders, key=lambda tally: (tally[2] if tally[2] is not None else float("-inf"), -tally[0]))[0]
+    if tie_break == "random":
+        return random.Random(poll_id).choice(leaders)[0]
+    return None
+
+
+def _resolve_batch(now: datetime, batch_size: int, tie_break: str, create_watched: bool) -> List[dict]:
+    with db.atomic():
+        # SKIP LOCKED: polls another worker is resolving right now are left to it.
+        due = (Poll
+               .select(Poll.id, Poll.group, Poll.creator)
+               .where((Poll.is_active == True) & (Poll.expires_at <= now))
+               .order_by(Poll.expires_at)
+               .limit(batch_size)
+               .for_update("FOR UPDATE SKIP LOCKED")
+               .tuples())
+        polls = {poll_id: (group_id, creator_id) for poll_id, group_id, creator_id in due}
+        if not polls:
+            return []
+
+        tallies: Dict[int, List[Tuple[int, int, Optional[float]]]] = {poll_id: [] for poll_id in polls}
+        movie_of: Dict[int, int] = {}
+        options = (PollOption
+                   .select(PollOption.poll, PollOption.id, PollOption.movie_details,
+                           PollOption.vote_count, PollOption.predicted_score)
+                   .where(PollOption.poll.in_(list(polls)))
+                   .order_by(PollOption.id)
+                   .tuples())
+        for poll_id, option_id, movie_id, vote_count, predicted_score in options:
+            tallies[poll_id].append((option_id, vote_count, predicted_score))
+            movie_of[option_id] = movie_id
+        winners = {poll_id: pick_winner(poll_id, tallies[poll_id], tie_break) for poll_id in polls}
+        decided = [(poll_id, option_id) for poll_id, option_id in winners.items() if option_id is not None]
+
+        update = {Poll.is_active: False, Poll.resolved_at: now}
+        if decided:
+            update[Poll.winning_poll_option] = Case(Poll.id, decided)
+        Poll.update(update).where(Poll.id.in_(list(polls))).execute()
+
+        if create_watched and decided:
+            rows = [
+                {
+                    WatchedMovie.movie_details: movie_of[option_id],
+                    WatchedMovie.group: polls[poll_id][0],
+                    WatchedMovie.logged_by_user: polls[poll_id][1],
+                    WatchedMovie.originating_poll: poll_id,
+                    WatchedMovie.watched_date: now.date(),
+                }
+                for poll_id, option_id in decided
+            ]
+            WatchedMovie.insert_many(rows).on_conflict_ignore().execute()
+
+        write_result_snapshots(list(polls))
+        group_ids = {group_id for group_id, _ in polls.values()}
+        Group.update(version=Group.version + 1).where(Group.id.in_(list(group_ids))).execute()
+
+    return [
+        {
+            "poll_id": poll_id,
+            "group_id": polls[poll_id][0],
+            "winning_poll_option_id": winners[poll_id],
+            "winning_movie_id": movie_of.get(winners[poll_id]),
+        }
+        for poll_id in polls
+    ]
+
+
+def resolve_due_polls(now: Optional[datetime] = None, batch_size: Optional[int] = None,
+                      tie_break: Optional[str] = None, create_watched: Optional[bool] = None) -> List[dict]:
+    """
+    Closes every active poll whose expiry has passed, one transaction per batch:
+    marks it inactive and resolved, records the most-voted option as the winner
+    and, if create_watched is set, logs the winning movie in the group's watch
+    history with the poll as its origin. Due polls are claimed with
+    FOR UPDATE SKIP LOCKED, so concurrent workers split the work and no poll is
+    resolved twice. Defaults come from the POLL_EXPIRY_* and POLL_TIE_BREAK settings.
+    Returns one entry per resolved poll.
+    """
+    now = now or datetime.now()
+    batch_size = batch_size or settings.POLL_EXPIRY_BATCH_SIZE
+    tie_break = tie_break or settings.POLL_TIE_BREAK
+    if tie_break not in TIE_BREAKS:
+        raise ValueError(f"Unknown tie break {tie_break!r}, expected one of {', '.join(TIE_BREAKS)}.")
+    if create_watched is None:
+        create_watched = settings.POLL_CREATE_WATCHED_MOVIE
+
+    resolved: List[dict] = []
+    while True:
+        batch = _resolve_batch(now, batch_size, tie_break, create_watched)
+        resolved.extend(batch)
+        if len(batch) < batch_size:
+            return resolved
+
+
+def build_result_snapshots(poll_ids: List[int]) -> Dict[int, str]:
+    """
+    Serializes the final results of polls, in the same shape get_poll_details
+    serves for live polls. Returns {poll_id: JSON document}.
+    """
+    details = crud_poll.get_poll_details(Poll.select().where(Poll.id.in_(poll_ids)))
+    return {poll_id: orjson.dumps(payload).decode() for poll_id, payload in details.items()}
+
+
+def write_result_snapshots(poll_ids: List[int]) -> int:
+    """
+    Stores the result snapshot of resolved polls and bumps their version.
+    Returns the number of polls updated.
+    """
+    snapshots = build_result_snapshots(poll_ids)
+    if not snapshots:
+        return 0
+    return (Poll
+            .update(result_snapshot=Case(Poll.id, list(snapshots.items())), version=Poll.version + 1)
+            .where(Poll.id.in_(list(snapshots)))
+            .execute())
+
+
+def backfill_result_snapshots(batch_size: int = 500) -> int:
+    """
+    Writes the missing result snapshots of polls resolved before snapshots
+    existed. Returns the number of polls updated.
+    """
+    written = 0
+    while True:
+        missing = (Poll
+                   .select(Poll.id)
+                   .where(Poll.resolved_at.is_null(False) & Poll.result_snapshot.is_null())
+                   .limit(batch_size)
+                   .tuples())
+        poll_ids = [poll_id for (poll_id,) in missing]
+        if not poll_ids:
+            return written
+        with db.atomic():
+            written += write_result_snapshots(poll_ids)
+
+
+# Moves the votes of the given polls to the archive in one statement.
+_ARCHIVE_VOTES_SQL = """
+WITH moved AS (
+    DELETE FROM vote WHERE poll_context_id = ANY(%s)
+    RETURNING poll_option_id, voter_id, poll_context_id, voted_at
+)
+INSERT INTO votearchive (poll_option_id, voter_id, poll_context_id, voted_at)
+SELECT poll_option_id, voter_id, poll_context_id, voted_at FROM moved
+"""
+
+
+def archive_votes(resolved_before: datetime, batch_size: int = 500) -> int:
+    """
+    Moves the vote rows of polls resolved before the cutoff from the vote table
+    to votearchive. Only polls with a result snapshot qualify, so their results
+    and history stay readable; their vote counters are left as they were. The
+    versions of the polls and their groups are bumped.
+    Returns the number of votes moved.
+    """
+    moved = 0
+    while True:
+        with db.atomic():
+            due = (Poll
+                   .select(Poll.id)
+                   .where(Poll.result_snapshot.is_null(False) & Poll.votes_archived_at.is_null()
+                          & (Poll.resolved_at < resolved_before))
+                   .limit(batch_size)
+                   .for_update("FOR UPDATE SKIP LOCKED")
+                   .tuples())
+            poll_ids = [poll_id for (poll_id,) in due]
+            if not poll_ids:
+                return moved
+            moved += db.execute_sql(_ARCHIVE_VOTES_SQL, (poll_ids,)).rowcount
+            Poll.update(votes_archived_at=datetime.now()).where(Poll.id.in_(poll_ids)).execute()
+            crud_poll.bump_poll_versions(poll_ids)
+
+
+def _local(expires_at: datetime) -> datetime:
+    # Expiries are stored as naive local times.
+    if expires_at.tzinfo is not None:
+        return expires_at.astimezone().replace(tzinfo=None)
+    return expires_at
+
+
+class PollExpiryScheduler:
+    """
+    In-process timer that closes polls when they expire.
+
+    Keeps a min-heap of (expires_at, poll_id) holding the active polls that
+    expire within the next two reload intervals, loaded from the database at
+    startup and on every reload, plus the polls this worker creates. When the
+    earliest deadline passes it runs resolve_due_polls, which finds the due
+    polls through the poll_active_expiry partial index rather than scanning the
+    poll table. Reloads also pick up polls created by other workers, and any
+    deadline missed while resolution was failing.
+    """
+
+    def __init__(self, reload_interval: float):
+        self.reload_interval = reload_interval
+        self.resolved = 0
+        self._heap: List[Tuple[datetime, int]] = []
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+
+    def schedule(self, poll_id: int, expires_at: Optional[datetime]):
+        """
+        Adds a poll's expiry to the timer. Safe to call from worker threads;
+        a no-op while the scheduler is not running.
+        """
+        loop = self._loop
+        if loop is None or expires_at is None:
+            return
+        loop.call_soon_threadsafe(self._push, _local(expires_at), poll_id)
+
+    def stats(self) -> dict:
+        return {
+            "running": self._loop is not None,
+            "scheduled": len(self._heap),
+            "next_expiry": self._heap[0][0].isoformat() if self._heap else None,
+            "resolved": self.resolved,
+        }
+
+    def _push(self, expires_at: datetime, poll_id: int):
+        heapq.heappush(self._heap, (expires_at, poll_id))
+        if self._heap[0] == (expires_at, poll_id) and self._wakeup is not None:
+            self._wakeup.set()
+
+    def _load(self, horizon: datetime) -> List[Tuple[datetime, int]]:
+        with connection_scope():
+            return list(Poll
+                        .select(Poll.expires_at, Poll.id)
+                        .where((Poll.is_active == True) & (Poll.expires_at <= horizon))
+                        .tuples())
+
+    def _resolve(self, now: datetime) -> List[dict]:
+        with connection_scope():
+            return resolve_due_polls(now)
+
+    async def run(self):
+        """
+        Background task: resolves polls as they expire until cancelled.
+        """
+        loop = asyncio.get_running_loop()
+        self._loop, self._wakeup = loop, asyncio.Event()
+        reload_at = loop.time()
+        try:
+            while True:
+                if loop.time() >= reload_at:
+                    reload_at = loop.time() + self.reload_interval
+                    horizon = datetime.now() + timedelta(seconds=2 * self.reload_interval)
+                    try:
+                        entries = await asyncio.to_thread(self._load, horizon)
+                        self._heap = list(set(self._heap).union(entries))
+                        heapq.heapify(self._heap)
+                    except Exception:
+                        logger.exception("loading poll expiries failed")
+
+                now = datetime.now()
+                if self._heap and self._heap[0][0] <= now:
+                    while self._heap and self._heap[0][0] <= now:
+                        heapq.heappop(self._heap)
+                    try:
+                        resolved = await asyncio.to_thread(self._resolve, now)
+                        self.resolved += len(resolved)
+                        if resolved:
+                            logger.info("resolved %d expired polls", len(resolved))
+                    except Exception:
+                        logger.exception("resolving expired polls failed")
+                    continue
+
+                timeout = reload_at - loop.time()
+                if self._heap:
+                    timeout = min(timeout, (self._heap[0][0] - now).total_seconds())
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=max(timeout, 0.0))
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            self._loop = self._wakeup = None
+
+
+poll_expiry_scheduler = PollExpiryScheduler(reload_interval=settings.POLL_EXPIRY_RELOAD_INTERVAL)
+
+
+def main(argv: Optional[List[str]] = None):
+    """
+    Command line entry point: python -m app.crud.poll_expiry {resolve,snapshot,archive}
+    """
+    parser = argparse.ArgumentParser(description="Resolve expired polls, or maintain the results of resolved ones.")
+    parser.add_argument("action", nargs="?", choices=["resolve", "snapshot", "archive"], default="resolve")
+    parser.add_argument("--tie-break", choices=TIE_BREAKS, default=None)
+    parser.add_argument("--create-watched", action="store_true", default=None,
+                        help="log each winning movie in its group's watch history")
+    parser.add_argument("--older-than-days", type=float, default=30.0,
+                        help="archive the votes of polls resolved at least this long ago")
+    args = parser.parse_args(argv)
+
+    with connection_scope():
+        if args.action == "snapshot":
+            print(f"{backfill_result_snapshots()} snapshots written")
+            return
+        if args.action == "archive":
+            cutoff = datetime.now() - timedelta(days=args.older_than_days)
+            print(f"{archive_votes(resolved_before=cutoff)} votes archived")
+            return
+        resolved = resolve_due_polls(tie_break=args.tie_break, create_watched=args.create_watched)
+    for entry in resolved:
+        print(json.dumps(entry))
+    print(f"{len(resolved)} resolved")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,310 @@
+import argparse
+import asyncio
+import json
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from peewee import Case
+
+from app.core.config import settings
+from app.db.database import connection_scope, db
+from app.models.model import (
+    Group, MovieFactors, MovieRating, Poll, PollOption, RecommenderState, UserFactors, UserGroupLink, WatchedMovie
+)
+
+logger = logging.getLogger(__name__)
+
+# Key of the Postgres advisory lock that keeps concurrent workers from training at once.
+_TRAIN_LOCK_KEY = 7_318_041_802
+
+# Ratings are accumulated into the normal equations this many at a time,
+# which bounds the size of the temporary outer-product array.
+_CHUNK = 4096
+
+
+def _pack(vector: np.ndarray) -> bytes:
+    return vector.astype(np.float32).tobytes()
+
+
+def _unpack(blob) -> np.ndarray:
+    return np.frombuffer(bytes(blob), dtype=np.float32).astype(np.float64)
+
+
+def _load_ratings(query) -> Tuple[np.ndarray, np.ndarray, np.ndarray, Optional[datetime]]:
+    rows = db.execute_sql(*query.sql()).fetchall()
+    if not rows:
+        return np.empty(0, np.int64), np.empty(0, np.int64), np.empty(0), None
+    user_ids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+    movie_ids = np.fromiter((row[1] for row in rows), dtype=np.int64, count=len(rows))
+    values = np.fromiter((row[2] for row in rows), dtype=np.float64, count=len(rows))
+    return user_ids, movie_ids, values, max(row[3] for row in rows)
+
+
+def _ratings_query():
+    # A user's rating of a movie, whichever group they watched it in.
+    return (MovieRating
+            .select(MovieRating.rater, WatchedMovie.movie_details, MovieRating.rating_value, MovieRating.rated_at)
+            .join(WatchedMovie))
+
+
+def _solve(entity_idx: np.ndarray, other_idx: np.ndarray, features: np.ndarray, targets: np.ndarray,
+           n_entities: int, regularization: float) -> np.ndarray:
+    """
+    Ridge regression per entity: for every entity e, solves
+    (F_e^T F_e + reg I) x_e = F_e^T t_e over the rows that belong to it, where
+    F_e are the features of the other side of each rating. All systems are
+    accumulated with vectorized reductions and solved as one batch.
+    """
+    width = features.shape[1]
+    A = np.zeros((n_entities, width, width))
+    b = np.zeros((n_entities, width))
+    order = np.argsort(entity_idx, kind="stable")
+    entity_idx, other_idx, targets = entity_idx[order], other_idx[order], targets[order]
+    for start in range(0, len(entity_idx), _CHUNK):
+        chunk = slice(start, start + _CHUNK)
+        f = features[other_idx[chunk]]
+        entities, starts = np.unique(entity_idx[chunk], return_index=True)
+        A[entities] += np.add.reduceat(f[:, :, None] * f[:, None, :], starts)
+        b[entities] += np.add.reduceat(f * targets[chunk, None], starts)
+    A += regularization * np.eye(width)
+    return np.linalg.solve(A, b[..., None])[..., 0]
+
+
+def _with_bias_column(factors: np.ndarray) -> np.ndarray:
+    return np.hstack([factors, np.ones((len(factors), 1))])
+
+
+class _Model:
+    """
+    Biased matrix factorization, rating ~ mean + b_user + b_movie + p_user . q_movie,
+    fitted by alternating least squares: with one side fixed, every user (or
+    movie) vector and bias is an independent ridge regression.
+    """
+
+    def __init__(self, user_ids: np.ndarray, movie_ids: np.ndarray, global_mean: float, n_factors: int):
+        self.user_ids, self.movie_ids = user_ids, movie_ids
+        self.global_mean = global_mean
+        self.P = np.zeros((len(user_ids), n_factors))
+        self.user_bias = np.zeros(len(user_ids))
+        rng = np.random.default_rng(0)
+        self.Q = rng.normal(0.0, 0.1, (len(movie_ids), n_factors))
+        self.movie_bias = np.zeros(len(movie_ids))
+
+    def solve_users(self, user_idx, movie_idx, values, which: Optional[np.ndarray] = None):
+        targets = values - self.global_mean - self.movie_bias[movie_idx]
+        solution = _solve(user_idx, movie_idx, _with_bias_column(self.Q), targets,
+                          len(self.user_ids), settings.RECOMMENDER_REGULARIZATION)
+        which = slice(None) if which is None else which
+        self.P[which], self.user_bias[which] = solution[which, :-1], solution[which, -1]
+
+    def solve_movies(self, user_idx, movie_idx, values, which: Optional[np.ndarray] = None):
+        targets = values - self.global_mean - self.user_bias[user_idx]
+        solution = _solve(movie_idx, user_idx, _with_bias_column(self.P), targets,
+                          len(self.movie_ids), settings.RECOMMENDER_REGULARIZATION)
+        which = slice(None) if which is None else which
+        self.Q[which], self.movie_bias[which] = solution[which, :-1], solution[which, -1]
+
+
+def _save_factors(model: _Model, users: Iterable[int], movies: Iterable[int]):
+    now = datetime.now()
+    user_rows = [{"user": int(model.user_ids[i]), "bias": float(model.user_bias[i]),
+                  "factors": _pack(model.P[i]), "updated_at": now} for i in users]
+    movie_rows = [{"movie": int(model.movie_ids[i]), "bias": float(model.movie_bias[i]),
+                   "factors": _pack(model.Q[i]), "updated_at": now} for i in movies]
+    for rows, table, key in ((user_rows, UserFactors, UserFactors.user), (movie_rows, MovieFactors, MovieFactors.movie)):
+        for start in range(0, len(rows), 1000):
+            (table
+             .insert_many(rows[start:start + 1000])
+             .on_conflict(conflict_target=[key], preserve=[table.bias, table.factors, table.updated_at])
+             .execute())
+
+
+def _train_full() -> dict:
+    user_ids, movie_ids, values, trained_through = _load_ratings(_ratings_query())
+    UserFactors.delete().execute()
+    MovieFactors.delete().execute()
+    RecommenderState.delete().execute()
+    if trained_through is None:
+        return {"mode": "full", "ratings": 0, "users": 0, "movies": 0}
+
+    users, user_idx = np.unique(user_ids, return_inverse=True)
+    movies, movie_idx = np.unique(movie_ids, return_inverse=True)
+    model = _Model(users, movies, float(values.mean()), settings.RECOMMENDER_FACTORS)
+    for _ in range(settings.RECOMMENDER_ITERATIONS):
+        model.solve_users(user_idx, movie_idx, values)
+        model.solve_movies(user_idx, movie_idx, values)
+    _save_factors(model, range(len(users)), range(len(movies)))
+
+    now = datetime.now()
+    RecommenderState.create(global_mean=model.global_mean, n_factors=settings.RECOMMENDER_FACTORS,
+                            trained_through=trained_through, full_trained_at=now, updated_at=now)
+    return {"mode": "full", "ratings": len(values), "users": len(users), "movies": len(movies)}
+
+
+def _train_incremental(state: RecommenderState) -> dict:
+    """
+    Folds in ratings written since the last run: re-solves the movies that got
+    new ratings against the stored user factors, then the users who rated,
+    against the updated movie factors. Everyone else keeps their factors.
+    rated_at is stamped before its transaction commits, so the scan starts an
+    overlap window behind the watermark; ratings seen twice are simply
+    re-solved. Rating deletions are only picked up by the next full retrain.
+    """
+    since = state.trained_through - timedelta(seconds=settings.RECOMMENDER_WATERMARK_OVERLAP)
+    new_query = _ratings_query().where(MovieRating.rated_at > since)
+    new_users, new_movies, _, newest = _load_ratings(new_query)
+    if newest is None:
+        return {"mode": "incremental", "ratings": 0, "users": 0, "movies": 0}
+    trained_through = max(newest, state.trained_through)
+    new_users, new_movies = np.unique(new_users), np.unique(new_movies)
+
+    # Every rating by an affected user or of an affected movie.
+    query = _ratings_query().where(MovieRating.rater.in_(new_users.tolist()) |
+                                   WatchedMovie.movie_details.in_(new_movies.tolist()))
+    user_ids, movie_ids, values, _ = _load_ratings(query)
+    users, user_idx = np.unique(user_ids, return_inverse=True)
+    movies, movie_idx = np.unique(movie_ids, return_inverse=True)
+
+    model = _Model(users, movies, state.global_mean, state.n_factors)
+    user_pos = {int(user_id): i for i, user_id in enumerate(users)}
+    movie_pos = {int(movie_id): i for i, movie_id in enumerate(movies)}
+    for user_id, bias, factors in UserFactors.select(UserFactors.user, UserFactors.bias, UserFactors.factors).where(
+            UserFactors.user.in_(users.tolist())).tuples():
+        model.P[user_pos[user_id]], model.user_bias[user_pos[user_id]] = _unpack(factors), bias
+    for movie_id, bias, factors in MovieFactors.select(MovieFactors.movie, MovieFactors.bias, MovieFactors.factors).where(
+            MovieFactors.movie.in_(movies.tolist())).tuples():
+        model.Q[movie_pos[movie_id]], model.movie_bias[movie_pos[movie_id]] = _unpack(factors), bias
+
+    affected_movies = np.searchsorted(movies, new_movies)
+    affected_users = np.searchsorted(users, new_users)
+    model.solve_movies(user_idx, movie_idx, values, which=affected_movies)
+    model.solve_users(user_idx, movie_idx, values, which=affected_users)
+    _save_factors(model, affected_users, affected_movies)
+
+    RecommenderState.update(trained_through=trained_through, updated_at=datetime.now()).where(
+        RecommenderState.id == state.id).execute()
+    return {"mode": "incremental", "ratings": len(values), "users": len(new_users), "movies": len(new_movies)}
+
+
+def score_movies_for_group(group_id: int, movie_ids: Iterable[int]) -> Dict[int, float]:
+    """
+    Predicted mean rating of each movie by the group's members. Averaging the
+    members first turns this into one dot product per movie:
+    mean + avg(b_user) + b_movie + q_movie . avg(p_user).
+    Members and movies the model has not seen count as average.
+    Returns {} until the model has been trained.
+    """
+    movie_ids = list(dict.fromkeys(movie_ids))
+    state = RecommenderState.select().first()
+    if state is None or not movie_ids:
+        return {}
+
+    n_members = UserGroupLink.select().where(UserGroupLink.group == group_id).count()
+    members = (UserFactors
+               .select(UserFactors.bias, UserFactors.factors)
+               .join(UserGroupLink, on=(UserGroupLink.user == UserFactors.user))
+               .where(UserGroupLink.group == group_id)
+               .tuples())
+    taste = np.zeros(state.n_factors)
+    bias = 0.0
+    for user_bias, factors in members:
+        taste += _unpack(factors)
+        bias += user_bias
+    if n_members:
+        taste, bias = taste / n_members, bias / n_members
+
+    scores = {movie_id: state.global_mean + bias for movie_id in movie_ids}
+    movies = (MovieFactors
+              .select(MovieFactors.movie, MovieFactors.bias, MovieFactors.factors)
+              .where(MovieFactors.movie.in_(movie_ids))
+              .tuples())
+    for movie_id, movie_bias, factors in movies:
+        scores[movie_id] += movie_bias + float(_unpack(factors) @ taste)
+    return {movie_id: round(score, 3) for movie_id, score in scores.items()}
+
+
+def rescore_active_polls() -> int:
+    """
+    Refreshes the predicted score of every option of every active poll, and
+    bumps the versions of the polls and groups whose scores were refreshed.
+    Returns the number of options updated.
+    """
+    options = (PollOption
+               .select(PollOption.id, PollOption.movie_details, Poll.group)
+               .join(Poll)
+               .where(Poll.is_active == True)
+               .tuples())
+    by_group: Dict[int, List[Tuple[int, int]]] = {}
+    for option_id, movie_id, group_id in options:
+        by_group.setdefault(group_id, []).append((option_id, movie_id))
+
+    updated = 0
+    for group_id, group_options in by_group.items():
+        scores = score_movies_for_group(group_id, (movie_id for _, movie_id in group_options))
+        if not scores:
+            continue
+        for start in range(0, len(group_options), 500):
+            batch = group_options[start:start + 500]
+            score = Case(PollOption.id, [(option_id, scores[movie_id]) for option_id, movie_id in batch])
+            PollOption.update(predicted_score=score).where(
+                PollOption.id.in_([option_id for option_id, _ in batch])).execute()
+            updated += len(batch)
+        Poll.update(version=Poll.version + 1).where((Poll.group == group_id) & (Poll.is_active == True)).execute()
+        Group.update(version=Group.version + 1).where(Group.id == group_id).execute()
+    return updated
+
+
+def train(full: bool = False) -> dict:
+    """
+    Runs one training pass: a full retrain when asked, when the model is
+    missing, outdated or of a different size, otherwise an incremental update
+    for the ratings written since the last pass. Then rescores the options of
+    active polls. Only one worker trains at a time; the others skip.
+    """
+    started = time.perf_counter()
+    with db.atomic():
+        if not db.execute_sql("SELECT pg_try_advisory_xact_lock(%s)", (_TRAIN_LOCK_KEY,)).fetchone()[0]:
+            return {"mode": "skipped"}
+        state = RecommenderState.select().first()
+        stale = (state is None or state.full_trained_at is None
+                 or state.n_factors != settings.RECOMMENDER_FACTORS
+                 or datetime.now() - state.full_trained_at > timedelta(hours=settings.RECOMMENDER_FULL_RETRAIN_HOURS))
+        result = _train_full() if full or stale else _train_incremental(state)
+        result["options_rescored"] = rescore_active_polls()
+    result["seconds"] = round(time.perf_counter() - started, 3)
+    return result
+
+
+async def run_periodically(interval: float):
+    """
+    Background task: trains every interval seconds until cancelled.
+    """
+    def run_once():
+        with connection_scope():
+            return train()
+
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            result = await asyncio.to_thread(run_once)
+            logger.info("recommender training: %s", result)
+        except Exception:
+            logger.exception("recommender training failed")
+
+
+def main(argv: Optional[List[str]] = None):
+    """
+    Command line entry point: python -m app.crud.recommender [--full]
+    """
+    parser = argparse.ArgumentParser(description="Train the poll option recommender.")
+    parser.add_argument("--full", action="store_true", help="retrain from scratch")
+    args = parser.parse_args(argv)
+    with connection_scope():
+        print(json.dumps(train(full=args.full)))
+
+
+if __name__ == "__main__":
+    main()
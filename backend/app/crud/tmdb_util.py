@@ -0,0 +1,193 @@
+import asyncio
+import time
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+
+from app.core.cache import MISSING, TTLCache
+from app.core.config import settings
+
+
+class TMDbError(Exception):
+    """Raised when TMDb answers with an error status."""
+
+    def __init__(self, status_code: int):
+        super().__init__(f"TMDb responded with status {status_code}")
+        self.status_code = status_code
+
+
+class TMDbUnavailable(Exception):
+    """Raised when TMDb cannot be reached."""
+
+
+def normalize_query(query: str) -> str:
+    """
+    Normalizes a search query so trivially different spellings share a cache entry.
+    """
+    return " ".join(query.lower().split())
+
+
+def tmdb_to_movie(result: dict) -> dict:
+    """
+    Converts a TMDb movie result into the fields of our catalog Movie.
+    """
+    release_date = result.get("release_date") or ""
+    poster_path = result.get("poster_path")
+    return {
+        "tmdb_id": str(result["id"]),
+        "title": result.get("title") or "",
+        "release_year": int(release_date[:4]) if release_date[:4].isdigit() else None,
+        "poster_url": f"{settings.TMDB_IMAGE_URL}{poster_path}" if poster_path else None,
+    }
+
+
+class TMDbClient:
+    """
+    Process-wide TMDb client.
+
+    All requests share one pooled httpx.AsyncClient. Search responses are kept
+    in an LRU+TTL cache keyed on the normalized query and page, and concurrent
+    identical searches are coalesced into a single upstream request. Only the
+    module's tmdb_client registers its cache for stats and clearing, so other
+    clients (in tests, say) cannot take over the "tmdb_search" entry.
+    """
+
+    def __init__(self, base_url: str, api_key: str, transport: Optional[httpx.AsyncBaseTransport] = None,
+                 cache_ttl: float = 600.0, cache_size: int = 2048, timeout: float = 5.0,
+                 max_connections: int = 20, register_cache: bool = False):
+        self.base_url = base_url
+        self.api_key = api_key
+        self.transport = transport
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self._client: Optional[httpx.AsyncClient] = None
+        self._cache = TTLCache("tmdb_search", ttl=cache_ttl, maxsize=cache_size, register=register_cache)
+        self._inflight: Dict[Tuple[str, int], asyncio.Task] = {}
+        self.upstream_requests = 0
+        self.upstream_errors = 0
+        self.coalesced = 0
+        self.upstream_latency_total = 0.0
+        self.upstream_latency_max = 0.0
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                transport=self.transport,
+                timeout=self.timeout,
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                ),
+            )
+        return self._client
+
+    async def aclose(self):
+        """
+        Closes the pooled HTTP client. A new one is created on next use.
+        """
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def search_movies(self, query: str, page: int = 1) -> List[dict]:
+        """
+        Searches TMDb for movies. Raises TMDbError or TMDbUnavailable.
+        """
+        key = (normalize_query(query), page)
+        results = self._cache.get(key)
+        if results is not MISSING:
+            return results
+
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._fetch_search(key))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            self.coalesced += 1
+        # Shielded, so a caller that disconnects doesn't cancel the shared request.
+        return await asyncio.shield(task)
+
+    async def _fetch_search(self, key: Tuple[str, int]) -> List[dict]:
+        query, page = key
+        params = {"api_key": self.api_key, "query": query, "page": page}
+        self.upstream_requests += 1
+        started = time.perf_counter()
+        try:
+            response = await self._get_client().get("/search/movie", params=params)
+            response.raise_for_status()
+        except httpx.HTTPStatusError as e:
+            self.upstream_errors += 1
+            raise TMDbError(e.response.status_code)
+        except httpx.RequestError:
+            self.upstream_errors += 1
+            raise TMDbUnavailable()
+        finally:
+            elapsed = time.perf_counter() - started
+            self.upstream_latency_total += elapsed
+            self.upstream_latency_max = max(self.upstream_latency_max, elapsed)
+
+        results = response.json().get("results", [])
+        self._cache.set(key, results)
+        return results
+
+    def stats(self) -> dict:
+        """
+        Returns cache and upstream statistics.
+        """
+        requests = self.upstream_requests
+        return {
+            "cache": self._cache.stats(),
+            "upstream_requests": requests,
+            "upstream_errors": self.upstream_errors,
+            "coalesced_requests": self.coalesced,
+            "upstream_latency_avg_ms": 1000 * self.upstream_latency_total / requests if requests else 0.0,
+            "upstream_latency_max_ms": 1000 * self.upstream_latency_max,
+        }
+
+
+# Small offline catalog served by the stub transport.
+dummy_movies = [
+    {"id": 603, "title": "The Matrix", "release_date": "1999-03-31", "poster_path": "/f89U3ADr1oiB1s9GkdPOEpXUk5H.jpg"},
+    {"id": 604, "title": "The Matrix Reloaded", "release_date": "2003-05-15", "poster_path": "/9TGHDvWrqKBzwDxDodHYXEmOE6J.jpg"},
+    {"id": 27205, "title": "Inception", "release_date": "2010-07-15", "poster_path": "/oYuLEt3zVCKq57qu2F8dT7NIa6f.jpg"},
+    {"id": 155, "title": "The Dark Knight", "release_date": "2008-07-16", "poster_path": "/qJ2tW6WMUDux911r6m7haRef0WH.jpg"},
+    {"id": 157336, "title": "Interstellar", "release_date": "2014-11-05", "poster_path": "/gEU2QniE6E77NI6lCU6MxlNBvIx.jpg"},
+]
+
+
+def make_stub_transport(movies: List[dict], page_size: int = 20) -> httpx.MockTransport:
+    """
+    Returns an httpx transport that answers /search/movie from a local list of
+    TMDb-shaped movie dicts (case-insensitive title substring match), so the
+    client can run and be tested without network access.
+    """
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        if not request.url.path.endswith("/search/movie"):
+            return httpx.Response(404, json={"status_message": "Not found"})
+        query = normalize_query(request.url.params.get("query", ""))
+        page = int(request.url.params.get("page", "1"))
+        matches = [movie for movie in movies if query in movie["title"].lower()]
+        start = (page - 1) * page_size
+        body = {
+            "page": page,
+            "results": matches[start:start + page_size],
+            "total_results": len(matches),
+            "total_pages": (len(matches) + page_size - 1) // page_size,
+        }
+        return httpx.Response(200, json=body)
+
+    return httpx.MockTransport(handler)
+
+
+tmdb_client = TMDbClient(
+    base_url=settings.TMDB_API_URL,
+    api_key=settings.TMDB_API_KEY,
+    transport=make_stub_transport(dummy_movies) if settings.TMDB_USE_STUB else None,
+    cache_ttl=settings.TMDB_CACHE_TTL,
+    cache_size=settings.TMDB_CACHE_SIZE,
+    max_connections=settings.TMDB_MAX_CONNECTIONS,
+    register_cache=True,
+)
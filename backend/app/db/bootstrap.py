@@ -0,0 +1,25 @@
+import argparse
+from typing import List, Optional
+
+from app.db.database import connection_scope, init_db
+
+
+def main(argv: Optional[List[str]] = None):
+    """
+    Command line entry point: python -m app.db.bootstrap
+
+    Pre-start step of a deployment. Applies pending schema migrations and
+    creates the admin user, so that workers only need the schema_ready probe.
+    """
+    parser = argparse.ArgumentParser(description="Migrate the database schema and create the admin user.")
+    parser.parse_args(argv)
+
+    with connection_scope():
+        applied = init_db()
+    for name in applied:
+        print(name)
+    print(f"{len(applied)} migrations applied")
+
+
+if __name__ == "__main__":
+    main()
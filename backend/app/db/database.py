@@ -1,23 +1,202 @@
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import List, Optional
+
 from peewee import *
-from playhouse.db_url import connect
+from peewee import _ConnectionState
+from playhouse.db_url import connect, parse
+from playhouse.pool import MaxConnectionsExceeded, PooledDatabase, PooledPostgresqlDatabase
 from app.core.config import settings
 
 
-db = connect(settings.DATABASE_URL)
+# Connection state for the active request scope (see connection_scope).
+_scope_state: ContextVar[Optional[dict]] = ContextVar("db_scope_state", default=None)
+
+
+def _fresh_state() -> dict:
+    return {"closed": True, "conn": None, "ctx": [], "transactions": []}
+
+
+class ScopedConnectionState(_ConnectionState):
+    """
+    Peewee connection state that follows the current request scope instead of
+    the current thread, so a request keeps one connection even though FastAPI
+    runs its sync dependencies and endpoint on different threadpool workers.
+    Outside of a scope it behaves like peewee's default thread-local state.
+    """
+
+    def __init__(self, **kwargs):
+        object.__setattr__(self, "_local", threading.local())
+        super().__init__(**kwargs)
+
+    def _store(self) -> dict:
+        state = _scope_state.get()
+        if state is None:
+            state = self._local.__dict__
+            if not state:
+                state.update(_fresh_state())
+        return state
+
+    def __getattr__(self, name):
+        try:
+            return self._store()[name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def __setattr__(self, name, value):
+        self._store()[name] = value
+
+
+class InstrumentedPooledDatabase(PooledPostgresqlDatabase):
+    """
+    Connection pool that keeps hit/miss/wait counters so the pool can be sized
+    against the number of workers.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._stats = {
+            "checkouts": 0,
+            "hits": 0,
+            "misses": 0,
+            "waits": 0,
+            "wait_time": 0.0,
+            "timeouts": 0,
+        }
+
+    def connect(self, reuse_if_open=False):
+        timeout = self._wait_timeout or 0
+        waiting_since = None
+        while True:
+            try:
+                opened = super(PooledDatabase, self).connect(reuse_if_open)
+            except MaxConnectionsExceeded:
+                now = time.monotonic()
+                if waiting_since is None:
+                    waiting_since = now
+                    with self._pool_lock:
+                        self._stats["waits"] += 1
+                if now - waiting_since >= timeout:
+                    with self._pool_lock:
+                        self._stats["timeouts"] += 1
+                        self._stats["wait_time"] += now - waiting_since
+                    raise
+                time.sleep(0.01)
+            else:
+                if waiting_since is not None:
+                    with self._pool_lock:
+                        self._stats["wait_time"] += time.monotonic() - waiting_since
+                return opened
+
+    def _connect(self):
+        with self._pool_lock:
+            idle = [conn for _, _, conn in self._connections]
+            conn = super()._connect()
+            self._stats["checkouts"] += 1
+            if any(conn is candidate for candidate in idle):
+                self._stats["hits"] += 1
+            else:
+                self._stats["misses"] += 1
+            return conn
+
+    def stats(self) -> dict:
+        """
+        Returns a snapshot of the pool counters and current pool occupancy.
+        """
+        with self._pool_lock:
+            return {
+                "pooled": True,
+                "max_connections": self._max_connections,
+                "in_use": len(self._in_use),
+                "idle": len(self._connections),
+                **self._stats,
+            }
+
+
+def _create_database() -> Database:
+    if settings.DB_POOL_ENABLED:
+        database = InstrumentedPooledDatabase(
+            max_connections=settings.DB_POOL_MAX_CONNECTIONS,
+            stale_timeout=settings.DB_POOL_STALE_TIMEOUT,
+            timeout=settings.DB_POOL_WAIT_TIMEOUT,
+            **parse(settings.DATABASE_URL),
+        )
+    else:
+        database = connect(settings.DATABASE_URL)
+    database._state = ScopedConnectionState()
+    return database
+
+
+db = _create_database()
+
+
+def pool_stats() -> dict:
+    """
+    Returns connection pool counters, or a marker when pooling is disabled.
+    """
+    if isinstance(db, InstrumentedPooledDatabase):
+        return db.stats()
+    return {"pooled": False}
+
+
+def release_connection():
+    """
+    Returns the current scope's connection to the pool early, e.g. before a
+    long-lived streaming response that no longer needs the database.
+    """
+    if not db.is_closed():
+        db.close()
+
+
+@contextmanager
+def connection_scope():
+    """
+    Gives the enclosed code its own connection state. A connection is checked
+    out lazily on the first query and returned to the pool on exit.
+    """
+    token = _scope_state.set(_fresh_state())
+    try:
+        yield
+    finally:
+        try:
+            release_connection()
+        finally:
+            _scope_state.reset(token)
+
+
+class DBConnectionMiddleware:
+    """
+    ASGI middleware that wraps every request in its own connection scope.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket"):
+            await self.app(scope, receive, send)
+            return
+        with connection_scope():
+            await self.app(scope, receive, send)
+
 
-def init_db():
+def init_db() -> List[str]:
     """
-    Initializes the database by connecting and creating tables.
+    Initializes the database by connecting, applying pending schema
+    migrations and creating the admin user. Returns the migrations applied.
+    Runs once per deployment (see app.db.bootstrap), not in every worker.
     """
-    from app.models.model import TABLES_TO_CREATE, User
+    from app.models.model import User
     from app.core.security import get_password_hash
+    from app.db.migrations import migrate
     db.connect(reuse_if_open=True)
-    # db.drop_tables(TABLES_TO_CREATE)
-    db.create_tables(TABLES_TO_CREATE, safe=True)
+    applied = migrate()
 
     admin_username = settings.ADMIN_USERNAME
     admin_email = settings.ADMIN_EMAIL
-    admin_password = settings.ADMIN_PASSWORD    
+    admin_password = settings.ADMIN_PASSWORD
 
     if not User.select().where(User.username == admin_username).exists():
         User.create(
@@ -26,3 +205,4 @@ def init_db():
             hashed_password=get_password_hash(admin_password),
             is_superuser=True
         )
+    return applied
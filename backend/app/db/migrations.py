@@ -0,0 +1,275 @@
+import argparse
+import json
+import logging
+from datetime import datetime
+from typing import Callable, Dict, Iterator, List, NamedTuple, Optional
+
+from peewee import Database, ProgrammingError
+
+from app.db.database import connection_scope, db
+from app.models.model import (
+    TABLES_TO_CREATE, CatalogImportJob, MovieRating, Poll, PollOption, SchemaMigration, UserGroupLink, Vote,
+    WatchedMovie
+)
+
+logger = logging.getLogger(__name__)
+
+# Key of the session advisory lock that keeps two workers from migrating at once.
+MIGRATION_LOCK_KEY = 7_420_001
+
+
+class Migration(NamedTuple):
+    """
+    One schema change. Atomic migrations run in a transaction together with
+    their bookkeeping row; the others (concurrent index builds, which Postgres
+    refuses to run in a transaction) run in autocommit and must be idempotent,
+    so an interrupted run can simply be repeated.
+    """
+    name: str
+    apply: Callable[[Database], None]
+    atomic: bool = True
+
+
+def _create_index(database: Database, name: str, definition: str):
+    """
+    Builds an index without blocking writes to its table. A build that was
+    interrupted leaves an invalid index behind, which is dropped and rebuilt.
+    """
+    cursor = database.execute_sql(
+        "SELECT i.indisvalid FROM pg_class c JOIN pg_index i ON i.indexrelid = c.oid WHERE c.relname = %s",
+        (name,))
+    row = cursor.fetchone()
+    if row is not None and not row[0]:
+        database.execute_sql(f'DROP INDEX CONCURRENTLY IF EXISTS "{name}"')
+    database.execute_sql(f'CREATE INDEX CONCURRENTLY IF NOT EXISTS "{name}" ON {definition}')
+
+
+def _vote_counters(database: Database):
+    database.execute_sql('ALTER TABLE "polloption" ADD COLUMN IF NOT EXISTS "vote_count" INTEGER NOT NULL DEFAULT 0')
+    database.execute_sql('ALTER TABLE "poll" ADD COLUMN IF NOT EXISTS "total_votes" INTEGER NOT NULL DEFAULT 0')
+    database.execute_sql(
+        'UPDATE "polloption" SET "vote_count" = '
+        '(SELECT COUNT(*) FROM "vote" WHERE "vote"."poll_option_id" = "polloption"."id")')
+    database.execute_sql(
+        'UPDATE "poll" SET "total_votes" = '
+        '(SELECT COUNT(*) FROM "vote" WHERE "vote"."poll_context_id" = "poll"."id")')
+
+
+def _title_search_index(database: Database):
+    _create_index(database, "movie_title_search",
+                  '"movie" USING gin (to_tsvector(\'simple\', "title"))')
+
+
+def _rating_aggregates(database: Database):
+    for table in ("watchedmovie", "usergrouplink"):
+        database.execute_sql(f'ALTER TABLE "{table}" ADD COLUMN IF NOT EXISTS "rating_count" INTEGER NOT NULL DEFAULT 0')
+        database.execute_sql(f'ALTER TABLE "{table}" ADD COLUMN IF NOT EXISTS "rating_sum" BIGINT NOT NULL DEFAULT 0')
+        database.execute_sql(f'ALTER TABLE "{table}" ADD COLUMN IF NOT EXISTS "rating_sumsq" BIGINT NOT NULL DEFAULT 0')
+    database.execute_sql(
+        'UPDATE "watchedmovie" SET "rating_count" = r.n, "rating_sum" = r.s, "rating_sumsq" = r.sq '
+        'FROM (SELECT "watched_movie_entry_id" AS id, COUNT(*) AS n, SUM("rating_value") AS s, '
+        'SUM("rating_value" * "rating_value") AS sq FROM "movierating" GROUP BY 1) AS r '
+        'WHERE "watchedmovie"."id" = r.id')
+    database.execute_sql(
+        'UPDATE "usergrouplink" SET "rating_count" = r.n, "rating_sum" = r.s, "rating_sumsq" = r.sq '
+        'FROM (SELECT mr."rater_id" AS user_id, wm."group_id", COUNT(*) AS n, SUM(mr."rating_value") AS s, '
+        'SUM(mr."rating_value" * mr."rating_value") AS sq FROM "movierating" AS mr '
+        'JOIN "watchedmovie" AS wm ON wm."id" = mr."watched_movie_entry_id" GROUP BY 1, 2) AS r '
+        'WHERE "usergrouplink"."user_id" = r.user_id AND "usergrouplink"."group_id" = r.group_id')
+
+
+def _recommender_columns(database: Database):
+    database.execute_sql('ALTER TABLE "group" ADD COLUMN IF NOT EXISTS "ratings_version" INTEGER NOT NULL DEFAULT 0')
+    database.execute_sql('ALTER TABLE "polloption" ADD COLUMN IF NOT EXISTS "predicted_score" REAL')
+
+
+def _poll_resolution_columns(database: Database):
+    database.execute_sql('ALTER TABLE "poll" ADD COLUMN IF NOT EXISTS "result_snapshot" TEXT')
+    database.execute_sql('ALTER TABLE "poll" ADD COLUMN IF NOT EXISTS "votes_archived_at" TIMESTAMP')
+    database.execute_sql('ALTER TABLE "poll" ADD COLUMN IF NOT EXISTS "version" INTEGER NOT NULL DEFAULT 0')
+    database.execute_sql('ALTER TABLE "group" ADD COLUMN IF NOT EXISTS "version" INTEGER NOT NULL DEFAULT 0')
+    database.execute_sql('ALTER TABLE "user" ADD COLUMN IF NOT EXISTS "groups_version" INTEGER NOT NULL DEFAULT 0')
+
+
+def _poll_expiry_index(database: Database):
+    _create_index(database, "poll_active_expiry", '"poll" ("expires_at") WHERE "is_active" = true')
+
+
+def _hot_path_indexes(database: Database):
+    # Peewee indexes foreign keys on its own, so the first three only exist
+    # here for tables that were created some other way.
+    _create_index(database, "vote_poll_option_id", '"vote" ("poll_option_id")')
+    _create_index(database, "vote_voter_id", '"vote" ("voter_id")')
+    _create_index(database, "usergrouplink_group_id", '"usergrouplink" ("group_id")')
+    _create_index(database, "poll_group_id_is_active", '"poll" ("group_id", "is_active")')
+    _create_index(database, "watchedmovie_group_id_watched_date", '"watchedmovie" ("group_id", "watched_date")')
+
+
+def _catalog_import_jobs(database: Database):
+    database.create_tables([CatalogImportJob], safe=True)
+
+
+def _catalog_import_heartbeat(database: Database):
+    database.execute_sql('ALTER TABLE "catalogimportjob" ADD COLUMN IF NOT EXISTS "heartbeat_at" TIMESTAMP')
+    database.execute_sql('UPDATE "catalogimportjob" SET "heartbeat_at" = COALESCE("finished_at", "started_at") '
+                         'WHERE "heartbeat_at" IS NULL')
+    database.execute_sql('ALTER TABLE "catalogimportjob" ALTER COLUMN "heartbeat_at" SET NOT NULL')
+
+
+# Applied in this order and recorded in the schemamigration table. Never
+# rename or reorder an entry; append new migrations at the end.
+MIGRATIONS = [
+    Migration("0001_vote_counters", _vote_counters),
+    Migration("0002_title_search_index", _title_search_index, atomic=False),
+    Migration("0003_rating_aggregates", _rating_aggregates),
+    Migration("0004_recommender_columns", _recommender_columns),
+    Migration("0005_poll_resolution_columns", _poll_resolution_columns),
+    Migration("0006_poll_expiry_index", _poll_expiry_index, atomic=False),
+    Migration("0007_hot_path_indexes", _hot_path_indexes, atomic=False),
+    Migration("0008_catalog_import_jobs", _catalog_import_jobs),
+    Migration("0009_catalog_import_heartbeat", _catalog_import_heartbeat),
+]
+
+
+def _applied() -> Dict[str, datetime]:
+    if not SchemaMigration.table_exists():
+        return {}
+    return dict(SchemaMigration.select(SchemaMigration.name, SchemaMigration.applied_at).tuples())
+
+
+def _record(name: str):
+    SchemaMigration.insert(name=name).on_conflict_ignore().execute()
+
+
+def schema_ready() -> bool:
+    """
+    Cheap startup probe: whether the newest migration this code knows about
+    has been applied. One indexed lookup, no DDL.
+    """
+    try:
+        return SchemaMigration.select().where(SchemaMigration.name == MIGRATIONS[-1].name).exists()
+    except ProgrammingError:
+        # No schemamigration table yet.
+        return False
+
+
+def migrate() -> List[str]:
+    """
+    Brings the schema up to date and returns the names of the migrations applied.
+    A new database gets every table and index from the models and has all
+    migrations marked as applied; an existing one only gets its missing tables
+    created and its pending migrations run in order.
+    """
+    db.execute_sql("SELECT pg_advisory_lock(%s)", (MIGRATION_LOCK_KEY,))
+    try:
+        fresh = not Poll.table_exists()
+        # Only whole tables here: peewee would also build the models' indexes
+        # on existing tables, without CONCURRENTLY.
+        missing = [model for model in TABLES_TO_CREATE if not model.table_exists()]
+        if missing:
+            db.create_tables(missing, safe=True)
+        if fresh:
+            for migration in MIGRATIONS:
+                _record(migration.name)
+            return []
+
+        applied = _applied()
+        ran = []
+        for migration in MIGRATIONS:
+            if migration.name in applied:
+                continue
+            logger.info("Applying migration %s", migration.name)
+            if migration.atomic:
+                with db.atomic():
+                    migration.apply(db)
+                    _record(migration.name)
+            else:
+                migration.apply(db)
+                _record(migration.name)
+            ran.append(migration.name)
+        return ran
+    finally:
+        db.execute_sql("SELECT pg_advisory_unlock(%s)", (MIGRATION_LOCK_KEY,))
+
+
+def migration_status() -> List[dict]:
+    """
+    Every known migration with the time it was applied, or None while pending.
+    """
+    applied = _applied()
+    return [{"name": migration.name, "applied_at": applied.get(migration.name)} for migration in MIGRATIONS]
+
+
+def _plan_queries() -> Iterator[tuple]:
+    # The lookups behind the busiest endpoints, with placeholder ids.
+    yield "active polls by group", Poll.select(Poll.id).where((Poll.group == 1) & (Poll.is_active == True))
+    yield "options by poll", PollOption.select(PollOption.id).where(PollOption.poll == 1)
+    yield "votes by option", Vote.select(Vote.voter).where(Vote.poll_option == 1)
+    yield "votes by voter", Vote.select(Vote.poll_context).where(Vote.voter == 1)
+    yield "members by group", UserGroupLink.select(UserGroupLink.user).where(UserGroupLink.group == 1)
+    yield "watch history by group", (WatchedMovie
+                                     .select(WatchedMovie.id)
+                                     .where(WatchedMovie.group == 1)
+                                     .order_by(WatchedMovie.watched_date.desc())
+                                     .limit(50))
+    yield "ratings by entry", MovieRating.select(MovieRating.rating_value).where(MovieRating.watched_movie_entry == 1)
+    yield "due polls", (Poll
+                        .select(Poll.id)
+                        .where((Poll.is_active == True) & (Poll.expires_at <= datetime.now()))
+                        .order_by(Poll.expires_at))
+
+
+def _walk(plan: dict) -> Iterator[dict]:
+    yield plan
+    for child in plan.get("Plans", ()):
+        yield from _walk(child)
+
+
+def check_query_plans() -> List[dict]:
+    """
+    EXPLAINs the main lookups and reports, for each, the indexes its plan uses.
+    A lookup is ok when its plan contains no sequential scan. Sequential scans
+    are disabled for the check, since on small tables the planner would rightly
+    prefer them; a plan still holding one has no index to use instead.
+    """
+    results = []
+    with db.atomic():
+        db.execute_sql("SET LOCAL enable_seqscan = off")
+        for name, query in _plan_queries():
+            sql, params = query.sql()
+            (plan,), = db.execute_sql("EXPLAIN (FORMAT JSON) " + sql, params).fetchall()
+            nodes = list(_walk(plan[0]["Plan"]))
+            indexes = sorted({node["Index Name"] for node in nodes if "Index Name" in node})
+            seq_scans = sorted({node["Relation Name"] for node in nodes if node["Node Type"] == "Seq Scan"})
+            results.append({"name": name, "ok": not seq_scans, "indexes": indexes, "seq_scans": seq_scans})
+    return results
+
+
+def main(argv: Optional[List[str]] = None):
+    """
+    Command line entry point: python -m app.db.migrations {migrate,status,check}
+    """
+    parser = argparse.ArgumentParser(description="Apply schema migrations, or check their state.")
+    parser.add_argument("action", nargs="?", choices=["migrate", "status", "check"], default="migrate")
+    args = parser.parse_args(argv)
+
+    with connection_scope():
+        if args.action == "status":
+            for entry in migration_status():
+                print(json.dumps(entry, default=str))
+            return
+        if args.action == "check":
+            results = check_query_plans()
+            for entry in results:
+                print(json.dumps(entry))
+            failed = sum(not entry["ok"] for entry in results)
+            print(f"{failed} queries without an index")
+            raise SystemExit(1 if failed else 0)
+        applied = migrate()
+    for name in applied:
+        print(name)
+    print(f"{len(applied)} applied")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,30 +1,78 @@
+import time
+_import_started = time.perf_counter()
+
+import asyncio
 from typing import Union
 from contextlib import asynccontextmanager
-from fastapi import FastAPI
-from app.db.database import db, init_db
+from fastapi import FastAPI, Request, status
+from fastapi.responses import JSONResponse
+from playhouse.pool import MaxConnectionsExceeded
+from app.db.database import db, init_db, connection_scope, DBConnectionMiddleware, InstrumentedPooledDatabase
+from app.db.migrations import schema_ready
 from app.api.api import api_router
 from app.core.config import settings
+from app.core.security import HashingBusy, shutdown_hashing
+from app.crud import recommender
+from app.crud.poll_expiry import poll_expiry_scheduler
+from app.crud.tmdb_util import tmdb_client
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # on startup
+    startup_started = time.perf_counter()
     print("Connecting to the database...")
-    if db.is_closed():
-        db.connect()
-    init_db()
+    with connection_scope():
+        if settings.DB_BOOTSTRAP_ON_STARTUP:
+            init_db()
+        elif not schema_ready():
+            raise RuntimeError("Database schema is not up to date, run `python -m app.db.bootstrap` first")
 
+    recommender_task = None
+    if settings.RECOMMENDER_ENABLED:
+        recommender_task = asyncio.create_task(recommender.run_periodically(settings.RECOMMENDER_INTERVAL))
+    expiry_task = None
+    if settings.POLL_EXPIRY_ENABLED:
+        expiry_task = asyncio.create_task(poll_expiry_scheduler.run())
+    print(f"Worker ready: imports {(startup_started - _import_started) * 1000:.0f} ms, "
+          f"startup {(time.perf_counter() - startup_started) * 1000:.0f} ms")
 
     yield
     # on shutdown
-    print("Closing database connection...")
-    if not db.is_closed():
+    if recommender_task is not None:
+        recommender_task.cancel()
+    if expiry_task is not None:
+        expiry_task.cancel()
+    print("Closing database connections...")
+    if isinstance(db, InstrumentedPooledDatabase):
+        db.close_all()
+    elif not db.is_closed():
         db.close()
+    shutdown_hashing()
+    await tmdb_client.aclose()
 
 
 app = FastAPI(lifespan=lifespan, title="MovieVotr API")
 
+app.add_middleware(DBConnectionMiddleware)
+
 app.include_router(api_router, prefix=settings.API_URL)
 
+@app.exception_handler(MaxConnectionsExceeded)
+async def pool_exhausted_handler(request: Request, exc: MaxConnectionsExceeded):
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": "Database is busy, please retry"},
+        headers={"Retry-After": "1"},
+    )
+
+@app.exception_handler(HashingBusy)
+async def hashing_busy_handler(request: Request, exc: HashingBusy):
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": "Authentication is busy, please retry"},
+        headers={"Retry-After": "1"},
+    )
+
 @app.get("/")
 def read_root():
     return {"message": "Welcome to the MovieVotr API!"}
@@ -32,4 +80,4 @@ def read_root():
 
 @app.get("/items/{item_id}")
 def read_item(item_id: int, q: Union[str, None] = None):
-    return {"item_id": item_id, "q": q}
\ No newline at end of file
+    return {"item_id": item_id, "q": q}
@@ -7,7 +7,14 @@ from .model import (
     Poll,
     PollOption,
     Vote,
+    VoteArchive,
     WatchedMovie,
     MovieRating,
+    TokenRevocation,
+    UserFactors,
+    MovieFactors,
+    RecommenderState,
+    CatalogImportJob,
+    SchemaMigration,
     TABLES_TO_CREATE
 )
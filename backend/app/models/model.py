@@ -15,6 +15,7 @@ class User(BaseModel):
     email = CharField(unique=True, index=True, max_length=255)
     hashed_password = CharField(max_length=100)
     is_superuser = BooleanField(default=False)
+    groups_version = IntegerField(default=0) # Bumped when the user's group memberships change, for ETags
 
     class Meta:
         table_name = "user"
@@ -27,6 +28,8 @@ class Group(BaseModel):
     name = CharField(unique=True, index=True, max_length=100)
     description = TextField(null=True)
     created_at = DateTimeField(default=datetime.now)
+    ratings_version = IntegerField(default=0) # Bumped by crud_rating on every rating write, for cache keys
+    version = IntegerField(default=0) # Bumped on member, poll and vote writes in the group, for ETags
 
     class Meta:
         table_name = "group"
@@ -39,6 +42,10 @@ class UserGroupLink(BaseModel):
     user = ForeignKeyField(User, backref='group_links', on_delete='CASCADE')
     group = ForeignKeyField(Group, backref='member_links', on_delete='CASCADE')
     joined_at = DateTimeField(default=datetime.now)
+    # Running aggregates of the member's ratings in this group, kept in sync by crud_rating
+    rating_count = IntegerField(default=0)
+    rating_sum = BigIntegerField(default=0)
+    rating_sumsq = BigIntegerField(default=0)
 
     class Meta:
         primary_key = CompositeKey('user', 'group')
@@ -58,6 +65,9 @@ class Movie(BaseModel):
     class Meta:
         table_name = "movie"
 
+# Full-text index over titles, used by crud.movie_search for prefix search.
+Movie.add_index(Movie.index(fn.to_tsvector(SQL("'simple'"), Movie.title), using='gin', name='movie_title_search'))
+
 class Poll(BaseModel):
     """
     Represents a poll created within a group to decide on a movie.
@@ -72,9 +82,19 @@ class Poll(BaseModel):
     is_active = BooleanField(default=True, index=True)
     resolved_at = DateTimeField(null=True)
     winning_poll_option = DeferredForeignKey('PollOption', backref='winning_poll', null=True, on_delete='SET NULL')
+    total_votes = IntegerField(default=0) # Kept in sync with the vote table by crud_poll.cast_vote
+    result_snapshot = TextField(null=True) # Final results as JSON, written once the poll is resolved
+    votes_archived_at = DateTimeField(null=True) # Set when the votes were moved to the vote archive
+    version = IntegerField(default=0) # Bumped on every change to the poll's details, for ETags
 
     class Meta:
         table_name = "poll"
+        indexes = (
+            (('group', 'is_active'), False), # A group's active polls
+        )
+
+# Lets the expiry scheduler find due polls without scanning closed ones
+Poll.add_index(Poll.index(Poll.expires_at, where=(Poll.is_active == True), name='poll_active_expiry'))
 
 class PollOption(BaseModel):
     """
@@ -85,6 +105,8 @@ class PollOption(BaseModel):
     movie_details = ForeignKeyField(Movie, backref='poll_options', on_delete='RESTRICT') # Don't delete movie if it's a poll option
     suggested_by = ForeignKeyField(User, backref='poll_options_suggested', on_delete='RESTRICT')
     suggested_at = DateTimeField(default=datetime.now)
+    vote_count = IntegerField(default=0) # Kept in sync with the vote table by crud_poll.cast_vote
+    predicted_score = FloatField(null=True) # Expected group rating, set by crud.recommender
 
     class Meta:
         table_name = "polloption"
@@ -105,6 +127,20 @@ class Vote(BaseModel):
         primary_key = CompositeKey('poll_context', 'voter')
         table_name = "vote"
 
+class VoteArchive(BaseModel):
+    """
+    Votes of resolved polls, moved out of the vote table once the poll's result
+    snapshot holds the tallies. Written by crud.poll_expiry.archive_votes.
+    """
+    poll_option = ForeignKeyField(PollOption, backref='archived_votes', on_delete='CASCADE')
+    voter = ForeignKeyField(User, backref='archived_votes', on_delete='RESTRICT')
+    poll_context = ForeignKeyField(Poll, backref='archived_votes', on_delete='CASCADE')
+    voted_at = DateTimeField()
+
+    class Meta:
+        primary_key = CompositeKey('poll_context', 'voter')
+        table_name = "votearchive"
+
 class WatchedMovie(BaseModel):
     """
     Records a movie that a group has watched together.
@@ -117,9 +153,16 @@ class WatchedMovie(BaseModel):
     logged_by_user = ForeignKeyField(User, backref='watched_movies_logged', on_delete='RESTRICT')
     notes = TextField(null=True)
     originating_poll = ForeignKeyField(Poll, backref='resulting_watched_movie', null=True, unique=True, on_delete='SET NULL')
+    # Running aggregates of the entry's ratings, kept in sync by crud_rating
+    rating_count = IntegerField(default=0)
+    rating_sum = BigIntegerField(default=0)
+    rating_sumsq = BigIntegerField(default=0)
 
     class Meta:
         table_name = "watchedmovie"
+        indexes = (
+            (('group', 'watched_date'), False), # A group's watch history by date
+        )
 
 class MovieRating(BaseModel):
     """
@@ -134,6 +177,92 @@ class MovieRating(BaseModel):
         primary_key = CompositeKey('watched_movie_entry', 'rater')
         table_name = "movierating"
 
+class TokenRevocation(BaseModel):
+    """
+    Invalidates every access token issued to a user before revoked_at,
+    e.g. after the user is deleted or their privileges change.
+    Not a foreign key, since revocations must outlive deleted users.
+    """
+    id = AutoField()
+    user_id = IntegerField(index=True)
+    revoked_at = DateTimeField(default=datetime.now, index=True)
+
+    class Meta:
+        table_name = "tokenrevocation"
+
+class UserFactors(BaseModel):
+    """
+    A user's learned taste: rating bias and latent factor vector (float32 bytes).
+    Written by the recommender batch job.
+    """
+    user = ForeignKeyField(User, primary_key=True, backref='factors', on_delete='CASCADE')
+    bias = FloatField(default=0.0)
+    factors = BlobField()
+    updated_at = DateTimeField(default=datetime.now)
+
+    class Meta:
+        table_name = "userfactors"
+
+class MovieFactors(BaseModel):
+    """
+    A movie's learned profile across all groups: rating bias (its popularity
+    relative to the global mean) and latent factor vector (float32 bytes).
+    Written by the recommender batch job.
+    """
+    movie = ForeignKeyField(Movie, primary_key=True, backref='factors', on_delete='CASCADE')
+    bias = FloatField(default=0.0)
+    factors = BlobField()
+    updated_at = DateTimeField(default=datetime.now)
+
+    class Meta:
+        table_name = "moviefactors"
+
+class RecommenderState(BaseModel):
+    """
+    Single-row bookkeeping of the recommender model: the global mean rating and
+    the rated_at watermark up to which ratings have been folded in.
+    """
+    id = AutoField()
+    global_mean = FloatField(default=0.0)
+    n_factors = IntegerField()
+    trained_through = DateTimeField(null=True)
+    full_trained_at = DateTimeField(null=True)
+    updated_at = DateTimeField(default=datetime.now)
+
+    class Meta:
+        table_name = "recommenderstate"
+
+class CatalogImportJob(BaseModel):
+    """
+    State and progress of a background catalog import, shared by all workers.
+    """
+    id = CharField(primary_key=True, max_length=32)
+    path = TextField()
+    batch_size = IntegerField()
+    status = CharField(max_length=20, default="pending") # pending, running, finished or failed
+    error = TextField(null=True)
+    lines_read = IntegerField(default=0)
+    invalid_lines = IntegerField(default=0)
+    duplicates = IntegerField(default=0)
+    rows_upserted = IntegerField(default=0)
+    batches = IntegerField(default=0)
+    started_at = DateTimeField(default=datetime.now)
+    heartbeat_at = DateTimeField(default=datetime.now) # Refreshed with every progress update while running
+    finished_at = DateTimeField(null=True, index=True)
+
+    class Meta:
+        table_name = "catalogimportjob"
+
+class SchemaMigration(BaseModel):
+    """
+    Records each schema migration applied to the database, see app.db.migrations.
+    """
+    name = CharField(primary_key=True, max_length=100)
+    applied_at = DateTimeField(default=datetime.now)
+
+    class Meta:
+        table_name = "schemamigration"
+
 TABLES_TO_CREATE = [
     User,
     Group,
@@ -142,7 +271,14 @@ TABLES_TO_CREATE = [
     Poll,
     PollOption,
     Vote,
+    VoteArchive,
     WatchedMovie,
-    MovieRating
+    MovieRating,
+    TokenRevocation,
+    UserFactors,
+    MovieFactors,
+    RecommenderState,
+    CatalogImportJob,
+    SchemaMigration
 ]
 
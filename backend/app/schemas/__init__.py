@@ -1,6 +1,9 @@
 from .group import Group, GroupCreate, GroupBase
-from .movie import Movie, MovieCreate, MovieBase
-from .poll import Poll, PollCreate, PollBase, PollOption, PollOptionCreate, PollOptionBase
+from .movie import Movie, MovieCreate, MovieBatchCreate, MovieBase, MovieSearchHit, MovieSearchResults, CatalogImportRequest
+from .poll import Poll, PollWithCounts, PollDetails, PollOptionDetails, PollCreate, PollBatchCreate, PollBase, PollOption, PollOptionCreate, PollOptionBase
 from .token import Token, TokenData
 from .user import User, UserCreate, UserBase
 from .vote import Vote, VoteCreate
+from .page import Page
+from .stats import GroupStats, MemberStats, WatchedMovieStats, DecadeStats, MemberSimilarity
+from .watched import WatchedMovie, MovieRating, MovieRatingCreate
@@ -1,5 +1,5 @@
-from pydantic import BaseModel
-from typing import Optional
+from pydantic import BaseModel, Field
+from typing import List, Optional
 
 # --- Movie Schemas ---
 
@@ -14,9 +14,30 @@ class MovieCreate(MovieBase):
     """Schema for creating a movie in our catalog."""
     pass
 
+class MovieBatchCreate(BaseModel):
+    """Schema for adding several movies to our catalog at once."""
+    movies: List[MovieCreate] = Field(min_length=1, max_length=100)
+
 class Movie(MovieBase):
     """Schema for returning movie data from our catalog."""
     id: int
 
     class Config:
-        from_attributes = True 
\ No newline at end of file
+        from_attributes = True
+
+class MovieSearchHit(MovieBase):
+    """A search result. id is only set for movies already in our catalog."""
+    id: Optional[int] = None
+
+    class Config:
+        from_attributes = True
+
+class MovieSearchResults(BaseModel):
+    """Search results and where they came from: "catalog" or "tmdb"."""
+    source: str
+    results: List[MovieSearchHit]
+
+class CatalogImportRequest(BaseModel):
+    """Starts a catalog import from a TMDb export file in the server's import directory."""
+    path: str
+    batch_size: int = Field(default=5000, ge=1, le=10000)
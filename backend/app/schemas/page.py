@@ -0,0 +1,12 @@
+from pydantic import BaseModel
+from typing import Generic, List, Optional, TypeVar
+
+T = TypeVar("T")
+
+# --- Pagination Schemas ---
+
+class Page(BaseModel, Generic[T]):
+    """A page of results. Pass next_cursor back as `cursor` to get the following page."""
+    items: List[T]
+    next_cursor: Optional[str] = None
+    estimated_total: Optional[int] = None
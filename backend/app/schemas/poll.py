@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import List, Optional
+from typing import Dict, List, Optional
 from datetime import datetime
 
 # --- Poll Option Schemas ---
@@ -13,6 +13,8 @@ class PollOptionCreate(PollOptionBase):
 class PollOption(PollOptionBase):
     id: int 
     suggested_by_id: int
+    vote_count: int = 0
+    predicted_score: Optional[float] = None
     
     class Config:
         from_attributes = True
@@ -27,12 +29,28 @@ class PollBase(BaseModel):
 class PollCreate(PollBase):
     movie_ids: List[int]
 
+class PollBatchCreate(BaseModel):
+    polls: List[PollCreate] = Field(min_length=1, max_length=50)
+
 class Poll(PollBase):
     id: int
     group_id: int
     creator_id: int
     is_active: bool
+    resolved_at: Optional[datetime] = None
+    winning_poll_option_id: Optional[int] = None
+    total_votes: int = 0
     options: List[PollOption] = []
 
     class Config:
-        from_attributes = True 
\ No newline at end of file
+        from_attributes = True
+
+class PollWithCounts(Poll):
+    vote_counts: Dict[int, int] = {}
+
+class PollOptionDetails(PollOption):
+    title: Optional[str] = None
+
+class PollDetails(PollWithCounts):
+    options: List[PollOptionDetails] = []
+    total_voters: int = 0
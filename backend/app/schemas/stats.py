@@ -0,0 +1,56 @@
+from pydantic import BaseModel
+from typing import List, Optional
+
+# --- Group Stats Schemas ---
+
+class MemberStats(BaseModel):
+    """How a group member rates: average_deviation is relative to the group's mean for each movie."""
+    user_id: int
+    username: str
+    ratings_count: int
+    average_rating: float
+    average_deviation: float
+
+class WatchedMovieStats(BaseModel):
+    """Ratings summary for one watched movie entry."""
+    watched_movie_id: int
+    movie_id: int
+    title: str
+    ratings_count: int
+    mean_rating: Optional[float] = None
+    rating_variance: Optional[float] = None
+
+class DecadeStats(BaseModel):
+    """Watched movies released in one decade, e.g. 1990 for the 1990s."""
+    decade: int
+    watched_count: int
+    average_rating: Optional[float] = None
+
+class GroupStats(BaseModel):
+    """Aggregate numbers over a group's watch history and ratings."""
+    group_id: int
+    watched_count: int
+    ratings_count: int
+    average_rating: Optional[float] = None
+    members: List[MemberStats]
+    movies: List[WatchedMovieStats]
+    most_divisive_movie: Optional[WatchedMovieStats] = None
+    harshest_critic: Optional[MemberStats] = None
+    kindest_critic: Optional[MemberStats] = None
+    decades: List[DecadeStats]
+
+class SimilarityMember(BaseModel):
+    user_id: int
+    username: str
+
+class MemberSimilarity(BaseModel):
+    """
+    Pairwise Pearson correlation of members' ratings over co-rated movies, from -1 to 1.
+    similarity[i][j] is null when members i and j have too few co-rated movies.
+    version changes whenever a rating in the group is written.
+    """
+    group_id: int
+    version: int
+    members: List[SimilarityMember]
+    similarity: List[List[Optional[float]]]
+    co_rated: List[List[int]]
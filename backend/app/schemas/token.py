@@ -10,4 +10,7 @@ class Token(BaseModel):
 
 class TokenData(BaseModel):
     """Schema for the data encoded within the token."""
-    username: Optional[str] = None 
\ No newline at end of file
+    username: Optional[str] = None
+    user_id: Optional[int] = None
+    is_superuser: bool = False
+    issued_at: Optional[float] = None 
\ No newline at end of file
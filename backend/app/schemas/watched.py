@@ -0,0 +1,51 @@
+import math
+from pydantic import BaseModel, Field, computed_field
+from typing import Optional
+from datetime import date, datetime
+from .movie import Movie
+
+# --- Movie Rating Schemas ---
+
+class MovieRatingCreate(BaseModel):
+    """Schema for rating a watched movie."""
+    rating_value: int = Field(ge=1, le=10)
+
+class MovieRating(MovieRatingCreate):
+    """Schema for returning a rating."""
+    watched_movie_entry_id: int
+    rater_id: int
+    rated_at: datetime
+
+    class Config:
+        from_attributes = True
+
+# --- Watched Movie Schemas ---
+
+class WatchedMovie(BaseModel):
+    """A watch history entry. The rating summary is derived from the stored running aggregates."""
+    id: int
+    group_id: int
+    movie_details: Movie
+    watched_date: date
+    logged_by_user_id: int
+    notes: Optional[str] = None
+    originating_poll_id: Optional[int] = None
+    rating_count: int = 0
+    rating_sum: int = 0
+    rating_sumsq: int = 0
+
+    @computed_field
+    @property
+    def mean_rating(self) -> Optional[float]:
+        return self.rating_sum / self.rating_count if self.rating_count else None
+
+    @computed_field
+    @property
+    def rating_stddev(self) -> Optional[float]:
+        if not self.rating_count:
+            return None
+        mean = self.rating_sum / self.rating_count
+        return math.sqrt(max(self.rating_sumsq / self.rating_count - mean * mean, 0.0))
+
+    class Config:
+        from_attributes = True
@@ -1,7 +1,9 @@
 import pytest
 from fastapi.testclient import TestClient
 
-from app.db.database import db
+from app.core.cache import clear_caches
+from app.core.revocation import revocations
+from app.db.database import db, connection_scope, init_db
 from app.main import app
 from app.models.model import TABLES_TO_CREATE
 
@@ -13,9 +15,14 @@ def test_db():
     yield
     db.drop_tables(TABLES_TO_CREATE)
     db.close()
+    revocations.clear()
+    clear_caches()
 
 
 @pytest.fixture(scope="module")
 def client():
+    # Workers expect a bootstrapped database, like after the deployment's pre-start step.
+    with connection_scope():
+        init_db()
     with TestClient(app) as c:
         yield c
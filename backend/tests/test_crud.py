@@ -1,5 +1,26 @@
-from app.crud.crud_user import create_user, get_user_by_username
+import asyncio
+import gzip
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+from peewee import IntegrityError
+
+from app.crud import catalog_import, crud_group, crud_movie, crud_poll, crud_rating, group_stats, movie_search, poll_expiry, recommender
+from app.core.config import settings
+from app.core.security import pwd_context
+from app.crud.crud_user import authenticate_user, create_user, get_user_by_username, get_users
+from app.db.database import connection_scope, db
+from app.models.model import CatalogImportJob, Movie, MovieRating, Poll, RecommenderState, PollOption, Vote, VoteArchive, UserGroupLink, WatchedMovie
+from app.schemas.group import GroupCreate
+from app.schemas.movie import MovieCreate
+from app.schemas.poll import PollCreate
 from app.schemas.user import UserCreate
+from app.schemas.vote import VoteCreate
+from app.schemas.watched import WatchedMovie as WatchedMovieSchema
 
 
 def test_create_and_get_user(test_db):
@@ -12,3 +33,696 @@ def test_create_and_get_user(test_db):
     retrieved_user = get_user_by_username(username=user_in.username)
     assert retrieved_user
     assert retrieved_user.username == user_in.username
+
+
+def _make_poll_with_votes():
+    alice = create_user(UserCreate(username="alice", email="alice@example.com", password="pw"))
+    bob = create_user(UserCreate(username="bob", email="bob@example.com", password="pw"))
+    group = crud_group.create_group(GroupCreate(name="movie night"), creator=alice)
+    crud_group.add_user_to_group(user=bob, group=group)
+    movies = [Movie.create(tmdb_id=str(i), title=f"Movie {i}") for i in range(3)]
+    poll = crud_poll.create_poll(
+        PollCreate(title="Friday", movie_ids=[m.id for m in movies]), group=group, creator=alice
+    )
+    options = sorted(poll.options, key=lambda option: option.id)
+    crud_poll.cast_vote(VoteCreate(poll_option_id=options[0].id), poll=poll, voter=alice)
+    crud_poll.cast_vote(VoteCreate(poll_option_id=options[0].id), poll=poll, voter=bob)
+    return poll, options
+
+
+def test_vote_counts_include_options_without_votes(test_db):
+    poll, options = _make_poll_with_votes()
+
+    assert crud_poll.get_vote_counts_for_poll(poll=poll) == {options[0].id: 2, options[1].id: 0, options[2].id: 0}
+    assert crud_poll.get_vote_counts_for_polls([poll.id, 9999]) == {
+        poll.id: {options[0].id: 2, options[1].id: 0, options[2].id: 0},
+        9999: {},
+    }
+
+
+def test_cast_vote_updates_counters(test_db):
+    poll, options = _make_poll_with_votes()
+
+    poll = crud_poll.get_poll_by_id(poll_id=poll.id)
+    assert poll.total_votes == 2
+    assert crud_poll.get_vote_counts_for_poll(poll=poll) == crud_poll.count_votes_for_polls([poll.id])[poll.id]
+    assert crud_poll.verify_vote_counters() == []
+
+
+def test_rebuild_vote_counters_repairs_drift(test_db):
+    poll, options = _make_poll_with_votes()
+    PollOption.update(vote_count=5).where(PollOption.id == options[1].id).execute()
+    poll_version = crud_poll.get_poll_by_id(poll_id=poll.id).version
+    group_version = crud_group.get_group_by_id(group_id=poll.group_id).version
+
+    assert crud_poll.verify_vote_counters() == [
+        {"poll_id": None, "poll_option_id": options[1].id, "stored": 5, "actual": 0},
+    ]
+    assert len(crud_poll.rebuild_vote_counters()) == 1
+    # Corrected counters are served under new ETags.
+    assert crud_poll.get_poll_by_id(poll_id=poll.id).version == poll_version + 1
+    assert crud_group.get_group_by_id(group_id=poll.group_id).version == group_version + 1
+    assert crud_poll.verify_vote_counters() == []
+    assert crud_poll.get_vote_counts_for_poll(poll=poll)[options[1].id] == 0
+
+
+def test_cast_vote_rejects_duplicates_and_foreign_options(test_db):
+    poll, options = _make_poll_with_votes()
+    alice = get_user_by_username(username="alice")
+    carol = create_user(UserCreate(username="carol", email="carol@example.com", password="pw"))
+
+    with pytest.raises(ValueError, match="already voted"):
+        crud_poll.cast_vote(VoteCreate(poll_option_id=options[1].id), poll=poll, voter=alice)
+    with pytest.raises(ValueError, match="not found in this poll"):
+        crud_poll.cast_vote(VoteCreate(poll_option_id=9999), poll=poll, voter=carol)
+    assert crud_poll.verify_vote_counters() == []
+
+
+def test_change_vote_moves_vote_in_place(test_db):
+    poll, options = _make_poll_with_votes()
+    alice = get_user_by_username(username="alice")
+
+    vote = crud_poll.cast_vote(VoteCreate(poll_option_id=options[2].id), poll=poll, voter=alice, change_vote=True)
+
+    assert vote.poll_option_id == options[2].id
+    assert crud_poll.get_vote_counts_for_poll(poll=poll) == {options[0].id: 1, options[1].id: 0, options[2].id: 1}
+    assert crud_poll.get_poll_by_id(poll_id=poll.id).total_votes == 2
+    assert crud_poll.verify_vote_counters() == []
+
+    again = crud_poll.cast_vote(VoteCreate(poll_option_id=options[2].id), poll=poll, voter=alice, change_vote=True)
+    stored = Vote.get((Vote.poll_context == poll.id) & (Vote.voter == alice.id))
+    assert (again.poll_option_id, again.voted_at) == (options[2].id, stored.voted_at) == (options[2].id, vote.voted_at)
+
+
+def test_change_vote_racing_a_first_vote_keeps_counters_exact(test_db):
+    poll, options = _make_poll_with_votes()
+    carol = create_user(UserCreate(username="carol", email="carol@example.com", password="pw"))
+    first_vote_cast, release = threading.Event(), threading.Event()
+
+    def first_vote():
+        with connection_scope():
+            with db.atomic():
+                crud_poll.cast_vote(VoteCreate(poll_option_id=options[1].id), poll=poll, voter=carol)
+                first_vote_cast.set()
+                release.wait(5)
+
+    def change_vote():
+        with connection_scope():
+            return crud_poll.cast_vote(VoteCreate(poll_option_id=options[2].id), poll=poll, voter=carol,
+                                       change_vote=True)
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        first = pool.submit(first_vote)
+        first_vote_cast.wait(5)
+        # The change starts while the first vote is still uncommitted.
+        changed = pool.submit(change_vote)
+        time.sleep(0.2)
+        release.set()
+        first.result()
+        assert changed.result().poll_option_id == options[2].id
+
+    assert crud_poll.get_vote_counts_for_poll(poll=poll) == {options[0].id: 2, options[1].id: 0, options[2].id: 1}
+    assert crud_poll.get_poll_by_id(poll_id=poll.id).total_votes == 3
+    assert crud_poll.verify_vote_counters() == []
+
+
+def test_cast_vote_rejects_polls_closed_while_waiting(test_db):
+    poll, options = _make_poll_with_votes()
+    carol = create_user(UserCreate(username="carol", email="carol@example.com", password="pw"))
+    locked, release = threading.Event(), threading.Event()
+
+    def resolve():
+        with connection_scope():
+            with db.atomic():
+                Poll.select().where(Poll.id == poll.id).for_update().execute()
+                Poll.update(is_active=False, resolved_at=datetime.now()).where(Poll.id == poll.id).execute()
+                locked.set()
+                release.wait(5)
+
+    def vote():
+        with connection_scope():
+            crud_poll.cast_vote(VoteCreate(poll_option_id=options[1].id), poll=poll, voter=carol)
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        resolving = pool.submit(resolve)
+        locked.wait(5)
+        voting = pool.submit(vote)
+        time.sleep(0.2)
+        release.set()
+        resolving.result()
+        with pytest.raises(ValueError, match="no longer active"):
+            voting.result()
+
+    assert crud_poll.get_poll_by_id(poll_id=poll.id).total_votes == 2
+    assert crud_poll.verify_vote_counters() == []
+
+    Poll.update(is_active=True, expires_at=datetime.now() - timedelta(minutes=1)).where(Poll.id == poll.id).execute()
+    with pytest.raises(ValueError, match="no longer active"):
+        crud_poll.cast_vote(VoteCreate(poll_option_id=options[1].id), poll=poll, voter=carol)
+
+
+def test_membership_cache_is_invalidated_on_join(test_db):
+    poll, options = _make_poll_with_votes()
+    carol = create_user(UserCreate(username="carol", email="carol@example.com", password="pw"))
+    group = poll.group
+    stats = crud_group._membership_cache.stats
+
+    assert crud_group.is_user_member_of_group(user=carol, group=group) is False
+    crud_group.add_user_to_group(user=carol, group=group)
+    assert crud_group.is_user_member_of_group(user=carol, group=group.id) is True
+
+    hits = stats()["hits"]
+    assert crud_group.is_user_member_of_group(user=carol, group=group.id) is True
+    assert stats()["hits"] == hits + 1
+
+
+def test_authenticate_user_rehashes_outdated_hash(test_db):
+    user = create_user(UserCreate(username="alice", email="alice@example.com", password="pw"))
+    weak_hash = pwd_context.handler().using(rounds=4).hash("pw")
+    user.hashed_password = weak_hash
+    user.save()
+
+    assert authenticate_user(username_or_email="alice", password="pw")
+    upgraded = get_user_by_username(username="alice").hashed_password
+    assert upgraded != weak_hash
+    assert not pwd_context.needs_update(upgraded)
+
+
+def test_create_polls_is_all_or_nothing(test_db):
+    alice = create_user(UserCreate(username="alice", email="alice@example.com", password="pw"))
+    group = crud_group.create_group(GroupCreate(name="movie night"), creator=alice)
+    movies = [Movie.create(tmdb_id=str(i), title=f"Movie {i}") for i in range(3)]
+
+    with pytest.raises(ValueError, match="Movie with id 9999 not found"):
+        crud_poll.create_polls(
+            [PollCreate(title="ok", movie_ids=[movies[0].id]), PollCreate(title="bad", movie_ids=[9999])],
+            group=group, creator=alice,
+        )
+    assert crud_poll.get_polls().items == []
+
+    polls = crud_poll.create_polls(
+        [
+            PollCreate(title="Friday", movie_ids=[m.id for m in movies]),
+            PollCreate(title="Saturday", movie_ids=[movies[0].id, movies[0].id]),
+        ],
+        group=group, creator=alice,
+    )
+    assert [poll.title for poll in polls] == ["Friday", "Saturday"]
+    assert [len(poll.options) for poll in polls] == [3, 1]
+    assert [option.movie_details_id for option in polls[1].options] == [movies[0].id]
+
+
+def test_create_polls_holds_its_movies_until_commit(test_db, monkeypatch):
+    alice = create_user(UserCreate(username="alice", email="alice@example.com", password="pw"))
+    group = crud_group.create_group(GroupCreate(name="movie night"), creator=alice)
+    movie = Movie.create(tmdb_id="1", title="Movie 1")
+    pool = ThreadPoolExecutor(max_workers=1)
+    deleting = []
+
+    def delete():
+        with connection_scope():
+            with pytest.raises(IntegrityError):
+                Movie.delete().where(Movie.id == movie.id).execute()
+
+    execute_sql = db.execute_sql
+
+    def delete_between_check_and_insert(sql, *args, **kwargs):
+        if sql == crud_poll._RESERVE_POLL_IDS_SQL:
+            deleting.append(pool.submit(delete))
+            time.sleep(0.2)
+            assert not deleting[0].done()
+        return execute_sql(sql, *args, **kwargs)
+
+    monkeypatch.setattr(db, "execute_sql", delete_between_check_and_insert)
+    poll = crud_poll.create_poll(PollCreate(title="Friday", movie_ids=[movie.id]), group=group, creator=alice)
+    monkeypatch.undo()
+    deleting[0].result()
+    pool.shutdown()
+
+    assert [option.movie_details_id for option in poll.options] == [movie.id]
+    assert Movie.select().count() == 1
+
+
+def test_keyset_pagination_walks_all_rows(test_db):
+    for i in range(5):
+        create_user(UserCreate(username=f"user{i}", email=f"user{i}@example.com", password="pw"))
+
+    seen, cursor = [], None
+    while True:
+        page = get_users(cursor=cursor, limit=2, estimate_total=True)
+        assert len(page.items) <= 2
+        assert page.estimated_total is not None
+        seen.extend(user["username"] for user in page.items)
+        cursor = page.next_cursor
+        if cursor is None:
+            break
+
+    assert seen == [f"user{i}" for i in range(5)]
+    with pytest.raises(ValueError, match="Invalid cursor"):
+        get_users(cursor="not-a-cursor")
+
+
+def _seed_catalog():
+    titles = [("The Matrix", 1999), ("The Matrix Reloaded", 2003), ("Matrix of Leadership", 2010),
+              ("Inception", 2010), ("The Dark Knight", 2008)]
+    return [Movie.create(tmdb_id=str(i), title=title, release_year=year) for i, (title, year) in enumerate(titles)]
+
+
+def test_search_movies_matches_prefixes_and_ranks_title_matches_first(test_db):
+    _seed_catalog()
+
+    assert [m.title for m in movie_search.search_movies("matr")] == [
+        "Matrix of Leadership", "The Matrix", "The Matrix Reloaded"]
+    assert [m.title for m in movie_search.search_movies("the matrix")] == ["The Matrix", "The Matrix Reloaded"]
+    assert [m.title for m in movie_search.search_movies("Matrix", year=2003)] == ["The Matrix Reloaded"]
+    assert [m.title for m in movie_search.search_movies("dark kn")] == ["The Dark Knight"]
+    assert movie_search.search_movies("matrix!!", limit=1)[0].title == "Matrix of Leadership"
+    assert movie_search.search_movies("  ") == []
+    assert movie_search.search_movies("interstellar") == []
+
+
+def test_in_memory_title_index_matches_fulltext_ranking(test_db):
+    movies = _seed_catalog()
+    index = movie_search.MovieTitleIndex(refresh_interval=60)
+    index.load((m.id, m.title, m.release_year) for m in movies[:-1])
+    index.add(movies[-1].id, movies[-1].title, movies[-1].release_year)
+    by_id = {m.id: m.title for m in movies}
+
+    def search(query, **kwargs):
+        return [by_id[i] for i in index.search(movie_search.search_terms(query), **kwargs)]
+
+    for query, kwargs in [("matr", {}), ("the matrix", {}), ("Matrix", {"year": 2003}), ("dark kn", {})]:
+        assert search(query, **kwargs) == [m.title for m in movie_search.search_movies(query, **kwargs)]
+    assert search("interstellar") == []
+
+
+def test_catalog_import_streams_and_upserts_in_batches(test_db, tmp_path):
+    Movie.create(tmdb_id="603", title="Matrix", release_year=1999, poster_url="/poster.jpg")
+    lines = [
+        '{"adult": false, "id": 603, "original_title": "The Matrix", "popularity": 80.1}',
+        '{"adult": false, "id": 604, "original_title": "The Matrix Reloaded"}',
+        'not json',
+        '{"adult": true, "id": 9999, "original_title": "Skipped"}',
+        '{"adult": false, "id": 604, "original_title": "The Matrix Reloaded (2003)"}',
+        '',
+        '{"id": 27205, "title": "Inception", "release_date": "2010-07-15"}',
+        '{"id": 1, "title": "Tab\\there, back\\\\slash"}',
+    ]
+    path = tmp_path / "movie_ids.json.gz"
+    with gzip.open(path, "wt", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+
+    stats = catalog_import.import_catalog_file(str(path), batch_size=2)
+
+    assert stats.as_dict()["rows_upserted"] == 5
+    assert (stats.lines_read, stats.invalid_lines, stats.duplicates, stats.batches) == (8, 2, 0, 3)
+    movies = {m.tmdb_id: m for m in Movie.select()}
+    assert len(movies) == 4
+    assert movies["1"].title == "Tab\there, back\\slash"
+    assert (movies["603"].title, movies["603"].release_year, movies["603"].poster_url) == ("The Matrix", 1999, "/poster.jpg")
+    assert movies["604"].title == "The Matrix Reloaded (2003)"
+    assert movies["27205"].release_year == 2010
+
+    stats = catalog_import.import_catalog(iter(lines), batch_size=10)
+    assert (stats.duplicates, stats.rows_upserted, Movie.select().count()) == (1, 4, 4)
+
+
+def test_catalog_import_jobs_are_tracked_in_the_database(test_db, tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "CATALOG_IMPORT_DIR", str(tmp_path))
+    stale = CatalogImportJob.create(id="old", path="old.json", batch_size=1, status="finished",
+                                    finished_at=datetime.now() - timedelta(days=30))
+    (tmp_path / "movie_ids.json").write_text(
+        "\n".join(f'{{"id": {i}, "original_title": "Movie {i}"}}' for i in range(5)) + "\n")
+
+    job = catalog_import.start_import_job("movie_ids.json", batch_size=2)
+    deadline = time.monotonic() + 10
+    while catalog_import.get_import_job(job["id"])["status"] in ("pending", "running") and time.monotonic() < deadline:
+        time.sleep(0.05)
+
+    # Read back from the table, as any other worker would.
+    job = catalog_import.get_import_job(job["id"])
+    assert (job["status"], job["lines_read"], job["rows_upserted"], job["batches"]) == ("finished", 5, 5, 3)
+    assert job["path"] == str(tmp_path / "movie_ids.json")
+    assert catalog_import.get_import_job(stale.id) is None
+    assert catalog_import.get_import_job("missing") is None
+
+
+def test_catalog_import_jobs_whose_worker_died_are_failed(test_db):
+    last_heartbeat = datetime.now() - timedelta(seconds=settings.CATALOG_IMPORT_HEARTBEAT_TIMEOUT + 60)
+    CatalogImportJob.create(id="dead", path="dead.json", batch_size=1, status="running", lines_read=10,
+                            started_at=last_heartbeat - timedelta(minutes=5), heartbeat_at=last_heartbeat)
+    CatalogImportJob.create(id="alive", path="alive.json", batch_size=1, status="running")
+
+    dead = catalog_import.get_import_job("dead")
+    assert (dead["status"], dead["lines_read"], dead["elapsed_seconds"]) == ("failed", 10, 300)
+    assert dead["error"]
+    assert catalog_import.get_import_job("alive")["status"] == "running"
+
+
+def test_catalog_import_only_reads_the_import_directory(test_db, tmp_path, monkeypatch):
+    import_dir = tmp_path / "imports"
+    import_dir.mkdir()
+    (tmp_path / "secret.json").write_text('{"id": 1, "original_title": "Secret"}\n')
+    (import_dir / "link.json").symlink_to(tmp_path / "secret.json")
+    monkeypatch.setattr(settings, "CATALOG_IMPORT_DIR", str(import_dir))
+
+    for path in ["../secret.json", str(tmp_path / "secret.json"), "link.json", "/etc/passwd"]:
+        with pytest.raises(ValueError, match="inside the import directory"):
+            catalog_import.start_import_job(path)
+    with pytest.raises(ValueError, match="not found"):
+        catalog_import.start_import_job("missing.json")
+    assert CatalogImportJob.select().count() == 0
+
+
+# Throughput floor of the streaming import, in rows per second. Locally a
+# 300k-title export loads at about 30k rows/s; the floor leaves room for slow CI.
+CATALOG_IMPORT_ROWS = 300_000
+CATALOG_IMPORT_MIN_ROWS_PER_SECOND = 5_000
+
+
+def test_catalog_import_throughput(test_db):
+    lines = (f'{{"adult": false, "id": {i}, "original_title": "Movie {i}", "popularity": 1.5}}'
+             for i in range(CATALOG_IMPORT_ROWS))
+
+    stats = catalog_import.import_catalog(lines)
+
+    assert stats.rows_upserted == CATALOG_IMPORT_ROWS == Movie.select().count()
+    assert stats.rows_upserted / stats.elapsed > CATALOG_IMPORT_MIN_ROWS_PER_SECOND, stats.as_dict()
+
+
+def test_create_movie_returns_existing_entry_under_concurrency(test_db):
+    movie_in = MovieCreate(tmdb_id="603", title="The Matrix", release_year=1999)
+    barrier = threading.Barrier(8)
+
+    def add():
+        with connection_scope():
+            barrier.wait()
+            return crud_movie.create_movie(movie_in).id
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        ids = list(pool.map(lambda _: add(), range(8)))
+
+    assert len(set(ids)) == 1
+    assert Movie.select().count() == 1
+    movie = crud_movie.create_movie(MovieCreate(tmdb_id="603", title="Matrix", poster_url="/matrix.jpg"))
+    assert (movie.id, movie.title, movie.release_year, movie.poster_url) == (ids[0], "The Matrix", 1999, "/matrix.jpg")
+
+
+def test_overlapping_movie_batches_do_not_deadlock(test_db):
+    Movie.create(tmdb_id="155", title="The Dark Knight")
+    Movie.create(tmdb_id="603", title="The Matrix")
+    first_locked, release = threading.Event(), threading.Event()
+
+    def first_batch():
+        with connection_scope():
+            with db.atomic():
+                crud_movie.create_movies([MovieCreate(tmdb_id="155", title="The Dark Knight")])
+                first_locked.set()
+                release.wait(5)
+                crud_movie.create_movies([MovieCreate(tmdb_id="603", title="The Matrix")])
+
+    def second_batch():
+        with connection_scope():
+            return crud_movie.create_movies([MovieCreate(tmdb_id="603", title="The Matrix"),
+                                             MovieCreate(tmdb_id="155", title="The Dark Knight")])
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        first = pool.submit(first_batch)
+        first_locked.wait(5)
+        # Given in the other order, the second batch must not lock 603 first.
+        second = pool.submit(second_batch)
+        time.sleep(0.2)
+        release.set()
+        first.result()
+        assert [movie.tmdb_id for movie in second.result()] == ["603", "155"]
+
+    assert Movie.select().count() == 2
+
+
+def test_create_movies_resolves_batch_in_input_order(test_db):
+    existing = Movie.create(tmdb_id="155", title="The Dark Knight")
+    movies_in = [MovieCreate(tmdb_id=tmdb_id, title=f"Movie {tmdb_id}") for tmdb_id in ["603", "155", "27205", "603"]]
+
+    movies = crud_movie.create_movies(movies_in)
+
+    assert [m.tmdb_id for m in movies] == ["603", "155", "27205", "603"]
+    assert movies[1].id == existing.id and movies[1].title == "The Dark Knight"
+    assert movies[0].id == movies[3].id
+    assert Movie.select().count() == 3
+
+
+def test_group_stats_vectorized_aggregates(test_db):
+    alice = create_user(UserCreate(username="alice", email="alice@example.com", password="pw"))
+    bob = create_user(UserCreate(username="bob", email="bob@example.com", password="pw"))
+    group = crud_group.create_group(GroupCreate(name="movie night"), creator=alice)
+    catalog = [("The Matrix", 1999), ("Heat", 1995), ("Inception", 2010), ("Unknown", None)]
+    watched = []
+    for i, (title, year) in enumerate(catalog):
+        movie = Movie.create(tmdb_id=str(i), title=title, release_year=year)
+        watched.append(WatchedMovie.create(movie_details=movie, group=group, logged_by_user=alice))
+    for entry, rater, value in [(0, alice, 9), (0, bob, 7), (1, alice, 10), (1, bob, 2), (2, bob, 6)]:
+        MovieRating.create(watched_movie_entry=watched[entry], rater=rater, rating_value=value)
+
+    stats = group_stats.get_group_stats(group.id)
+
+    assert (stats["watched_count"], stats["ratings_count"], stats["average_rating"]) == (4, 5, 6.8)
+    movies = {m["title"]: m for m in stats["movies"]}
+    assert (movies["Heat"]["mean_rating"], movies["Heat"]["rating_variance"]) == (6.0, 16.0)
+    assert (movies["Unknown"]["ratings_count"], movies["Unknown"]["mean_rating"]) == (0, None)
+    assert stats["most_divisive_movie"]["title"] == "Heat"
+    members = {m["username"]: m for m in stats["members"]}
+    assert members["alice"]["average_rating"] == 9.5
+    assert members["alice"]["average_deviation"] == 2.5
+    assert members["bob"]["average_deviation"] == pytest.approx(-5 / 3)
+    assert (stats["harshest_critic"]["username"], stats["kindest_critic"]["username"]) == ("bob", "alice")
+    assert stats["decades"] == [
+        {"decade": 1990, "watched_count": 2, "average_rating": 7.0},
+        {"decade": 2010, "watched_count": 1, "average_rating": 6.0},
+    ]
+    empty = group_stats.get_group_stats(group.id + 1)
+    assert (empty["watched_count"], empty["members"], empty["most_divisive_movie"]) == (0, [], None)
+
+
+def test_rating_aggregates_follow_inserts_updates_and_deletes(test_db):
+    alice = create_user(UserCreate(username="alice", email="alice@example.com", password="pw"))
+    bob = create_user(UserCreate(username="bob", email="bob@example.com", password="pw"))
+    group = crud_group.create_group(GroupCreate(name="movie night"), creator=alice)
+    crud_group.add_user_to_group(user=bob, group=group)
+    movie = Movie.create(tmdb_id="1", title="Heat")
+    watched = WatchedMovie.create(movie_details=movie, group=group, logged_by_user=alice)
+
+    crud_rating.rate_watched_movie(watched, alice, 8)
+    first = crud_rating.rate_watched_movie(watched, bob, 4)
+    updated = crud_rating.rate_watched_movie(watched, bob, 6)
+    stored = MovieRating.get(watched_movie_entry=watched, rater=bob)
+    assert updated.rated_at == stored.rated_at and updated.rated_at > first.rated_at
+    entry = WatchedMovie.get_by_id(watched.id)
+    assert (entry.rating_count, entry.rating_sum, entry.rating_sumsq) == (2, 14, 100)
+    summary = WatchedMovieSchema.model_validate(entry)
+    assert (summary.mean_rating, summary.rating_stddev) == (7.0, 1.0)
+
+    assert crud_rating.delete_rating(watched, alice).rating_value == 8
+    assert crud_rating.delete_rating(watched, alice) is None
+    entry = WatchedMovie.get_by_id(watched.id)
+    assert (entry.rating_count, entry.rating_sum, entry.rating_sumsq) == (1, 6, 36)
+    link = UserGroupLink.get(user=bob, group=group)
+    assert (link.rating_count, link.rating_sum, link.rating_sumsq) == (1, 6, 36)
+    assert crud_rating.verify_rating_aggregates() == []
+
+    WatchedMovie.update(rating_count=5).execute()
+    UserGroupLink.update(rating_sum=0).where(UserGroupLink.user == bob).execute()
+    mismatches = crud_rating.rebuild_rating_aggregates()
+    assert mismatches == [
+        {"watched_movie_id": watched.id, "group_id": None, "user_id": None, "stored": [5, 6, 36], "actual": [1, 6, 36]},
+        {"watched_movie_id": None, "group_id": group.id, "user_id": bob.id, "stored": [1, 0, 36], "actual": [1, 6, 36]},
+    ]
+    assert crud_rating.verify_rating_aggregates() == []
+
+
+def test_member_similarity_matches_pairwise_pearson_and_tracks_rating_writes(test_db):
+    users = [create_user(UserCreate(username=f"user{i}", email=f"user{i}@example.com", password="pw")) for i in range(4)]
+    group = crud_group.create_group(GroupCreate(name="movie night"), creator=users[0])
+    for user in users[1:]:
+        crud_group.add_user_to_group(user=user, group=group)
+    watched = [WatchedMovie.create(movie_details=Movie.create(tmdb_id=str(i), title=f"Movie {i}"),
+                                   group=group, logged_by_user=users[0]) for i in range(5)]
+    table = {0: [9, 7, 3, 5, None], 1: [8, 6, 2, None, 4], 2: [2, 4, 8, 6, 5], 3: [5, None, None, None, 5]}
+    for user_index, values in table.items():
+        for entry, value in zip(watched, values):
+            if value is not None:
+                crud_rating.rate_watched_movie(entry, users[user_index], value)
+
+    group = crud_group.get_group_by_id(group.id)
+    result = group_stats.get_member_similarity(group)
+
+    assert [m["username"] for m in result["members"]] == ["user0", "user1", "user2", "user3"]
+    for i in range(4):
+        for j in range(4):
+            both = [(a, b) for a, b in zip(table[i], table[j]) if a is not None and b is not None]
+            assert result["co_rated"][i][j] == len(both)
+            xs, ys = np.array([a for a, _ in both], dtype=float), np.array([b for _, b in both], dtype=float)
+            if len(both) < 2 or xs.std() == 0 or ys.std() == 0:
+                assert result["similarity"][i][j] is None
+            else:
+                assert result["similarity"][i][j] == pytest.approx(np.corrcoef(xs, ys)[0, 1], abs=1e-4)
+    assert result["similarity"][0][1] == pytest.approx(1.0)
+    assert result["similarity"][0][2] < 0
+
+    assert group_stats.get_member_similarity(group) is result
+    crud_rating.rate_watched_movie(watched[4], users[0], 1)
+    group = crud_group.get_group_by_id(group.id)
+    updated = group_stats.get_member_similarity(group)
+    assert updated["version"] == result["version"] + 1
+    assert updated["co_rated"][0][1] == 4
+
+
+def test_recommender_scores_poll_options_and_folds_in_new_ratings(test_db):
+    users = [create_user(UserCreate(username=f"user{i}", email=f"user{i}@example.com", password="pw")) for i in range(4)]
+    group = crud_group.create_group(GroupCreate(name="movie night"), creator=users[0])
+    other = crud_group.create_group(GroupCreate(name="other night"), creator=users[3])
+    for user in users[1:3]:
+        crud_group.add_user_to_group(user=user, group=group)
+    movies = [Movie.create(tmdb_id=str(i), title=f"Movie {i}") for i in range(6)]
+    watched = [WatchedMovie.create(movie_details=movie, group=group, logged_by_user=users[0]) for movie in movies]
+    elsewhere = [WatchedMovie.create(movie_details=movie, group=other, logged_by_user=users[3]) for movie in movies]
+    # Movies 0-2 are loved by the group, 3-5 are not; the outsider mostly agrees.
+    for i, user in enumerate(users[:3]):
+        for j, entry in enumerate(watched[:5]):
+            if (i + j) % 4:
+                crud_rating.rate_watched_movie(entry, user, 9 if j < 3 else 3)
+    for j, entry in enumerate(elsewhere):
+        crud_rating.rate_watched_movie(entry, users[3], 8 if j < 3 else 2)
+
+    result = recommender.train()
+    assert result["mode"] == "full" and result["users"] == 4 and result["movies"] == 6
+    # Age the trained ratings out of the overlap window behind the watermark.
+    MovieRating.update(rated_at=MovieRating.rated_at - timedelta(hours=1)).execute()
+
+    poll = crud_poll.create_poll(PollCreate(title="Friday", movie_ids=[m.id for m in movies]), group=group, creator=users[0])
+    scores = {option.movie_details_id: option.predicted_score for option in poll.options}
+    assert min(scores[m.id] for m in movies[:3]) > max(scores[m.id] for m in movies[3:])
+    assert scores[movies[5].id] < 5
+
+    crud_rating.rate_watched_movie(watched[5], users[1], 10)
+    result = recommender.train()
+    assert (result["mode"], result["users"], result["movies"], result["options_rescored"]) == ("incremental", 1, 1, 6)
+    assert PollOption.get(PollOption.poll == poll, PollOption.movie_details == movies[5]).predicted_score > scores[movies[5].id]
+
+    # Stamped before the watermark but committed after the last pass: still folded in.
+    late = crud_rating.rate_watched_movie(watched[4], users[0], 8)
+    MovieRating.update(rated_at=RecommenderState.get().trained_through - timedelta(seconds=1)).where(
+        (MovieRating.watched_movie_entry == late.watched_movie_entry_id) & (MovieRating.rater == users[0].id)).execute()
+    result = recommender.train()
+    assert (result["mode"], result["users"], result["movies"]) == ("incremental", 2, 2)
+
+
+def test_resolve_due_polls_picks_winners_and_breaks_ties(test_db):
+    alice, bob = (create_user(UserCreate(username=name, email=f"{name}@example.com", password="pw")) for name in ("alice", "bob"))
+    group = crud_group.create_group(GroupCreate(name="movie night"), creator=alice)
+    crud_group.add_user_to_group(user=bob, group=group)
+    movies = [Movie.create(tmdb_id=str(i), title=f"Movie {i}") for i in range(2)]
+    past, future = datetime.now() - timedelta(minutes=1), datetime.now() + timedelta(hours=1)
+
+    def make_poll(title, expires_at, picks):
+        poll = crud_poll.create_poll(PollCreate(title=title, expires_at=future, movie_ids=[m.id for m in movies]),
+                                     group=group, creator=alice)
+        options = sorted(poll.options, key=lambda option: option.id)
+        for voter, pick in zip((alice, bob), picks):
+            crud_poll.cast_vote(VoteCreate(poll_option_id=options[pick].id), poll=poll, voter=voter)
+        # Votes are only accepted before the expiry, so move it once they are in.
+        Poll.update(expires_at=expires_at).where(Poll.id == poll.id).execute()
+        return poll, options
+
+    clear, clear_options = make_poll("clear", past, [1, 1])
+    tied, tied_options = make_poll("tied", past, [0, 1])
+    PollOption.update(predicted_score=7.5).where(PollOption.id == tied_options[1].id).execute()
+    empty, _ = make_poll("empty", past, [])
+    later, _ = make_poll("later", future, [0])
+
+    resolved = poll_expiry.resolve_due_polls(tie_break="predicted", create_watched=True, batch_size=2)
+    winners = {entry["poll_id"]: entry["winning_poll_option_id"] for entry in resolved}
+    assert winners == {clear.id: clear_options[1].id, tied.id: tied_options[1].id, empty.id: None}
+    assert poll_expiry.resolve_due_polls() == []
+
+    tied = crud_poll.get_poll_by_id(tied.id)
+    assert not tied.is_active and tied.resolved_at is not None
+    assert crud_poll.get_poll_by_id(later.id).is_active
+    watched = {entry.originating_poll_id: entry.movie_details_id for entry in WatchedMovie.select()}
+    assert watched == {clear.id: movies[1].id, tied.id: movies[1].id}
+
+    tallies = [(1, 2, None), (2, 2, 9.0), (3, 1, 10.0)]
+    assert poll_expiry.pick_winner(5, tallies, "first") == 1
+    assert poll_expiry.pick_winner(5, tallies, "predicted") == 2
+    assert poll_expiry.pick_winner(5, tallies, "none") is None
+    assert poll_expiry.pick_winner(5, tallies, "random") == poll_expiry.pick_winner(5, tallies, "random")
+    assert poll_expiry.pick_winner(5, [(1, 0, None)], "first") is None
+
+
+def test_expiry_scheduler_resolves_polls_when_they_expire(test_db):
+    alice = create_user(UserCreate(username="alice", email="alice@example.com", password="pw"))
+    group = crud_group.create_group(GroupCreate(name="movie night"), creator=alice)
+    movie = Movie.create(tmdb_id="1", title="Movie 1")
+    overdue = crud_poll.create_poll(PollCreate(title="overdue", expires_at=datetime.now(), movie_ids=[movie.id]),
+                                    group=group, creator=alice)
+
+    async def scenario():
+        scheduler = poll_expiry.PollExpiryScheduler(reload_interval=60)
+        task = asyncio.create_task(scheduler.run())
+        await asyncio.sleep(0.2)
+        soon = crud_poll.create_poll(PollCreate(title="soon", expires_at=datetime.now() + timedelta(seconds=0.3),
+                                                movie_ids=[movie.id]), group=group, creator=alice)
+        scheduler.schedule(soon.id, soon.expires_at)
+        for _ in range(50):
+            if scheduler.resolved == 2:
+                break
+            await asyncio.sleep(0.05)
+        task.cancel()
+        return scheduler.stats()
+
+    stats = asyncio.run(scenario())
+    assert stats["resolved"] == 2 and stats["scheduled"] == 0
+    assert Poll.select().where(Poll.is_active == True).count() == 0
+    assert crud_poll.get_poll_by_id(overdue.id).resolved_at is not None
+
+
+def test_archive_votes_keeps_results_of_resolved_polls(test_db):
+    poll, options = _make_poll_with_votes()
+    Poll.update(expires_at=datetime.now()).where(Poll.id == poll.id).execute()
+    poll_expiry.resolve_due_polls()
+    snapshot = crud_poll.get_poll_by_id(poll.id).result_snapshot
+    version = crud_poll.get_poll_by_id(poll.id).version
+
+    assert poll_expiry.archive_votes(resolved_before=datetime.now() - timedelta(days=1)) == 0
+    assert poll_expiry.archive_votes(resolved_before=datetime.now()) == 2
+    assert crud_poll.get_poll_by_id(poll.id).version == version + 1
+    assert Vote.select().count() == 0 and VoteArchive.select().count() == 2
+    assert crud_poll.verify_vote_counters() == []
+    crud_poll.rebuild_vote_counters()
+    poll = crud_poll.get_poll_by_id(poll.id)
+    assert poll.total_votes == 2 and poll.result_snapshot == snapshot
+    assert crud_poll.get_vote_counts_for_poll(poll=poll)[options[0].id] == 2
+
+    Poll.update(result_snapshot=None).where(Poll.id == poll.id).execute()
+    assert poll_expiry.backfill_result_snapshots() == 1
+    assert crud_poll.get_poll_by_id(poll.id).result_snapshot == snapshot
+
+
+def test_poll_lists_are_rows_with_options_in_two_queries(test_db, monkeypatch):
+    poll, options = _make_poll_with_votes()
+    crud_poll.create_poll(PollCreate(title="Saturday", movie_ids=[options[1].movie_details_id]),
+                          group=poll.group, creator=poll.creator)
+    executed = []
+    execute_sql = db.execute_sql
+    monkeypatch.setattr(db, "execute_sql", lambda sql, *args, **kwargs: executed.append(sql) or execute_sql(sql, *args, **kwargs))
+
+    page = crud_poll.get_active_polls_for_group(group=poll.group, limit=1)
+    assert len(executed) == 2
+    [first] = page.items
+    assert first["title"] == "Friday" and first["group_id"] == poll.group_id
+    assert [option["id"] for option in first["options"]] == [option.id for option in options]
+    assert first["vote_counts"] == {str(options[0].id): 2, str(options[1].id): 0, str(options[2].id): 0}
+    second = crud_poll.get_active_polls_for_group(group=poll.group, cursor=page.next_cursor).items
+    assert [row["title"] for row in second] == ["Saturday"] and len(second[0]["options"]) == 1
+
+    assert [group["name"] for group in crud_group.get_groups_for_user(user=poll.creator)] == ["movie night"]
+    assert [row["id"] for row in crud_poll.get_polls().items] == [poll.id, second[0]["id"]]
@@ -0,0 +1,69 @@
+from app.db.database import db, connection_scope, pool_stats
+
+
+def test_connection_scope_returns_connection_to_pool(test_db):
+    with connection_scope():
+        db.execute_sql("SELECT 1")
+        assert not db.is_closed()
+    before = pool_stats()
+
+    with connection_scope():
+        db.execute_sql("SELECT 1")
+    after = pool_stats()
+
+    assert after["checkouts"] == before["checkouts"] + 1
+    assert after["hits"] == before["hits"] + 1
+
+
+def test_connection_scopes_are_isolated(test_db):
+    with connection_scope():
+        db.execute_sql("SELECT 1")
+        outer = db.connection()
+        with connection_scope():
+            assert db.is_closed()
+            db.execute_sql("SELECT 1")
+            assert db.connection() is not outer
+        assert db.connection() is outer
+
+
+def test_migrate_upgrades_a_legacy_schema(test_db):
+    from app.db.migrations import MIGRATIONS, check_query_plans, migrate, migration_status
+    from app.models.model import Group, Movie, Poll, PollOption, SchemaMigration, User, Vote
+
+    user = User.create(username="legacy", email="legacy@example.com", hashed_password="x")
+    group = Group.create(name="legacy")
+    movie = Movie.create(tmdb_id="1", title="Legacy")
+    poll = Poll.create(group=group, creator=user, title="Legacy poll")
+    option = PollOption.create(poll=poll, movie_details=movie, suggested_by=user)
+    Vote.create(poll_option=option, voter=user, poll_context=poll)
+
+    # Roll the schema back to what create_tables produced before the migrations.
+    db.execute_sql('ALTER TABLE "polloption" DROP COLUMN "vote_count", DROP COLUMN "predicted_score"')
+    db.execute_sql('ALTER TABLE "poll" DROP COLUMN "total_votes", DROP COLUMN "version"')
+    db.execute_sql('ALTER TABLE "catalogimportjob" DROP COLUMN "heartbeat_at"')
+    for index in ("poll_group_id_is_active", "watchedmovie_group_id_watched_date", "movie_title_search"):
+        db.execute_sql(f'DROP INDEX "{index}"')
+    SchemaMigration.delete().execute()
+
+    assert migrate() == [migration.name for migration in MIGRATIONS]
+    assert migrate() == []
+    assert all(entry["applied_at"] for entry in migration_status())
+    assert PollOption.get_by_id(option.id).vote_count == 1
+    assert Poll.get_by_id(poll.id).total_votes == 1
+
+    indexes = {name for name, in db.execute_sql("SELECT indexname FROM pg_indexes WHERE schemaname = current_schema()")}
+    assert {"poll_group_id_is_active", "watchedmovie_group_id_watched_date", "movie_title_search"} <= indexes
+    plans = check_query_plans()
+    assert all(entry["ok"] and entry["indexes"] for entry in plans), plans
+
+
+def test_schema_ready_tracks_the_newest_migration(test_db):
+    from app.db.migrations import MIGRATIONS, migrate, schema_ready
+    from app.models.model import SchemaMigration
+
+    assert not schema_ready()
+    migrate()
+    assert schema_ready()
+
+    SchemaMigration.delete().where(SchemaMigration.name == MIGRATIONS[-1].name).execute()
+    assert not schema_ready()
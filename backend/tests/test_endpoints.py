@@ -1,5 +1,15 @@
+import threading
+import time
+from datetime import datetime, timedelta
 from fastapi.testclient import TestClient
+from app.api import etag
+from app.core.cache import SingleFlight
 from app.core.config import settings
+from app.crud import crud_group, crud_poll, crud_user, poll_expiry, tmdb_util
+from app.models.model import Movie
+from app.schemas.group import GroupCreate
+from app.schemas.poll import PollCreate
+from app.schemas.vote import VoteCreate
 
 def test_register_user(client: TestClient, test_db):
     response = client.post(
@@ -97,3 +107,143 @@ def test_get_current_user_no_token(client: TestClient, test_db):
     response = client.get(f"{settings.API_URL}/users/me")
     assert response.status_code == 401
     assert response.json() == {"detail": "Could not validate credentials"}
+
+
+def test_deleted_user_token_is_revoked(client: TestClient, test_db):
+    user_payload = {"username": "testuser", "email": "test@example.com", "password": "testpassword"}
+    token = client.post(f"{settings.API_URL}/register", json=user_payload).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    assert client.get(f"{settings.API_URL}/groups/", headers=headers).status_code == 200
+
+    user = crud_user.get_user_by_username(username=user_payload["username"])
+    crud_user.delete_user(user_id=user.id)
+
+    response = client.get(f"{settings.API_URL}/groups/", headers=headers)
+    assert response.status_code == 401
+
+
+def test_movie_search_falls_back_to_tmdb_on_catalog_miss(client: TestClient, test_db, monkeypatch):
+    stub = tmdb_util.TMDbClient(base_url="https://tmdb.test/3", api_key="key",
+                                transport=tmdb_util.make_stub_transport(tmdb_util.dummy_movies))
+    monkeypatch.setattr(tmdb_util, "tmdb_client", stub)
+    user_payload = {"username": "testuser", "email": "test@example.com", "password": "testpassword"}
+    token = client.post(f"{settings.API_URL}/register", json=user_payload).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    Movie.create(tmdb_id="27205", title="Inception", release_year=2010)
+
+    response = client.get(f"{settings.API_URL}/movies/search?query=incep", headers=headers)
+    assert response.json()["source"] == "catalog"
+    assert [movie["title"] for movie in response.json()["results"]] == ["Inception"]
+
+    response = client.get(f"{settings.API_URL}/movies/search?query=matrix&year=2003", headers=headers)
+    assert response.json() == {"source": "tmdb", "results": [{
+        "id": None, "tmdb_id": "604", "title": "The Matrix Reloaded", "release_year": 2003,
+        "poster_url": f"{settings.TMDB_IMAGE_URL}/9TGHDvWrqKBzwDxDodHYXEmOE6J.jpg",
+    }]}
+
+
+def test_add_movies_to_catalog_batch(client: TestClient, test_db):
+    user_payload = {"username": "testuser", "email": "test@example.com", "password": "testpassword"}
+    token = client.post(f"{settings.API_URL}/register", json=user_payload).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    single = client.post(f"{settings.API_URL}/movies/catalog", json={"tmdb_id": "603", "title": "The Matrix"}, headers=headers)
+
+    response = client.post(f"{settings.API_URL}/movies/catalog/batch", headers=headers, json={"movies": [
+        {"tmdb_id": "604", "title": "The Matrix Reloaded", "release_year": 2003},
+        {"tmdb_id": "603", "title": "The Matrix"},
+    ]})
+
+    assert response.status_code == 201
+    assert [movie["tmdb_id"] for movie in response.json()] == ["604", "603"]
+    assert response.json()[1]["id"] == single.json()["id"]
+    assert client.post(f"{settings.API_URL}/movies/catalog/batch", json={"movies": []}, headers=headers).status_code == 422
+
+
+def test_resolved_poll_is_served_from_its_result_snapshot(client: TestClient, test_db):
+    user_payload = {"username": "testuser", "email": "test@example.com", "password": "testpassword"}
+    token = client.post(f"{settings.API_URL}/register", json=user_payload).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    user = crud_user.get_user_by_username(username="testuser")
+    group = crud_group.create_group(GroupCreate(name="movie night"), creator=user)
+    movies = [Movie.create(tmdb_id="603", title="The Matrix"), Movie.create(tmdb_id="604", title="The Matrix Reloaded")]
+    poll = crud_poll.create_poll(PollCreate(title="Friday", expires_at=datetime.now() + timedelta(hours=1),
+                                            movie_ids=[m.id for m in movies]), group=group, creator=user)
+    option, other = sorted(poll.options, key=lambda option: option.id)
+    crud_poll.cast_vote(VoteCreate(poll_option_id=option.id), poll=poll, voter=user)
+
+    live = client.get(f"{settings.API_URL}/polls/{poll.id}", headers=headers)
+    assert "immutable" not in live.headers.get("cache-control", "")
+
+    poll_expiry.resolve_due_polls(now=datetime.now() + timedelta(hours=2))
+    response = client.get(f"{settings.API_URL}/polls/{poll.id}", headers=headers)
+    assert response.status_code == 200
+    assert response.headers["cache-control"] == "private, max-age=31536000, immutable"
+    data = response.json()
+    assert data["is_active"] is False and data["winning_poll_option_id"] == option.id
+    assert data["vote_counts"] == live.json()["vote_counts"] == {str(option.id): 1, str(other.id): 0}
+    assert [o["title"] for o in data["options"]] == ["The Matrix", "The Matrix Reloaded"]
+    assert data["total_voters"] == 1
+
+
+def test_poll_and_group_reads_answer_conditional_requests(client: TestClient, test_db, monkeypatch):
+    tokens = {}
+    for name in ("alice", "bob"):
+        payload = {"username": name, "email": f"{name}@example.com", "password": "testpassword"}
+        tokens[name] = {"Authorization": f"Bearer {client.post(f'{settings.API_URL}/register', json=payload).json()['access_token']}"}
+    alice, bob = crud_user.get_user_by_username(username="alice"), crud_user.get_user_by_username(username="bob")
+    group = crud_group.create_group(GroupCreate(name="movie night"), creator=alice)
+    movie = Movie.create(tmdb_id="603", title="The Matrix")
+    poll = crud_poll.create_poll(PollCreate(title="Friday", movie_ids=[movie.id]), group=group, creator=alice)
+
+    def revalidate(url, headers):
+        first = client.get(url, headers=headers)
+        assert first.status_code == 200
+        etag = first.headers["etag"]
+        again = client.get(url, headers={**headers, "If-None-Match": etag})
+        assert again.status_code == 304 and again.content == b""
+        return etag
+
+    urls = [f"{settings.API_URL}/polls/{poll.id}", f"{settings.API_URL}/polls/groups/{group.id}/polls",
+            f"{settings.API_URL}/groups/{group.id}", f"{settings.API_URL}/groups/"]
+    before = [revalidate(url, tokens["alice"]) for url in urls]
+    assert client.get(urls[0], headers=tokens["alice"]).json()["vote_counts"] == {str(poll.options[0].id): 0}
+
+    client.post(f"{settings.API_URL}/polls/{poll.id}/vote", json={"poll_option_id": poll.options[0].id}, headers=tokens["alice"])
+    after_vote = [revalidate(url, tokens["alice"]) for url in urls]
+    assert after_vote[0] != before[0] and after_vote[1] != before[1] and after_vote[3] == before[3]
+    assert client.get(urls[0], headers=tokens["alice"]).json()["vote_counts"] == {str(poll.options[0].id): 1}
+
+    # Bob joining changes his group list, not Alice's.
+    bob_groups = revalidate(urls[3], tokens["bob"])
+    client.post(f"{settings.API_URL}/groups/{group.id}/join", headers=tokens["bob"])
+    assert revalidate(urls[3], tokens["bob"]) != bob_groups
+    assert revalidate(urls[3], tokens["alice"]) == after_vote[3]
+    assert client.get(urls[3], headers=tokens["bob"]).json()[0]["name"] == "movie night"
+
+    # A new body format invalidates the tags clients hold for the old one.
+    group_tag = revalidate(urls[2], tokens["alice"])
+    monkeypatch.setitem(etag.FORMAT_REVISIONS, "group", etag.FORMAT_REVISIONS["group"] + 1)
+    assert client.get(urls[2], headers={**tokens["alice"], "If-None-Match": group_tag}).status_code == 200
+
+
+def test_single_flight_collapses_concurrent_calls():
+    flight, calls, results = SingleFlight(), [], []
+    started = threading.Event()
+
+    def slow():
+        calls.append(1)
+        started.set()
+        time.sleep(0.2)
+        return "body"
+
+    def call():
+        results.append(flight.do("key", slow))
+
+    threads = [threading.Thread(target=call) for _ in range(5)]
+    threads[0].start()
+    started.wait()
+    for thread in threads[1:]:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == ["body"] * 5 and len(calls) == 1 and flight.coalesced == 4
@@ -0,0 +1,87 @@
+import asyncio
+
+from fastapi.testclient import TestClient
+
+from app.core.config import settings
+from app.core.live import PollResultsHub
+from app.crud import crud_group, crud_poll, crud_user
+from app.models.model import Movie
+from app.schemas.group import GroupCreate
+from app.schemas.poll import PollCreate
+
+
+def test_hub_coalesces_bursts_and_drops_intermediate_states():
+    async def scenario():
+        hub = PollResultsHub(interval=0.05)
+        subscription = hub.subscribe(1)
+        for count in range(1, 6):
+            hub.publish(1, count, {10: count, 11: 0})
+        first = await asyncio.wait_for(subscription.get(), timeout=1)
+
+        hub.publish(1, 6, {10: 6, 11: 0})
+        await asyncio.sleep(0.1)
+        hub.publish(1, 7, {10: 6, 11: 1})
+        await asyncio.sleep(0.1)
+        merged = await asyncio.wait_for(subscription.get(), timeout=1)
+        subscription.close()
+        return first, merged, subscription.dropped, hub.has_subscribers(1)
+
+    first, merged, dropped, still_subscribed = asyncio.run(scenario())
+
+    assert first == {"poll_id": 1, "vote_counts": {10: 5, 11: 0}, "total_votes": 5}
+    assert merged == {"poll_id": 1, "vote_counts": {10: 6, 11: 1}, "total_votes": 7}
+    assert dropped == 1
+    assert not still_subscribed
+
+
+def test_hub_drops_tallies_older_than_the_staged_or_sent_ones():
+    async def scenario():
+        hub = PollResultsHub(interval=0.05)
+        subscription = hub.subscribe(1)
+        hub.prime(1, 1, {10: 1, 11: 0})
+        # Two votes' reads land in the wrong order.
+        hub.publish(1, 3, {10: 2, 11: 1})
+        hub.publish(1, 2, {10: 2, 11: 0})
+        first = await asyncio.wait_for(subscription.get(), timeout=1)
+
+        # A stale read arriving after the newer tallies were sent is dropped too.
+        hub.publish(1, 2, {10: 2, 11: 0})
+        await asyncio.sleep(0.1)
+        hub.publish(1, 4, {10: 2, 11: 2})
+        second = await asyncio.wait_for(subscription.get(), timeout=1)
+        subscription.close()
+        return first, second, subscription.dropped
+
+    first, second, dropped = asyncio.run(scenario())
+
+    assert first == {"poll_id": 1, "vote_counts": {10: 2, 11: 1}, "total_votes": 3}
+    assert second == {"poll_id": 1, "vote_counts": {11: 2}, "total_votes": 4}
+    assert dropped == 0
+
+
+def test_websocket_receives_vote_deltas(client: TestClient, test_db):
+    user_payload = {"username": "testuser", "email": "test@example.com", "password": "testpassword"}
+    token = client.post(f"{settings.API_URL}/register", json=user_payload).json()["access_token"]
+    user = crud_user.get_user_by_username(username="testuser")
+    group = crud_group.create_group(GroupCreate(name="movie night"), creator=user)
+    movies = [Movie.create(tmdb_id=str(i), title=f"Movie {i}") for i in range(2)]
+    poll = crud_poll.create_poll(PollCreate(title="Friday", movie_ids=[m.id for m in movies]), group=group, creator=user)
+    option_ids = sorted(option.id for option in poll.options)
+
+    with client.websocket_connect(f"{settings.API_URL}/polls/{poll.id}/live?token={token}") as websocket:
+        snapshot = websocket.receive_json()
+        assert snapshot == {
+            "poll_id": poll.id,
+            "vote_counts": {str(option_id): 0 for option_id in option_ids},
+            "total_votes": 0,
+        }
+
+        response = client.post(
+            f"{settings.API_URL}/polls/{poll.id}/vote",
+            json={"poll_option_id": option_ids[1]},
+            headers={"Authorization": f"Bearer {token}"},
+        )
+        assert response.status_code == 200
+
+        delta = websocket.receive_json()
+        assert delta == {"poll_id": poll.id, "vote_counts": {str(option_ids[1]): 1}, "total_votes": 1}
@@ -1,6 +1,13 @@
+import time
+from datetime import datetime, timedelta
+
 import jwt
+import pytest
+from app.core import security
 from app.core.config import settings
-from app.core.security import create_access_token, get_password_hash, verify_password
+from app.core.revocation import RevocationList
+from app.core.security import create_access_token, create_access_token_for_user, get_password_hash, verify_password
+from app.models.model import User
 
 def test_password_hashing_and_verification():
     """
@@ -26,3 +33,49 @@ def test_create_access_token():
     decoded_token = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
 
     assert decoded_token["sub"] == user_data["sub"]
+
+
+def test_create_access_token_for_user_carries_claims():
+    """
+    Tests that user tokens carry the id and superuser claims used by the auth fast path.
+    """
+    user = User(id=7, username="testuser", is_superuser=True)
+    token = create_access_token_for_user(user)
+
+    decoded_token = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+
+    assert decoded_token["sub"] == "testuser"
+    assert decoded_token["uid"] == 7
+    assert decoded_token["su"] is True
+
+
+def test_hashing_fails_fast_when_queue_is_full():
+    """
+    Tests that callers get HashingBusy instead of queueing once every hashing slot is taken.
+    """
+    acquired = 0
+    while security._hash_slots.acquire(blocking=False):
+        acquired += 1
+    try:
+        with pytest.raises(security.HashingBusy):
+            get_password_hash("mysecretpassword")
+    finally:
+        for _ in range(acquired):
+            security._hash_slots.release()
+
+
+def test_token_issued_right_after_a_revocation_is_accepted():
+    """
+    Tests that revocation compares at sub-second resolution, so a re-login in the
+    same second as the revocation yields a valid token.
+    """
+    revocations = RevocationList(refresh_interval=3600, max_age=timedelta(minutes=30))
+    revocations._refreshed_at = time.monotonic()
+    user = User(id=7, username="testuser", is_superuser=False)
+
+    before = jwt.decode(create_access_token_for_user(user), settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+    revocations.revoke(user.id, datetime.now())
+    after = jwt.decode(create_access_token_for_user(user), settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+
+    assert revocations.is_revoked(user.id, before["iat"])
+    assert not revocations.is_revoked(user.id, after["iat"])
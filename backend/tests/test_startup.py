@@ -0,0 +1,55 @@
+import json
+import subprocess
+import sys
+
+from app.db.database import connection_scope, init_db
+
+# Startup budget of one worker, in seconds. Imports are dominated by FastAPI
+# and pydantic building the route models; the rest should stay small since
+# workers no longer run DDL or hash the admin password.
+IMPORT_BUDGET = 3.0
+STARTUP_BUDGET = 0.25
+FIRST_REQUEST_BUDGET = 0.25
+
+_BENCHMARK = """
+import json, time
+started = time.perf_counter()
+from app.main import app
+imported = time.perf_counter()
+
+from fastapi.testclient import TestClient
+from app.core.config import settings
+from app.core.security import create_access_token_for_user
+from app.models.model import User
+
+client = TestClient(app)
+client_ready = time.perf_counter()
+with client:
+    ready = time.perf_counter()
+    admin = User.get(User.username == settings.ADMIN_USERNAME)
+    headers = {"Authorization": f"Bearer {create_access_token_for_user(admin)}"}
+    request_started = time.perf_counter()
+    response = client.get(settings.API_URL + "/users/me", headers=headers)
+    done = time.perf_counter()
+print(json.dumps({
+    "status": response.status_code,
+    "imports": imported - started,
+    "startup": ready - client_ready,
+    "first_request": done - request_started,
+}))
+"""
+
+
+def test_worker_startup_stays_within_budget(test_db):
+    # The deployment's pre-start step; workers only probe the schema.
+    with connection_scope():
+        init_db()
+
+    result = subprocess.run([sys.executable, "-c", _BENCHMARK], capture_output=True, text=True, timeout=60)
+    assert result.returncode == 0, result.stderr
+    timings = json.loads(result.stdout.strip().splitlines()[-1])
+
+    assert timings["status"] == 200
+    assert timings["imports"] < IMPORT_BUDGET, timings
+    assert timings["startup"] < STARTUP_BUDGET, timings
+    assert timings["first_request"] < FIRST_REQUEST_BUDGET, timings
@@ -0,0 +1,72 @@
+import asyncio
+
+import httpx
+
+from app.core.cache import cache_stats, clear_caches
+from app.crud import tmdb_util
+from app.crud.tmdb_util import TMDbClient, TMDbError, dummy_movies, make_stub_transport
+
+
+def _counting_client(delay: float = 0.0, status_code: int = 200):
+    calls = []
+    stub = make_stub_transport(dummy_movies)
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request.url.params["query"])
+        await asyncio.sleep(delay)
+        if status_code != 200:
+            return httpx.Response(status_code, json={"status_message": "error"})
+        return stub.handler(request)
+
+    client = TMDbClient(base_url="https://tmdb.test/3", api_key="key",
+                        transport=httpx.MockTransport(handler), cache_ttl=60, cache_size=16)
+    return client, calls
+
+
+def test_concurrent_identical_searches_share_one_request():
+    async def scenario():
+        client, calls = _counting_client(delay=0.05)
+        results = await asyncio.gather(*(client.search_movies(q) for q in ["matrix", "Matrix", "  the  MATRIX"]))
+        again = await client.search_movies("MATRIX")
+        await client.aclose()
+        return client, calls, results, again
+
+    client, calls, results, again = asyncio.run(scenario())
+
+    assert calls == ["matrix", "the matrix"]
+    assert [movie["id"] for movie in results[0]] == [603, 604]
+    assert results[0] == results[1] == results[2] == again
+    stats = client.stats()
+    assert stats["upstream_requests"] == 2
+    assert stats["coalesced_requests"] == 1
+    assert stats["cache"]["hits"] == 1
+
+
+def test_errors_are_not_cached():
+    async def scenario():
+        client, calls = _counting_client(status_code=429)
+        errors = []
+        for _ in range(2):
+            try:
+                await client.search_movies("inception")
+            except TMDbError as e:
+                errors.append(e.status_code)
+        await client.aclose()
+        return calls, errors
+
+    calls, errors = asyncio.run(scenario())
+
+    assert errors == [429, 429]
+    assert len(calls) == 2
+
+
+def test_only_the_module_client_registers_its_cache():
+    tmdb_util.tmdb_client._cache.set(("matrix", 1), [])
+    client, _ = _counting_client()
+    client._cache.set(("inception", 1), [])
+
+    assert cache_stats()["tmdb_search"] == tmdb_util.tmdb_client._cache.stats()
+    assert cache_stats()["tmdb_search"]["size"] == 1
+    clear_caches()
+    assert tmdb_util.tmdb_client._cache.stats()["size"] == 0
+    assert client._cache.stats()["size"] == 1